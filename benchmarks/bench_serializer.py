@@ -0,0 +1,67 @@
+"""Compares encode throughput of the serializers for typical log documents.
+
+$ python benchmarks/bench_serializer.py -n 10000 -d 100
+"""
+import argparse
+import datetime
+import os
+import random
+import string
+import sys
+from time import perf_counter
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simplog.serializer import JSONSerializer, OrjsonSerializer, orjson    # noqa: E402
+
+_candidates = string.ascii_lowercase + string.digits
+
+
+def generate_documents(n, data_len):
+    now = datetime.datetime.utcnow()
+    return [
+        {
+            '_id': ObjectId(),
+            'type': 'sample',
+            'host': f'host-{i % 16}',
+            'level': random.choice(['DEBUG', 'INFO', 'WARN', 'ERROR']),
+            'created': now + datetime.timedelta(seconds=i),
+            'data': ''.join(random.choices(_candidates, k=data_len)),
+            'timestamp': int(now.timestamp()) + i,
+            'elapsed': random.random(),
+        } for i in range(n)
+    ]
+
+
+def measure(serializer, documents, repeat):
+    best, size = None, 0
+    for _ in range(repeat):
+        start = perf_counter()
+        size = sum(len(serializer.dumps(doc)) for doc in documents)    # documents are encoded one by one in GET
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare encode throughput of serializers.')
+    parser.add_argument('-n', dest='num', type=int, default=10000, help='number of documents')
+    parser.add_argument('-d', dest='data_len', type=int, default=100, help='auto-generated data length in document')
+    parser.add_argument('-r', dest='repeat', type=int, default=5, help='number of repeats, the best one is reported')
+    args = parser.parse_args()
+
+    documents = generate_documents(args.num, args.data_len)
+    serializers = [JSONSerializer()]
+    if orjson is not None:
+        serializers.append(OrjsonSerializer())
+    else:
+        print('orjson is not installed, only json is measured')
+
+    print(f'{"serializer":<10} {"docs/s":>12} {"MB/s":>10} {"bytes/doc":>10}')
+    for serializer in serializers:
+        elapsed, size = measure(serializer, documents, args.repeat)
+        print(
+            f'{serializer.name:<10} {args.num / elapsed:>12,.0f} {size / elapsed / 1e6:>10.1f} {size / args.num:>10.1f}'
+        )
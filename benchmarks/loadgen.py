@@ -0,0 +1,289 @@
+"""Load generator and benchmark of the ingest(POST) and query(GET) paths.
+
+Concurrent clients send requests for `-t` seconds at each point of the sweep:
+- ingest: batch size(-b) x data length(-d) x concurrency(-c)
+- query: selectivity(-s, the ratio of matched logs) x data length(-d) x concurrency(-c)
+and req/s, docs/s, latency percentiles and server RSS of each point are reported.
+
+Start a server with an in-memory database(mongomock) and run the sweep:
+$ python benchmarks/loadgen.py --spawn mongomock -b 1,10,100 -c 1,8,32 -s 0.001,0.01,0.1 -o results.jsonl
+Start a server with a local mongod:
+$ python benchmarks/loadgen.py --spawn 127.0.0.1:27017
+Use a running server(server RSS is reported with --server-pid):
+$ python benchmarks/loadgen.py --url http://localhost:8080 --server-pid 1234
+
+Each point is appended to the output file(-o) as a JSON line with the commit and time of the run,
+to compare the results between versions.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from twisted.internet import defer, task
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers
+
+_root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+_candidates = string.ascii_lowercase + string.digits
+_selectivity_steps = 1000
+_json_headers = Headers({b'Content-Type': [b'application/json']})
+
+
+def generate_logs(n, data_len, start=0):
+    basetime = int(time.time())
+    now = datetime.fromtimestamp(basetime)
+    return [
+        {
+            'type': 'bench',
+            'created': datetime.strftime(now + timedelta(seconds=i), '%Y-%m-%dT%H:%M:%S'),
+            'data': ''.join(random.choices(_candidates, k=data_len)),
+            'timestamp': basetime + i,
+            'sel': (i % _selectivity_steps) / _selectivity_steps,    # sel < s matches s of logs
+        } for i in range(start, start + n)
+    ]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=_root_dir, stderr=subprocess.DEVNULL,
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_rss_mb(pid):
+    if pid is None:
+        return None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1024 / 1024
+    except (ImportError, Exception):
+        return None
+
+
+class ServerProcess:
+    """Server started by the benchmark: `mongomock` or mongodb host."""
+    def __init__(self, database, server_args):
+        self.port = free_port()
+        if database == 'mongomock':
+            command = [sys.executable, '-u', os.path.join(_root_dir, 'benchmarks', 'mock_server.py')]
+        else:
+            command = [sys.executable, '-u', '-m', 'simplog.apiserver', '--mongo-host', database]
+        env = dict(os.environ, PYTHONPATH=_root_dir)
+        self.process = subprocess.Popen(command + ['-p', str(self.port)] + server_args, env=env)
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def wait_until_listening(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited: {self.process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1.0).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('server did not start')
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(10)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    def __init__(self, reactor, url, server_pid=None, duration=5.0):
+        self.url = url.rstrip('/')
+        self.server_pid = server_pid
+        self.duration = duration
+        self.pool = HTTPConnectionPool(reactor)
+        self.pool.maxPersistentPerHost = 1024
+        self.agent = Agent(reactor, pool=self.pool)
+
+    @defer.inlineCallbacks
+    def request(self, method, path, body=None):
+        producer = FileBodyProducer(BytesIO(body)) if body is not None else None
+        response = yield self.agent.request(
+            method, f'{self.url}{path}'.encode('utf-8'), _json_headers if body is not None else None, producer,
+        )
+        yield readBody(response)
+        return response.code
+
+    @defer.inlineCallbacks
+    def run(self, concurrency, make_request):
+        """Runs `concurrency` clients which send `make_request()`(method, path, body, docs) for `duration`."""
+        latencies, counts = [], {'docs': 0, 'errors': 0}
+        deadline = time.monotonic() + self.duration
+
+        @defer.inlineCallbacks
+        def client():
+            while time.monotonic() < deadline:
+                method, path, body, docs = make_request()
+                started = time.perf_counter()
+                try:
+                    code = yield self.request(method, path, body)
+                except Exception:
+                    code = None
+                latencies.append(time.perf_counter() - started)
+                if code == 200:
+                    counts['docs'] += docs
+                else:
+                    counts['errors'] += 1
+
+        started = time.monotonic()
+        yield defer.DeferredList([client() for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': counts['errors'],
+            'duration': round(elapsed, 3),
+            'req_per_s': round(len(latencies) / elapsed, 1),
+            'docs_per_s': round(counts['docs'] / elapsed, 1),
+            'latency_ms': {
+                name: round(percentile(latencies, p) * 1000, 3) if latencies else None
+                for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))
+            },
+            'server_rss_mb': process_rss_mb(self.server_pid),
+        }
+
+    def ingest(self, group_name, batch_size, data_len, concurrency):
+        def make_request():
+            body = json.dumps(generate_logs(batch_size, data_len)).encode('utf-8')
+            return b'POST', f'/groups/{group_name}', body, batch_size
+        return self.run(concurrency, make_request)
+
+    @defer.inlineCallbacks
+    def preload(self, group_name, num_logs, data_len, batch_size=1000):
+        for start in range(0, num_logs, batch_size):
+            body = json.dumps(generate_logs(min(batch_size, num_logs - start), data_len, start)).encode('utf-8')
+            code = yield self.request(b'POST', f'/groups/{group_name}', body)
+            if code != 200:
+                raise RuntimeError(f'failed to preload logs: {code}')
+
+    def query(self, group_name, num_logs, selectivity, concurrency):
+        upper = max(1, int(selectivity * _selectivity_steps))
+        docs = num_logs // _selectivity_steps * upper + min(num_logs % _selectivity_steps, upper)
+        path = f'/groups/{group_name}?sel:float=[0:{upper / _selectivity_steps}]'
+
+        def make_request():
+            return b'GET', path, None, docs
+        return self.run(concurrency, make_request)
+
+
+def parse_list(value_type):
+    def parse(value):
+        return [value_type(v) for v in value.split(',') if v]
+    return parse
+
+
+@defer.inlineCallbacks
+def sweep(reactor, args, url, server_pid):
+    generator = LoadGenerator(reactor, url, server_pid=server_pid, duration=args.duration)
+    run_info = {'commit': git_commit(), 'time': datetime.now().isoformat(timespec='seconds')}
+    output = open(args.output, 'a', encoding='utf-8') if args.output else None
+    print(f'{"scenario":<8} {"batch":>6} {"data":>6} {"conc":>5} {"sel":>7} {"req/s":>9} {"docs/s":>11} '
+          f'{"p50ms":>8} {"p95ms":>8} {"p99ms":>8} {"rss_mb":>8} {"errors":>6}')
+
+    def report(point, result):
+        record = dict(run_info, **point, **result)
+        latency = result['latency_ms']
+        rss = result['server_rss_mb']
+        print(f'{point["scenario"]:<8} {point.get("batch_size", "-"):>6} {point["data_len"]:>6} '
+              f'{point["concurrency"]:>5} {point.get("selectivity", "-"):>7} {result["req_per_s"]:>9,.1f} '
+              f'{result["docs_per_s"]:>11,.1f} {latency["p50"] or 0:>8.2f} {latency["p95"] or 0:>8.2f} '
+              f'{latency["p99"] or 0:>8.2f} {rss if rss is not None else 0:>8.1f} {result["errors"]:>6}')
+        if output is not None:
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+
+    try:
+        if 'ingest' in args.scenarios:
+            for data_len in args.data_lens:
+                for batch_size in args.batch_sizes:
+                    for concurrency in args.concurrency:
+                        result = yield generator.ingest('bench_ingest', batch_size, data_len, concurrency)
+                        report(dict(scenario='ingest', batch_size=batch_size, data_len=data_len,
+                                    concurrency=concurrency), result)
+        if 'query' in args.scenarios:
+            for data_len in args.data_lens:
+                group_name = f'bench_query_{data_len}_{int(time.time())}'
+                yield generator.preload(group_name, args.query_logs, data_len)
+                for selectivity in args.selectivity:
+                    for concurrency in args.concurrency:
+                        result = yield generator.query(group_name, args.query_logs, selectivity, concurrency)
+                        report(dict(scenario='query', data_len=data_len, concurrency=concurrency,
+                                    selectivity=selectivity), result)
+    finally:
+        if output is not None:
+            output.close()
+        yield generator.pool.closeCachedConnections()
+
+
+def main(reactor, argv):
+    parser = argparse.ArgumentParser(description='Benchmark ingest and query throughput of the log server.')
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument('--url', type=str, default=None, help='URL of a running server')
+    target_group.add_argument('--spawn', type=str, default='mongomock', metavar='DATABASE',
+                              help='start a server with the database: mongomock or mongodb host address')
+    parser.add_argument('--server-pid', type=int, default=None, help='pid of the running server to report RSS')
+    parser.add_argument('--server-args', type=str, default='', help='other options of the started server')
+    parser.add_argument('--scenarios', type=parse_list(str), default=['ingest', 'query'], help='ingest,query')
+    parser.add_argument('-b', dest='batch_sizes', type=parse_list(int), default=[1, 10, 100],
+                        help='logs in a POST request')
+    parser.add_argument('-d', dest='data_lens', type=parse_list(int), default=[100], help='data length in log dict')
+    parser.add_argument('-c', dest='concurrency', type=parse_list(int), default=[1, 8], help='concurrent clients')
+    parser.add_argument('-s', dest='selectivity', type=parse_list(float), default=[0.001, 0.01, 0.1],
+                        help='ratio of logs matched by a GET request')
+    parser.add_argument('-n', dest='query_logs', type=int, default=10000, help='number of logs to query')
+    parser.add_argument('-t', dest='duration', type=float, default=5.0, help='seconds to run each point')
+    parser.add_argument('-o', dest='output', type=str, default=None, help='JSON lines file to append results')
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url is not None:
+        url, server_pid = args.url, args.server_pid
+    else:
+        server = ServerProcess(args.spawn, args.server_args.split())
+        server.wait_until_listening()
+        url, server_pid = server.url, server.pid
+    d = sweep(reactor, args, url, server_pid)
+    if server is not None:
+        d.addBoth(lambda result: server.stop() or result)
+    return d
+
+
+if __name__ == '__main__':
+    task.react(main, (sys.argv[1:],))
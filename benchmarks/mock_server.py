@@ -0,0 +1,20 @@
+"""Runs the server with an in-memory database(mongomock), for benchmarks without mongod.
+
+$ python benchmarks/mock_server.py -p 8080 [other options of apiserver.py]
+"""
+import os
+import sys
+
+import mongomock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simplog.apiserver import parse_args, run_server     # noqa: E402
+
+if __name__ == '__main__':
+    # mongomock is not safe for concurrent writes, so one database call at a time by default
+    args = parse_args(['--db-workers', '1'] + sys.argv[1:])
+    if args.workers > 1:
+        sys.exit('mock server can not run multiple workers, the database is in the memory of a process')
+    print('simplog > use in-memory database(mongomock)...')
+    run_server(args, connection=mongomock.MongoClient())
@@ -4,8 +4,9 @@ from datetime import datetime, timedelta
 from time import time
 from pprint import pprint
 import argparse
+import asyncio
 
-import requests
+from simplog_client import LogBatcher, SimplogClient, SimplogError
 
 _candidates = string.ascii_lowercase + string.digits
 
@@ -23,22 +24,47 @@ def generate_logs(n, date_len, key, value):
     ]
 
 
-def post_logs(group_name, logs, host='localhost', port=8080):
-    if not isinstance(logs, list):
-        raise TypeError(f'logs should be list: {repr(logs)}')
-    for log in logs:
-        if not isinstance(log, dict):
-            raise TypeError(f'log should be dict: {repr(log)}')
+def on_error(group_name, logs, error):
+    print(f'failed to post {len(logs)} logs: {error}')
 
-    url = f'http://{host}:{port}/groups/{group_name}'
-    resp = requests.post(url=url, json=logs)
-    return resp.status_code, resp.json()
 
+def run(url, group_name, logs, query, batch_size):
+    with SimplogClient(url) as client:
+        # POST sample logs in batches from a background thread
+        with LogBatcher(client, batch_size=batch_size, on_error=on_error) as batcher:
+            for log in logs:
+                batcher.log(group_name, log)
+        print(f'post logs result --- sent={batcher.sent}, failed={batcher.failed}')
 
-def get_key_value_matched_logs(group_name, key, value, host='localhost', port=8080):
-    url = f'http://{host}:{port}/groups/{group_name}?{key}={value}'
-    resp = requests.get(url=url)
-    return resp.status_code, resp.json()
+        # GET sample logs page by page
+        print('get logs result ---')
+        for log in client.iter_logs(group_name, query, page_size=batch_size):
+            pprint(log)
+
+        # GET the number of sample logs
+        try:
+            print(f'- total count={client.count(group_name, query)}')
+        except SimplogError as e:
+            print(f'- total count is not available: {e}')
+
+
+async def run_async(url, group_name, logs, query, batch_size):
+    from simplog_client.aio import AsyncLogBatcher, AsyncSimplogClient
+
+    async with AsyncSimplogClient(url) as client:
+        async with AsyncLogBatcher(client, batch_size=batch_size, on_error=on_error) as batcher:
+            for log in logs:
+                await batcher.log(group_name, log)
+        print(f'post logs result --- sent={batcher.sent}, failed={batcher.failed}')
+
+        print('get logs result ---')
+        async for log in client.iter_logs(group_name, query, page_size=batch_size):
+            pprint(log)
+
+        try:
+            print(f'- total count={await client.count(group_name, query)}')
+        except SimplogError as e:
+            print(f'- total count is not available: {e}')
 
 
 if __name__ == '__main__':
@@ -59,28 +85,14 @@ if __name__ == '__main__':
     n_group.add_argument('-d', dest='data_len', type=int, default=100, help='auto-generated data length in log dict')
     n_group.add_argument('-n', dest='num', type=int, default=1, help='number of generated logs')
 
-    args = parser.parse_args()
+    parser.add_argument('-b', dest='batch_size', type=int, default=500, help='number of logs posted at once')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='use the asyncio client')
 
-    # POST sample logs
-    status_code, result = post_logs(
-        group_name=args.group_name,
-        logs=generate_logs(args.num, date_len=args.data_len, key=args.k, value=args.v),
-        host=args.host, port=args.port,
-    )
-    if status_code != 200:
-        print(f'failed to post logs({status_code}): {result}')
-        exit(1)
-    print('post logs result ---')
-    pprint(result)
-    print()
-
-    # GET sample logs
-    status_code, result = get_key_value_matched_logs(
-        group_name=args.group_name, key=args.k, value=args.v, host=args.host, port=args.port,
-    )
-    if status_code != 200:
-        print(f'failed to get logs({status_code}): {result}')
-        exit(1)
-    print(f'get logs result ---')
-    pprint(result)
-    print(f'- total count={len(result["logs"])}')
+    args = parser.parse_args()
+    url = f'http://{args.host}:{args.port}'
+    logs = generate_logs(args.num, date_len=args.data_len, key=args.k, value=args.v)
+    query = {args.k: args.v}
+    if args.use_async:
+        asyncio.get_event_loop().run_until_complete(run_async(url, args.group_name, logs, query, args.batch_size))
+    else:
+        run(url, args.group_name, logs, query, args.batch_size)
@@ -12,4 +12,8 @@ pip3 install -r requirements.txt
 # key(-k), value(-v):     {"type": "sample"}
 # number of logs(-n):     10
 # sample data length(-d): 100
-python3 client.py -s localhost -p 8080 -g samples -k type -v ss -n 10 -d 100
+# logs posted at once(-b): 500
+python3 client.py -s localhost -p 8080 -g samples -k type -v ss -n 10 -d 100 -b 500
+
+# the same with the asyncio client
+python3 client.py -s localhost -p 8080 -g samples -k type -v ss -n 10 -d 100 -b 500 --async
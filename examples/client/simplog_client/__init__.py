@@ -0,0 +1,5 @@
+from simplog_client.base import POLICY_BLOCK, POLICY_DROP, QueueFull, RetryPolicy, SimplogError  # noqa: F401
+from simplog_client.batcher import LogBatcher  # noqa: F401
+from simplog_client.client import SimplogClient  # noqa: F401
+
+# the asyncio client requires aiohttp: from simplog_client.aio import AsyncLogBatcher, AsyncSimplogClient
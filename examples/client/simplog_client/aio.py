@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from simplog_client.base import POLICY_BLOCK, POLICY_DROP, QueueFull, RetryPolicy, SimplogError
+from simplog_client.base import check_log, encode_logs, is_retryable, query_params
+
+_closed = object()
+
+
+class AsyncSimplogClient:
+    """asyncio version of SimplogClient, on an aiohttp session of at most `pool_size` connections."""
+    def __init__(self, url='http://localhost:8080', timeout=10.0, pool_size=10, retry=None, compress=True):
+        self.url = url.rstrip('/')
+        self.retry = retry or RetryPolicy()
+        self.compress = compress
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size), timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={'Accept-Encoding': 'gzip'},
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await self.session.close()
+
+    async def post_logs(self, group_name, logs):
+        body, headers = encode_logs(logs, self.compress)
+        return await self._request('POST', f'/groups/{group_name}', data=body, headers=headers)
+
+    async def get_logs(self, group_name, query=None, page_size=None, sort=None, fields=None, after=None):
+        params = query_params(query, page_size, sort, fields, after)
+        return await self._request('GET', f'/groups/{group_name}', params=params)
+
+    async def iter_logs(self, group_name, query=None, page_size=1000, sort=None, fields=None):
+        """Yields the logs matched with `query` page by page: `async for log in client.iter_logs(...)`"""
+        after = None
+        while True:
+            page = await self.get_logs(group_name, query, page_size, sort, fields, after)
+            for log in page['logs']:
+                yield log
+            after = page.get('next')
+            if after is None:
+                return
+
+    async def count(self, group_name, query=None):
+        return (await self._request('GET', f'/groups/{group_name}/count', params=query_params(query)))['count']
+
+    async def _request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                async with self.session.request(method, self.url + path, **kwargs) as response:
+                    if not is_retryable(method, response.status) or attempt >= self.retry.retries:
+                        return await _result(method, path, response)
+                    retry_after = response.headers.get('Retry-After')
+            except asyncio.TimeoutError as e:
+                # timeouts are not retried, since the logs might have been stored
+                raise SimplogError(f'{method} {path} timed out') from e
+            except aiohttp.ClientConnectionError as e:
+                # POST requests are retried only if they were not sent, since the logs might have been stored
+                not_connected = isinstance(e, aiohttp.ClientConnectorError)
+                if attempt >= self.retry.retries or (method != 'GET' and not not_connected):
+                    raise SimplogError(f'{method} {path} failed: {e!r}') from e
+                retry_after = None
+            await asyncio.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+
+async def _result(method, path, response):
+    try:
+        result = await response.json(content_type=None)
+    except ValueError:
+        result = None
+    if response.status != 200 or result is None:
+        raise SimplogError(f'{method} {path} failed({response.status}): {result}', response.status, result)
+    return result
+
+
+class AsyncLogBatcher:
+    """asyncio version of LogBatcher, which sends batches from a task of the running loop.
+
+    `await log()` waits while `max_queued` logs are queued with POLICY_BLOCK.
+    """
+    def __init__(self, client, batch_size=500, linger=0.5, max_queued=100000, policy=POLICY_BLOCK,
+                 block_timeout=None, on_error=None):
+        if policy not in (POLICY_BLOCK, POLICY_DROP):
+            raise ValueError(f'policy should be {POLICY_BLOCK} or {POLICY_DROP}: {policy}')
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_error = on_error
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.closed = False
+        self.task = asyncio.ensure_future(self._run())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def log(self, group_name, log):
+        """Queues a log(dict) of a group, returns False if it is dropped."""
+        check_log(log)
+        if self.closed:
+            raise SimplogError('batcher is closed')
+        if self.policy == POLICY_DROP:
+            try:
+                self.queue.put_nowait((group_name, log))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                return False
+            return True
+        try:
+            await asyncio.wait_for(self.queue.put((group_name, log)), self.block_timeout)
+        except asyncio.TimeoutError:
+            raise QueueFull(f'{self.queue.maxsize} logs are queued for {self.block_timeout} seconds')
+        return True
+
+    async def flush(self):
+        await self.queue.join()
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            await self.queue.put(_closed)
+            await self.task
+
+    async def _run(self):
+        batches = defaultdict(list)
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _closed:
+                for group_name in list(batches):
+                    await self._send(group_name, batches.pop(group_name))
+                self.queue.task_done()
+                return
+            if item is not None:
+                group_name, log = item
+                batches[group_name].append(log)
+                if deadline is None:
+                    deadline = time.monotonic() + self.linger
+                if len(batches[group_name]) >= self.batch_size:
+                    await self._send(group_name, batches.pop(group_name))
+            if not batches:
+                deadline = None
+            elif time.monotonic() >= deadline:
+                for group_name in list(batches):
+                    await self._send(group_name, batches.pop(group_name))
+                deadline = None
+
+    async def _send(self, group_name, logs):
+        try:
+            result = await self.client.post_logs(group_name, logs)
+            if not result.get('success'):
+                raise SimplogError(f'failed to store logs of {group_name}: {result}', result=result)
+            self.sent += len(logs)
+        except Exception as e:  # noqa, the task keeps sending the other batches
+            self.failed += len(logs)
+            if self.on_error is not None:
+                self.on_error(group_name, logs, e)
+        finally:
+            for _ in logs:
+                self.queue.task_done()
@@ -0,0 +1,82 @@
+import datetime
+import gzip
+import json
+import random
+
+POLICY_BLOCK = 'block'
+POLICY_DROP = 'drop'
+
+# responses of requests which the server rejected before storing any logs, so they can be sent again
+RETRYABLE_STATUS = (429, 503)
+# responses of a proxy(bad gateway, gateway timeout), after which the logs might have been stored,
+# so only GET requests are retried
+RETRYABLE_GET_STATUS = RETRYABLE_STATUS + (502, 504)
+_min_compressed_size = 1024
+
+
+class SimplogError(Exception):
+    def __init__(self, message, status=None, result=None):
+        super().__init__(message)
+        self.status = status
+        self.result = result
+
+
+class QueueFull(SimplogError):
+    pass
+
+
+class RetryPolicy:
+    """Retries of a request with exponential backoff and jitter: `backoff` * 2^n seconds up to `max_backoff`.
+
+    Retry-After of the response is used instead if it is longer.
+    """
+    def __init__(self, retries=3, backoff=0.5, max_backoff=10.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+
+def is_retryable(method, status):
+    return status in (RETRYABLE_GET_STATUS if method == 'GET' else RETRYABLE_STATUS)
+
+
+def encode_logs(logs, compress=True):
+    """Returns the JSON body of logs and its headers, gzipped unless it is small."""
+    body = json.dumps(logs, default=_encode_value, separators=(',', ':')).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if compress and len(body) >= _min_compressed_size:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def check_log(log):
+    if not isinstance(log, dict):
+        raise TypeError(f'log should be dict: {log!r}')
+
+
+def query_params(query=None, page_size=None, sort=None, fields=None, after=None):
+    """Returns the query arguments of GET /groups/{group}, `query` is {key: value} of the REST API."""
+    params = dict(query or {})
+    if page_size is not None:
+        params['$limit'] = str(page_size)
+    if sort is not None:
+        params['$sort'] = sort
+    if fields is not None:
+        params['$fields'] = ','.join(fields)
+    if after is not None:
+        params['$after'] = after
+    return params
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable: {value!r}')
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from simplog_client.base import POLICY_BLOCK, POLICY_DROP, QueueFull, SimplogError, check_log
+
+_closed = object()
+_lingered = object()
+
+
+class LogBatcher:
+    """Sends logs in batches from a background thread, so `log()` does not wait for the server.
+
+    The logs of a group are posted at once when `batch_size` logs are queued or `linger` seconds passed since
+    the first of them was queued. At most `max_queued` logs are kept in memory, and `log()` blocks(POLICY_BLOCK,
+    up to `block_timeout` seconds) or drops the log(POLICY_DROP) beyond it.
+    Batches which failed after the retries of the client are passed to `on_error(group, logs, error)`.
+    """
+    def __init__(self, client, batch_size=500, linger=0.5, max_queued=100000, policy=POLICY_BLOCK,
+                 block_timeout=None, on_error=None):
+        if policy not in (POLICY_BLOCK, POLICY_DROP):
+            raise ValueError(f'policy should be {POLICY_BLOCK} or {POLICY_DROP}: {policy}')
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='simplog-batcher', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def log(self, group_name, log):
+        """Queues a log(dict) of a group, returns False if it is dropped."""
+        check_log(log)
+        if self.closed:
+            raise SimplogError('batcher is closed')
+        try:
+            if self.policy == POLICY_BLOCK:
+                self.queue.put((group_name, log), timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait((group_name, log))
+        except queue.Full:
+            if self.policy == POLICY_BLOCK:
+                raise QueueFull(f'{self.queue.maxsize} logs are queued for {self.block_timeout} seconds')
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Waits until the queued logs are sent(or failed)."""
+        self.queue.join()
+
+    def close(self):
+        """Sends the queued logs and stops the thread."""
+        if not self.closed:
+            self.closed = True
+            self.queue.put(_closed)
+            self.thread.join()
+
+    def _run(self):
+        batches = defaultdict(list)     # group -> logs
+        deadline = None                 # time to send the batches
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _lingered
+            if item is _closed:
+                for group_name in list(batches):
+                    self._send(group_name, batches.pop(group_name))
+                self.queue.task_done()
+                return
+            if item is not _lingered:
+                group_name, log = item
+                batches[group_name].append(log)
+                if deadline is None:
+                    deadline = time.monotonic() + self.linger
+                if len(batches[group_name]) >= self.batch_size:
+                    self._send(group_name, batches.pop(group_name))
+            if not batches:
+                deadline = None
+            elif time.monotonic() >= deadline:
+                for group_name in list(batches):
+                    self._send(group_name, batches.pop(group_name))
+                deadline = None
+
+    def _send(self, group_name, logs):
+        try:
+            result = self.client.post_logs(group_name, logs)
+            if not result.get('success'):
+                raise SimplogError(f'failed to store logs of {group_name}: {result}', result=result)
+            self.sent += len(logs)
+        except Exception as e:  # noqa, the thread keeps sending the other batches
+            self.failed += len(logs)
+            if self.on_error is not None:
+                self.on_error(group_name, logs, e)
+        finally:
+            for _ in logs:
+                self.queue.task_done()
@@ -0,0 +1,97 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from simplog_client.base import RetryPolicy, SimplogError, encode_logs, is_retryable, query_params
+
+
+class SimplogClient:
+    """Client of a simplog server, which keeps connections alive in a pool of `pool_size` connections.
+
+    Requests rejected by the server before storing logs(429, 503) are retried by `retry`(RetryPolicy),
+    and so are requests which failed to connect. GET requests are also retried after the other connection errors
+    and 502, 504 of a proxy, but POST requests are not, since the server might have stored the logs.
+    POST bodies larger than 1KiB are gzipped with `compress`.
+    """
+    def __init__(self, url='http://localhost:8080', timeout=10.0, pool_size=10, retry=None, compress=True):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.compress = compress
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def post_logs(self, group_name, logs):
+        """Stores logs(list of dict) to a group, and returns the result: {"success": true, "id": [...]}"""
+        body, headers = encode_logs(logs, self.compress)
+        return self._request('POST', f'/groups/{group_name}', data=body, headers=headers)
+
+    def get_logs(self, group_name, query=None, page_size=None, sort=None, fields=None, after=None):
+        """Returns a page of the logs: {"logs": [...], "next": token of the next page(if any)}"""
+        params = query_params(query, page_size, sort, fields, after)
+        return self._request('GET', f'/groups/{group_name}', params=params)
+
+    def iter_logs(self, group_name, query=None, page_size=1000, sort=None, fields=None):
+        """Yields the logs matched with `query`({key: value} of the REST API) page by page.
+
+        Pages are resumed by the `next` token, so logs stored while reading do not shift the pages.
+        """
+        after = None
+        while True:
+            page = self.get_logs(group_name, query, page_size, sort, fields, after)
+            yield from page['logs']
+            after = page.get('next')
+            if after is None:
+                return
+
+    def count(self, group_name, query=None):
+        return self._request('GET', f'/groups/{group_name}/count', params=query_params(query))['count']
+
+    def _request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, self.url + path, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # read timeouts are not retried, since the logs might have been stored
+                if attempt >= self.retry.retries or (method != 'GET' and not _not_connected(e)):
+                    raise SimplogError(f'{method} {path} failed: {e!r}') from e
+                retry_after = None
+            else:
+                if not is_retryable(method, response.status_code) or attempt >= self.retry.retries:
+                    return _result(method, path, response)
+                retry_after = response.headers.get('Retry-After')
+            time.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+
+def _not_connected(error):
+    """Tells whether a request failed before it was sent, e.g. connection refused or connect timeout."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (ConnectTimeoutError, NewConnectionError))
+
+
+def _result(method, path, response):
+    try:
+        result = response.json()
+    except ValueError:
+        result = None
+    if response.status_code != 200 or result is None:
+        raise SimplogError(f'{method} {path} failed({response.status_code}): {result}', response.status_code, result)
+    return result
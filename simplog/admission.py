@@ -0,0 +1,204 @@
+import io
+import json
+import math
+import time
+from collections import OrderedDict
+
+from simplog.compression import CompressingRequest
+from simplog.executor import ExecutorOverloaded
+
+QUOTA_REQUESTS = 'requests'
+QUOTA_DOCS = 'docs'
+QUOTA_BYTES = 'bytes'
+_quota_kinds = (QUOTA_REQUESTS, QUOTA_DOCS, QUOTA_BYTES)
+_burst_key = 'burst'
+_default_key = '*'
+
+
+class InvalidQuota(ValueError):
+    pass
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` tokens.
+
+    `wait(amount)` tells the seconds until `amount` tokens(at most `burst`) are available, and `take(amount)`
+    takes them. Taking more than the tokens leaves a debt, which delays the next requests.
+    """
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def wait(self, amount, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        shortage = min(amount, self.burst) - self.tokens
+        return shortage / self.rate if shortage > 0 else 0.0
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class Quota:
+    """Rates per second of a group or a client: {"requests": 100, "docs": 100000, "bytes": 10485760, "burst": 2}
+
+    Any of the rates may be omitted for no limit. `burst`(1 by default) is the seconds of the rates
+    which can be used at once after idle time.
+    """
+    def __init__(self, rates, burst=1.0):
+        self.rates = rates
+        self.burst = burst
+
+    @classmethod
+    def from_dict(cls, quota):
+        if not isinstance(quota, dict) or quota.keys() - set(_quota_kinds + (_burst_key,)):
+            raise InvalidQuota(f'quota should have {", ".join(_quota_kinds)} or burst: {quota}')
+        rates = {}
+        for kind in _quota_kinds:
+            if kind in quota:
+                rates[kind] = _positive_number(quota, kind)
+        burst = _positive_number(quota, _burst_key) if _burst_key in quota else 1.0
+        return cls(rates, burst=burst)
+
+    def buckets(self, now):
+        return {kind: TokenBucket(rate, rate * self.burst, now) for kind, rate in self.rates.items()}
+
+
+class AdmissionControl:
+    """Admits requests by the quotas of their groups and clients, before their bodies are parsed and
+    any database call starts.
+
+    - `group_quotas` and `client_quotas` are {name: Quota}, `*` is the quota of the others.
+      Buckets of at most `max_buckets` recent groups and clients are kept.
+    - Reads(GET) are admitted while less than `read_share` of the capacity of `executor` is pending,
+      so the rest is kept for writes.
+    - `max_body_bytes` is the max size of request bodies, and `max_result_logs` the max number of logs
+      in a response.
+    All methods are called in the reactor thread.
+    """
+    def __init__(self, group_quotas=None, client_quotas=None, executor=None, read_share=1.0, max_body_bytes=None,
+                 max_result_logs=None, max_buckets=10000, clock=time.monotonic):
+        if not 0 < read_share <= 1:
+            raise ValueError(f'read_share should be in (0, 1]: {read_share}')
+        self.group_quotas = dict(group_quotas or {})
+        self.client_quotas = dict(client_quotas or {})
+        self.executor = executor
+        self.read_share = read_share
+        self.max_body_bytes = max_body_bytes
+        self.max_result_logs = max_result_logs
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self.buckets = OrderedDict()    # (kind of name, name) -> {kind of quota: TokenBucket}
+
+    def load_config(self, path):
+        """Sets the quotas declared in a JSON file: {"groups": {"{group}": {quota}, ...}, "clients": {...}}"""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        if not isinstance(config, dict) or config.keys() - {'groups', 'clients'}:
+            raise InvalidQuota(f'quota config should have groups or clients: {config}')
+        for key, quotas in (('groups', self.group_quotas), ('clients', self.client_quotas)):
+            for name, quota in config.get(key, {}).items():
+                quotas[name] = Quota.from_dict(quota)
+
+    def admit(self, group_name, client, write=False, size=0):
+        """Takes a request and its `size` bytes from the quotas, raises QuotaExceeded(429) if they are used up,
+        or ExecutorOverloaded(503) if a read would use the capacity kept for writes."""
+        if not write and self.executor is not None and self.read_share < 1 \
+                and self.executor.pending >= self.executor.capacity * self.read_share:
+            raise ExecutorOverloaded(f'too many pending reads: {self.executor.pending}')
+        now = self.clock()
+        self._take(self._buckets(group_name, client, now), {QUOTA_REQUESTS: 1, QUOTA_DOCS: 0, QUOTA_BYTES: size}, now)
+
+    def admit_groups(self, group_names):
+        """Takes a request from the quotas of each group of a read of several groups, which are known after
+        the request is admitted by `admit(None, client)`; raises QuotaExceeded(429) if any of them is used up."""
+        now = self.clock()
+        buckets = [bucket for group_name in group_names for bucket in self._buckets(group_name, None, now)]
+        self._take(buckets, {QUOTA_REQUESTS: 1, QUOTA_DOCS: 0, QUOTA_BYTES: 0}, now)
+
+    def _take(self, buckets, amounts, now):
+        waits = [
+            (bucket.wait(amounts[kind], now), name, kind) for name, kind_buckets in buckets
+            for kind, bucket in kind_buckets.items()
+        ]
+        wait, name, kind = max(waits, default=(0.0, None, None))
+        if wait > 0:
+            raise QuotaExceeded(f'{kind} quota of {name} is used up', math.ceil(wait))
+        for _, kind_buckets in buckets:
+            for kind, bucket in kind_buckets.items():
+                bucket.take(amounts[kind])
+
+    def charge_docs(self, group_name, client, docs):
+        """Takes the number of stored logs of an admitted request, which is known after its body is parsed."""
+        if docs:
+            for _, kind_buckets in self._buckets(group_name, client, self.clock()):
+                if QUOTA_DOCS in kind_buckets:
+                    kind_buckets[QUOTA_DOCS].take(docs)
+
+    def limit_page(self, page):
+        """Limits the logs of a find query(PageOptions) to `max_result_logs`, the rest are in the next pages."""
+        if self.max_result_logs is not None and (page.limit is None or page.limit > self.max_result_logs):
+            page.limit = self.max_result_logs
+
+    def _buckets(self, group_name, client, now):
+        buckets = []
+        for key, quotas in (('group', self.group_quotas), ('client', self.client_quotas)):
+            name = group_name if key == 'group' else client
+            if name is None:
+                continue
+            quota = quotas.get(name, quotas.get(_default_key))
+            if quota is None:
+                continue
+            kind_buckets = self.buckets.get((key, name))
+            if kind_buckets is None:
+                kind_buckets = self.buckets[(key, name)] = quota.buckets(now)
+                if len(self.buckets) > self.max_buckets:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end((key, name))
+            buckets.append((f'{key} {name}', kind_buckets))
+        return buckets
+
+
+class LimitedRequest(CompressingRequest):
+    """Request which does not keep a body larger than `site.max_body_bytes`, so it is rejected(413)
+    without being buffered in memory or a temporary file."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.body_too_large = False
+        self.body_size = 0
+
+    def gotLength(self, length):
+        max_body_bytes = getattr(self.channel.site, 'max_body_bytes', None)
+        if max_body_bytes is not None and length is not None and length > max_body_bytes:
+            self.body_too_large = True
+            length = 0
+        super().gotLength(length)
+
+    def handleContentChunk(self, data):
+        if self.body_too_large:
+            return
+        self.body_size += len(data)
+        max_body_bytes = getattr(self.channel.site, 'max_body_bytes', None)
+        if max_body_bytes is not None and self.body_size > max_body_bytes:
+            # a chunked body without Content-Length
+            self.body_too_large = True
+            self.content.close()
+            self.content = io.BytesIO()
+            return
+        super().handleContentChunk(data)
+
+
+def _positive_number(quota, key):
+    value = quota.get(key)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        raise InvalidQuota(f'{key} should be positive number: {value}')
+    return value
@@ -0,0 +1,189 @@
+import datetime
+from collections import OrderedDict
+
+from simplog.merge import order_key
+
+_epoch = datetime.datetime(1970, 1, 1)
+_date_postfix = ':date'
+_default_group_limit = 100
+_min_date_interval = 0.001      # seconds, datetime values are in milliseconds
+
+AGGREGATION_COUNT = 'count'
+AGGREGATION_GROUP_BY = 'groupby'
+AGGREGATION_STATS = 'stats'
+AGGREGATION_HISTOGRAM = 'histogram'
+AGGREGATIONS = (AGGREGATION_COUNT, AGGREGATION_GROUP_BY, AGGREGATION_STATS, AGGREGATION_HISTOGRAM)
+
+
+class InvalidAggregation(ValueError):
+    pass
+
+
+class Aggregation:
+    """Aggregation pipeline of a group and the conversion of its result to the response.
+
+    - count: number of matched logs
+    - groupby/{field}: number of matched logs of each value of the field, `$limit` values with the most logs
+    - stats/{field}: count, min, max, avg and sum of the field in matched logs
+    - histogram/{field}: number of matched logs in each `$interval` of the numeric field
+    - histogram/{field}:date: number of matched logs in each `$interval` seconds of the datetime field
+    """
+    def __init__(self, kind, field=None, limit=None, interval=None):
+        if kind not in AGGREGATIONS:
+            raise InvalidAggregation(f'unknown aggregation: {kind}')
+        if kind != AGGREGATION_COUNT and not field:
+            raise InvalidAggregation(f'{kind} requires a field')
+        if kind == AGGREGATION_COUNT and field:
+            raise InvalidAggregation(f'{kind} does not take a field: {field}')
+        self.kind = kind
+        self.is_date = False
+        if kind == AGGREGATION_HISTOGRAM:
+            if field.endswith(_date_postfix):
+                field, self.is_date = field[:-len(_date_postfix)], True
+            if interval is None or interval <= 0:
+                raise InvalidAggregation(f'histogram requires positive $interval: {interval}')
+            if self.is_date and interval < _min_date_interval:
+                raise InvalidAggregation(f'histogram of dates requires $interval of at least 1ms: {interval}')
+        self.field = field
+        self.limit = limit if limit is not None else _default_group_limit
+        self.interval = interval
+
+    @classmethod
+    def from_request(cls, kind, postpath, args, date_fields=()):
+        """Pops the reserved arguments($limit, $interval) from `args`(request.args) and returns Aggregation.
+
+        Histograms of `date_fields`(e.g. from the schema of the group) are of dates without the `:date` postfix.
+        """
+        if len(postpath) > 1:
+            raise InvalidAggregation(f'invalid aggregation path: {"/".join(p.decode("utf-8") for p in postpath)}')
+        field = postpath[0].decode('utf-8') if postpath else None
+        if kind == AGGREGATION_HISTOGRAM and field in date_fields:
+            field += _date_postfix
+        limit = _pop_number(args, b'$limit', int)
+        if limit is not None and limit <= 0:
+            raise InvalidAggregation(f'$limit should be positive: {limit}')
+        return cls(kind, field=field, limit=limit, interval=_pop_number(args, b'$interval', float))
+
+    def pipeline(self, query):
+        stages = self.partial_pipeline(query)
+        if self.kind == AGGREGATION_GROUP_BY:
+            stages.extend([
+                {'$sort': {'count': -1, '_id': 1}},
+                {'$limit': self.limit},
+            ])
+        elif self.kind == AGGREGATION_HISTOGRAM:
+            stages.append({'$sort': {'_id': 1}})
+        return stages
+
+    def partial_pipeline(self, query):
+        """Returns the pipeline of a collection without the sort and limit of the results, which is merged
+        with the results of the other collections by `merge`."""
+        stages = [{'$match': query}]
+        if self.kind == AGGREGATION_COUNT:
+            stages.append({'$count': 'count'})
+        elif self.kind == AGGREGATION_GROUP_BY:
+            stages.append({'$group': {'_id': f'${self.field}', 'count': {'$sum': 1}}})
+        elif self.kind == AGGREGATION_STATS:
+            stages.extend([
+                {'$match': {self.field: {'$exists': True}}},
+                {'$group': {
+                    '_id': None,
+                    'count': {'$sum': 1},
+                    'min': {'$min': f'${self.field}'},
+                    'max': {'$max': f'${self.field}'},
+                    'avg': {'$avg': f'${self.field}'},
+                    'sum': {'$sum': f'${self.field}'},
+                }},
+            ])
+        elif self.kind == AGGREGATION_HISTOGRAM:
+            value = f'${self.field}'
+            if self.is_date:
+                # date - (milliseconds since epoch % interval) = start date of the bucket
+                offset = {'$subtract': [value, _epoch]}
+                bucket = {'$subtract': [value, {'$mod': [offset, int(self.interval * 1000)]}]}
+            else:
+                bucket = {'$subtract': [value, {'$mod': [value, self.interval]}]}
+            stages.extend([
+                {'$match': {self.field: {'$type': 'date' if self.is_date else 'number'}}},
+                {'$group': {'_id': bucket, 'count': {'$sum': 1}}},
+            ])
+        return stages
+
+    def merge(self, partials):
+        """Merges the results of `partial_pipeline` of collections into the result of `pipeline`."""
+        if self.kind == AGGREGATION_COUNT:
+            count = sum(docs[0]['count'] for docs, _ in partials if docs)
+            return [{'count': count}] if count else []
+        elif self.kind == AGGREGATION_STATS:
+            stats = [(docs[0], numeric_count) for docs, numeric_count in partials if docs]
+            if not stats:
+                return []
+            numeric_count = sum(numeric_count for _, numeric_count in stats)
+            return [{
+                'count': sum(doc['count'] for doc, _ in stats),
+                'min': min((doc['min'] for doc, _ in stats), key=order_key),
+                'max': max((doc['max'] for doc, _ in stats), key=order_key),
+                'avg': sum(doc['avg'] * n for doc, n in stats if n) / numeric_count if numeric_count else None,
+                'sum': sum(doc['sum'] for doc, _ in stats),
+            }]
+        counts = OrderedDict()     # order key -> [value, count]
+        for docs, _ in partials:
+            for doc in docs:
+                counts.setdefault(order_key(doc['_id']), [doc['_id'], 0])[1] += doc['count']
+        if self.kind == AGGREGATION_GROUP_BY:
+            groups = sorted(counts.items(), key=lambda item: (-item[1][1], item[0]))[:self.limit]
+        else:
+            groups = sorted(counts.items())
+        return [{'_id': value, 'count': count} for _, (value, count) in groups]
+
+    def result(self, docs):
+        if self.kind == AGGREGATION_COUNT:
+            return {'count': docs[0]['count'] if docs else 0}
+        elif self.kind == AGGREGATION_GROUP_BY:
+            return {'field': self.field, 'groups': [{'value': doc['_id'], 'count': doc['count']} for doc in docs]}
+        elif self.kind == AGGREGATION_STATS:
+            stats = docs[0] if docs else {'count': 0}
+            return dict({'field': self.field}, **{
+                key: stats.get(key) for key in ('count', 'min', 'max', 'avg', 'sum')
+            })
+        elif self.kind == AGGREGATION_HISTOGRAM:
+            return {
+                'field': self.field,
+                'interval': self.interval,
+                'buckets': [{'start': doc['_id'], 'count': doc['count']} for doc in docs],
+            }
+
+    def run(self, collection, query):
+        # runs in a worker thread of the executor
+        return self.result(list(collection.aggregate(self.pipeline(query))))
+
+    def run_many(self, collections, query):
+        """Runs the aggregation on several collections(e.g. partitions of a group) and merges the results."""
+        # runs in a worker thread of the executor
+        if len(collections) == 1:
+            return self.run(collections[0], query)
+        partials = []
+        for collection in collections:
+            docs = list(collection.aggregate(self.partial_pipeline(query)))
+            numeric_count = None
+            if self.kind == AGGREGATION_STATS and docs:
+                # avg of the partitions is weighted by the number of numeric values
+                numeric_count = collection.count_documents({'$and': [query, {self.field: {'$type': 'number'}}]})
+            partials.append((docs, numeric_count))
+        return self.result(self.merge(partials))
+
+    def count_many(self, collections, query):
+        """Runs a count on several collections by count_documents, for storages without aggregations."""
+        # runs in a worker thread of the executor
+        count = sum(collection.count_documents(query) for collection in collections)
+        return self.result([{'count': count}])
+
+
+def _pop_number(args, key, value_type):
+    values = args.pop(key, None)
+    if not values:
+        return None
+    try:
+        return value_type(values[0].decode('utf-8'))
+    except ValueError:
+        raise InvalidAggregation(f'{key.decode("utf-8")} should be {value_type.__name__}: {values[0]}')
@@ -1,121 +1,1000 @@
+import argparse
+import functools
 import json
+import os
+import socket
+import sys
+import time
 from json.decoder import JSONDecodeError
 
-import pymongo
 from twisted.internet import reactor
+from twisted.internet.defer import succeed
+from twisted.logger import globalLogBeginner, textFileLogObserver
+from twisted.python import log
 from twisted.web.resource import Resource, NoResource
-from twisted.web.server import Site
+from twisted.web.server import NOT_DONE_YET
+
+from simplog.admission import AdmissionControl, LimitedRequest, QuotaExceeded
+from simplog.aggregate import AGGREGATION_COUNT, AGGREGATIONS, Aggregation
+from simplog.buffer import ACK_BUFFERED, ACK_DURABLE, WriteBuffers
+from simplog.cache import ResponseCache, etag_matches
+from simplog.compression import CompressingSite, ResponseCompression, available_encodings
+from simplog.database import CIRCUIT_OPEN, CircuitBreaker, DatabaseConfig
+from simplog.executor import BoundedExecutor, ExecutorOverloaded
+from simplog.export import CONTENT_TYPES, FORMAT_ARROW, ExportProducer
+from simplog.fanout import FanOutProducer, is_glob, parse_groups, resolve_groups
+from simplog.indexes import IndexManager, IndexSpec, STATUS_BUILDING
+from simplog.ingest import BodyTooLarge, NDJSONIngest, UnsupportedEncoding, content_encoding, is_ndjson, open_body
+from simplog.ingest import read_stream
+from simplog.merge import MergedCursor
+from simplog.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from simplog.metrics import Metrics, PHASE_DB, PHASE_PARSE, PHASE_SERIALIZE, PHASE_WRITE, ReactorLagMonitor
+from simplog.metrics import ROUTE_EXPORT, ROUTE_FANOUT, ROUTE_INDEXES, ROUTE_LOGS
+from simplog.paging import PageOptions
+from simplog.query import QueryPlanCache
+from simplog.retention import RetentionManager
+from simplog.schema import IngestSchemas, InvalidLog
+from simplog.serializer import SERIALIZER_AUTO, SERIALIZER_JSON, SERIALIZER_ORJSON, get_serializer
+from simplog.serializer import MongoDocumentEncoder  # noqa: F401, importable from apiserver as before
+from simplog.spool import FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER, Spool, SpoolCollection, SpoolDrainer
+from simplog.sqlite_storage import SQLiteEngine
+from simplog.storage import FEATURE_AGGREGATE, FEATURE_CHANGE_STREAM, FEATURE_RETENTION, FEATURE_TEXT_SEARCH
+from simplog.storage import STORAGE_MONGO, STORAGE_SQLITE, MongoEngine, UnsupportedFeature, get_storage
+from simplog.streaming import CursorProducer
+from simplog.tail import SOURCE_CHANGE_STREAM, SOURCE_INGEST, ChangeStreamSource, TailHub, TooManySubscribers
+from simplog.workers import WorkerSupervisor, install_signal_handlers, start_heartbeat
 
 _content_type_key = 'Content-Type'
 _content_type_value = 'application/json; charset=utf-8'
-_value_type_postfix = {
-    ':int': int,
-    ':float': float,
-}
+_max_buffered_body_size = 64 * 1024     # larger bodies are inserted without the write buffer
+_retry_after_key = 'Retry-After'
+_etag_key = 'ETag'
+_retry_after_value = '1'
+_groups_key = b'$groups'
 
 
 class SimplogHome(Resource):
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, executor, stream_batch_size=500, index_manager=None, ingest_batch_size=1000,
+                 write_buffers=None, serializer=None, cache=None, metrics=None, retention=None, tail=None,
+                 queries=None, export_batch_size=10000, spool=None, write_executor=None, schemas=None,
+                 fanout_max_groups=100, admission=None, export_schema_sample=10000):
         super().__init__()
         self.db_connection = db_connection
+        self.storage = get_storage(db_connection)
+        self.log_db = self.storage.log_db
+        self.executor = executor
+        self.write_executor = write_executor or executor
+        self.spool = spool
+        self.stream_batch_size = stream_batch_size
+        self.ingest_batch_size = ingest_batch_size
+        self.export_batch_size = export_batch_size
+        self.export_schema_sample = export_schema_sample
+        self.fanout_max_groups = fanout_max_groups
+        self.admission = admission
+        self.write_buffers = write_buffers
+        self.serializer = serializer or get_serializer()
+        self.cache = cache
+        self.queries = queries or QueryPlanCache()
+        self.schemas = schemas or IngestSchemas()
+        self.tail = tail or TailHub(self.serializer)
+        self.retention = retention or RetentionManager(self.log_db, executor)
+        self.index_manager = index_manager or IndexManager(self.log_db, executor, retention=self.retention)
+        self.metrics = metrics or Metrics()
+        self.metrics.add_gauge(
+            'simplog_executor_pending', 'Database calls running or waiting for a worker.', lambda: executor.pending,
+        )
+        if executor.breaker is not None:
+            self.metrics.add_gauge(
+                'simplog_db_circuit_open', 'Whether database calls fail fast(1) or not(0).',
+                lambda: int(executor.breaker.state == CIRCUIT_OPEN),
+            )
+        if spool is not None:
+            self.metrics.add_gauge('simplog_spool_bytes', 'Bytes of spooled logs not inserted yet.', lambda: spool.size)
+            self.metrics.add_gauge(
+                'simplog_spool_lag_seconds', 'Age of the oldest spooled log not inserted yet.', spool.lag,
+            )
+        self.metrics.add_gauge('simplog_query_plans', 'Cached query plans.', lambda: len(self.queries.plans))
+        self.metrics.add_gauge('simplog_tail_subscribers', 'Subscribers of live tails.', lambda: self.tail.count)
+        if cache is not None:
+            self.metrics.add_gauge('simplog_cache_entries', 'Cached GET responses.', lambda: len(cache.entries))
+            self.metrics.add_gauge('simplog_cache_bytes', 'Bytes of cached GET responses.', lambda: cache.size)
 
     def getChild(self, path, request):
         path = path.decode('utf-8')
         if path == 'groups':
-            return LogGroupsPage(self.db_connection)
+            return LogGroupsPage(self)
+        elif path == 'metrics':
+            return MetricsPage(self.metrics)
         else:
             return NoResource()
 
 
 class LogGroupsPage(Resource):
-    def __init__(self, db_connection, ):
+    def __init__(self, home):
         super().__init__()
-        self.log_db = db_connection.logs
+        self.home = home
 
     def getChild(self, path, request):
         group_name = path.decode('utf-8')
-        return LogGroupPage(self.log_db, group_name)
+        return LogGroupPage(self.home, group_name)
+
+    def render_GET(self, request):
+        """Logs of several groups(`$groups` of names and glob patterns) merged in the sort order."""
+        request.setHeader(_content_type_key, _content_type_value)
+        timer = self.home.metrics.track(request, ROUTE_FANOUT)
+        rejected_body = admission_response(self.home, request, None)
+        if rejected_body is not None:
+            return rejected_body
+        args = dict(request.args)
+        try:
+            with timer.phase(PHASE_PARSE):
+                if not args.get(_groups_key):
+                    raise ValueError('$groups should be given')
+                patterns = parse_groups(args.pop(_groups_key)[0].decode('utf-8'), self.home.fanout_max_groups)
+                page = PageOptions.from_args(args)
+                if page.search is not None:
+                    raise ValueError('$search is not supported with $groups')
+                page.ordered = True
+                limit_page(self.home, page)
+                query_plan(self.home, request, ROUTE_FANOUT, None, args)     # validated before any database call
+        except ValueError as e:
+            request.setResponseCode(400)
+            return error_response(e)
+        retention = self.home.retention
+        if any(is_glob(pattern) for pattern in patterns):
+            try:
+                d = self.home.executor.submit(
+                    resolve_groups, self.home.log_db, patterns, retention.group_of, self.home.fanout_max_groups,
+                )
+            except ExecutorOverloaded as e:
+                return overloaded_response(request, e)
+        else:
+            d = succeed(patterns)
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+        d.addCallback(self.stream_groups, request, page, args, timer, finished)
+        d.addErrback(self.stream_failed, request, finished)
+        return NOT_DONE_YET
+
+    def stream_groups(self, group_names, request, page, args, timer, finished):
+        if finished:
+            return
+        if self.home.admission is not None:
+            try:
+                self.home.admission.admit_groups(group_names)
+            except QuotaExceeded as e:
+                request.write(quota_response(request, e))
+                request.finish()
+                return
+        cursors = []
+        try:
+            for group_name in group_names:
+                plan = query_plan(self.home, request, ROUTE_FANOUT, group_name, args)
+                self.home.index_manager.record_query(
+                    group_name, plan.fields + ([page.sort_field] if page.sort_field else []),
+                )
+                cursors.append((group_name, find_logs(self.home, group_name, page, plan.filter)))
+            producer = FanOutProducer(
+                request, self.home.executor, cursors, self.home.serializer, page.sort(),
+                batch_size=self.home.stream_batch_size, limit=page.limit,
+                trailer=(lambda last_doc, count: {'next': page.next_token(last_doc, count)}) if page.paged else None,
+                timer=timer,
+            )
+            producer.start()
+        except (ValueError, ExecutorOverloaded) as e:
+            for _, cursor in cursors:
+                self.home.executor.submit_admitted(cursor.close)
+            if isinstance(e, ExecutorOverloaded):
+                body = overloaded_response(request, e)
+            else:
+                request.setResponseCode(400)
+                body = error_response(e)
+            request.write(body)
+            request.finish()
+
+    def stream_failed(self, failure, request, finished):
+        log.err(failure, 'simplog > query of several groups failed')
+        if not finished:
+            if failure.check(ValueError):
+                request.setResponseCode(400)
+            else:
+                request.setResponseCode(500)
+            request.write(error_response(failure.value))
+            request.finish()
 
 
 class LogGroupPage(Resource):
+    def __init__(self, home, group_name):
+        super().__init__()
+        self.home = home
+        self.group_name = group_name
+        self.schema = home.schemas.get(group_name)
+        if home.spool is not None:
+            self.insert_collection = SpoolCollection(home.spool, group_name)
+        else:
+            self.insert_collection = home.retention.insert_collection(group_name)
+        self.executor = home.executor
+
+    def getChild(self, path, request):
+        path = path.decode('utf-8')
+        if path == '':
+            return self
+        elif path == 'indexes':
+            return IndexesPage(self.home, self.group_name)
+        elif path == 'tail':
+            return TailPage(self.home, self.group_name)
+        elif path == 'export':
+            return ExportPage(self.home, self.group_name, self.find)
+        elif path in AGGREGATIONS:
+            return AggregationPage(self.home, self.group_name, path)
+        else:
+            return NoResource()
+
+    def render_GET(self, request):
+        request.setHeader(_content_type_key, _content_type_value)
+        timer = self.home.metrics.track(request, ROUTE_LOGS, self.group_name)
+        args = dict(request.args)
+        try:
+            with timer.phase(PHASE_PARSE):
+                page = PageOptions.from_args(args)
+                limit_page(self.home, page)
+                plan = query_plan(self.home, request, ROUTE_LOGS, self.group_name, args)
+                if page.search is not None:
+                    self.home.storage.require(FEATURE_TEXT_SEARCH)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return error_response(e)
+        except UnsupportedFeature as e:
+            return unsupported_response(request, e)
+        cache, on_complete = self.home.cache, None
+        if cache is not None:
+            cache_key = cache.normalize(request.args)
+            cached_body = cached_response(request, cache, self.group_name, cache_key)
+            if cached_body is not None:     # no database call, so not limited by the admission
+                return cached_body
+        rejected_body = admission_response(self.home, request, self.group_name)
+        if rejected_body is not None:
+            return rejected_body
+        if cache is not None:
+            on_complete = cache_filler(request, cache, self.group_name, cache_key)
+
+        self.home.index_manager.record_query(
+            self.group_name, plan.fields + ([page.sort_field] if page.sort_field else []),
+        )
+        cursor = self.find(page, plan.filter).batch_size(self.home.stream_batch_size)
+        producer = CursorProducer(
+            request, self.executor, cursor, self.home.serializer, batch_size=self.home.stream_batch_size,
+            trailer=(lambda last_doc, count: {'next': page.next_token(last_doc, count)}) if page.paged else None,
+            on_complete=on_complete, capture_limit=cache.max_entry_bytes if cache is not None else 0, timer=timer,
+        )
+        try:
+            producer.start()
+        except ExecutorOverloaded as e:
+            cursor.close()
+            return overloaded_response(request, e)
+        return NOT_DONE_YET
+
+    def find(self, page, query):
+        return find_logs(self.home, self.group_name, page, query)
+
+    def render_POST(self, request):
+        request.setHeader(_content_type_key, _content_type_value)
+        timer = self.home.metrics.track(request, ROUTE_LOGS, self.group_name)
+        rejected_body = admission_response(self.home, request, self.group_name, write=True)
+        if rejected_body is not None:
+            return rejected_body
+        max_body_bytes = self.home.admission.max_body_bytes if self.home.admission is not None else None
+        try:
+            stream = open_body(request.content, content_encoding(request), max_bytes=max_body_bytes)
+        except UnsupportedEncoding as e:
+            request.setResponseCode(415)
+            return error_response(e)
+        if is_ndjson(request):
+            return self.render_write(request, timer, self.ingest_ndjson, stream, timer)
+        try:
+            raw_log_data = read_stream(stream)
+        except BodyTooLarge as e:
+            request.setResponseCode(413)
+            return error_response(e)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return error_response(e)
+        write_buffers = self.home.write_buffers
+        if write_buffers is not None and len(raw_log_data) <= _max_buffered_body_size:
+            return self.render_buffered(request, timer, write_buffers, raw_log_data)
+        return self.render_write(request, timer, self.insert_logs, raw_log_data, timer)
+
+    def render_buffered(self, request, timer, write_buffers, raw_log_data):
+        try:
+            with timer.phase(PHASE_PARSE):
+                logs = decode_logs(raw_log_data, self.schema, self.home.retention.now())
+        except (JSONDecodeError, TypeError, InvalidLog) as e:
+            return json.dumps({'success': False, 'error': repr(e)}).encode("utf-8")
+        charge_docs(self.home, request, self.group_name, len(logs))
+        d = write_buffers.get(self.group_name).add(logs).addBoth(self.written)
+        d.addCallback(lambda log_ids: self.home.tail.inserted(self.group_name, logs) or log_ids)
+        if write_buffers.ack == ACK_BUFFERED:
+            d.addErrback(log.err, f'simplog > failed to write buffered logs of {self.group_name}')
+            timer.inserted = len(logs)
+            return inserted_response([log_object['_id'] for log_object in logs])
+
+        def buffered(log_ids):
+            timer.inserted = len(log_ids)
+            return inserted_response(log_ids)
+        return respond_later(request, d.addCallback(buffered), timer)
+
+    def ingest_ndjson(self, stream, timer):
+        # runs in a worker thread of the executor
+        started = time.perf_counter()
+        normalize = None
+        if self.schema is not None:
+            normalize = functools.partial(self.schema.normalize, ingested=self.home.retention.now())
+        ingest = NDJSONIngest(
+            self.insert_collection, batch_size=self.home.ingest_batch_size,
+            on_insert=lambda logs: self.home.tail.inserted_in_thread(self.group_name, logs), normalize=normalize,
+        )
+        result = ingest.run(stream)
+        timer.add(PHASE_PARSE, time.perf_counter() - started - ingest.insert_seconds)
+        timer.add(PHASE_DB, ingest.insert_seconds)
+        timer.inserted = ingest.inserted
+        return json.dumps(result).encode("utf-8")
+
+    def insert_logs(self, raw_log_data, timer):
+        # runs in a worker thread of the executor
+        try:
+            with timer.phase(PHASE_PARSE):
+                logs = decode_logs(raw_log_data, self.schema, self.home.retention.now())
+        except (JSONDecodeError, TypeError, InvalidLog) as e:
+            return json.dumps({'success': False, 'error': repr(e)}).encode("utf-8")
+        with timer.phase(PHASE_DB):
+            log_ids = self.insert_collection.insert_many(logs).inserted_ids
+        timer.inserted = len(log_ids)
+        self.home.tail.inserted_in_thread(self.group_name, logs)
+        return inserted_response(log_ids)
+
+    def render_write(self, request, timer, func, *args):
+        try:
+            d = self.home.write_executor.submit(func, *args)
+        except ExecutorOverloaded as e:
+            return overloaded_response(request, e)
+        d.addBoth(self.written)
+        d.addBoth(lambda result: charge_docs(self.home, request, self.group_name, timer.inserted) or result)
+        return respond_later(request, d, timer)
+
+    def written(self, result):
+        # also called on failures, a part of the logs might be written
+        if self.home.cache is not None:
+            self.home.cache.invalidate(self.group_name)
+        return result
+
+
+class AggregationPage(Resource):
+    isLeaf = True
+
+    def __init__(self, home, group_name, kind):
+        super().__init__()
+        self.home = home
+        self.group_name = group_name
+        self.kind = kind
+
+    def render_GET(self, request):
+        request.setHeader(_content_type_key, _content_type_value)
+        timer = self.home.metrics.track(request, self.kind, self.group_name)
+        args = dict(request.args)
+        try:
+            with timer.phase(PHASE_PARSE):
+                if self.kind != AGGREGATION_COUNT:     # counted by count_documents without aggregations
+                    self.home.storage.require(FEATURE_AGGREGATE)
+                schema = self.home.schemas.get(self.group_name)
+                aggregation = Aggregation.from_request(
+                    self.kind, request.postpath, args, date_fields=schema.date_fields if schema is not None else (),
+                )
+                plan = query_plan(self.home, request, self.kind, self.group_name, args)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return error_response(e)
+        except UnsupportedFeature as e:
+            return unsupported_response(request, e)
+        cache, on_complete = self.home.cache, None
+        if cache is not None:
+            cache_key = (self.kind, tuple(request.postpath)) + cache.normalize(request.args)
+            cached_body = cached_response(request, cache, self.group_name, cache_key)
+            if cached_body is not None:     # no database call, so not limited by the admission
+                return cached_body
+        rejected_body = admission_response(self.home, request, self.group_name)
+        if rejected_body is not None:
+            return rejected_body
+        if cache is not None:
+            on_complete = cache_filler(request, cache, self.group_name, cache_key)
+        self.home.index_manager.record_query(self.group_name, plan.fields)
+        try:
+            d = self.home.executor.submit(self.aggregate, aggregation, plan.filter, timer)
+        except ExecutorOverloaded as e:
+            return overloaded_response(request, e)
+        if on_complete is not None:
+            d.addCallback(lambda body: on_complete(body) or body)
+        return respond_later(request, d, timer)
+
+    def aggregate(self, aggregation, query, timer):
+        # runs in a worker thread of the executor
+        with timer.phase(PHASE_DB):
+            collections = self.home.retention.group_collections(self.group_name, query)
+            if self.home.storage.supports(FEATURE_AGGREGATE):
+                result = aggregation.run_many(collections, query)
+            else:
+                result = aggregation.count_many(collections, query)
+        with timer.phase(PHASE_SERIALIZE):
+            return self.home.serializer.dumps(result)
+
+
+class IndexesPage(Resource):
     isLeaf = True
 
-    def __init__(self, db, group_name):
+    def __init__(self, home, group_name):
         super().__init__()
-        self.log_collection = db[group_name]
+        self.index_manager = home.index_manager
+        self.storage = home.storage
+        self.metrics = home.metrics
+        self.group_name = group_name
+
+    def render(self, request):
+        self.metrics.track(request, ROUTE_INDEXES, self.group_name)
+        return super().render(request)
 
     def render_GET(self, request):
-        # constraints:
-        # - only one value for each key is allowed now
         request.setHeader(_content_type_key, _content_type_value)
-        query = {
-            field: condition for field, condition
-            in (decode_query_argument(k, v) for k, v in request.args.items())
-        }
-        logs = [l for l in self.log_collection.find(query)]
-        return json.dumps({"logs": logs}, cls=MongoDocumentEncoder).encode("utf-8")
+        if request.postpath:
+            return NoResource().render(request)
+        try:
+            d = self.index_manager.status(self.group_name)
+        except ExecutorOverloaded as e:
+            return overloaded_response(request, e)
+        return respond_later(request, d.addCallback(lambda status: json.dumps(status).encode('utf-8')))
 
     def render_POST(self, request):
-        raw_log_data = request.content.getvalue().decode('utf-8')
         request.setHeader(_content_type_key, _content_type_value)
         try:
-            logs = json.loads(raw_log_data)
-            log_ids = self.log_collection.insert_many(logs).inserted_ids
-            result = {
-                'success': True,
-                'id': [str(log_id) for log_id in log_ids],
-            }
-        except JSONDecodeError as e:
-            result = {
-                'success': False,
-                "error": repr(e),
-            }
-        return json.dumps(result).encode("utf-8")
+            spec = IndexSpec.from_dict(json.loads(read_body(request).decode('utf-8')))
+            if spec.text:
+                self.storage.require(FEATURE_TEXT_SEARCH)
+        except ValueError as e:
+            request.setResponseCode(400)
+            return error_response(e)
+        except UnsupportedFeature as e:
+            return unsupported_response(request, e)
+        try:
+            self.index_manager.create(self.group_name, spec).addErrback(lambda _: None)  # status shows the error
+        except ExecutorOverloaded as e:
+            return overloaded_response(request, e)
+        request.setResponseCode(202)
+        return json.dumps({'success': True, 'index': dict(spec.to_dict(), status=STATUS_BUILDING)}).encode('utf-8')
+
+    def render_DELETE(self, request):
+        request.setHeader(_content_type_key, _content_type_value)
+        if len(request.postpath) != 1 or not request.postpath[0]:
+            return NoResource().render(request)
+        try:
+            d = self.index_manager.drop(self.group_name, request.postpath[0].decode('utf-8'))
+        except ExecutorOverloaded as e:
+            return overloaded_response(request, e)
+        return respond_later(request, d.addCallback(lambda _: json.dumps({'success': True}).encode('utf-8')))
+
+
+class ExportPage(Resource):
+    """Logs of a group in a columnar format for analytics: Arrow IPC stream(`$format=arrow`) or Parquet."""
+    isLeaf = True
 
+    def __init__(self, home, group_name, find):
+        super().__init__()
+        self.home = home
+        self.group_name = group_name
+        self.find = find
 
-class MongoDocumentEncoder(json.JSONEncoder):
-    def default(self, o):
+    def render_GET(self, request):
+        timer = self.home.metrics.track(request, ROUTE_EXPORT, self.group_name)
+        rejected_body = admission_response(self.home, request, self.group_name)
+        if rejected_body is not None:
+            return rejected_body
+        args = dict(request.args)
+        try:
+            with timer.phase(PHASE_PARSE):
+                export_format = args.pop(b'$format', [FORMAT_ARROW.encode('ascii')])[0].decode('utf-8')
+                if export_format not in CONTENT_TYPES:
+                    raise ValueError(f'$format should be {" or ".join(CONTENT_TYPES)}: {export_format}')
+                page = PageOptions.from_args(args)
+                limit_page(self.home, page)
+                plan = query_plan(self.home, request, ROUTE_EXPORT, self.group_name, args)
+                if page.search is not None:
+                    self.home.storage.require(FEATURE_TEXT_SEARCH)
+        except ValueError as e:
+            request.setHeader(_content_type_key, _content_type_value)
+            request.setResponseCode(400)
+            return error_response(e)
+        except UnsupportedFeature as e:
+            request.setHeader(_content_type_key, _content_type_value)
+            return unsupported_response(request, e)
+        batch_size = self.home.export_batch_size
+        cursor = self.find(page, plan.filter).batch_size(batch_size)
         try:
-            return str(o)
-        except KeyError:
-            return super(MongoDocumentEncoder, self).default(o)
+            producer = ExportProducer(
+                request, self.home.executor, cursor, self.home.serializer, export_format, batch_size=batch_size,
+                schema_sample=self.home.export_schema_sample, timer=timer,
+            )
+            producer.start()
+        except ImportError as e:
+            cursor.close()
+            request.setHeader(_content_type_key, _content_type_value)
+            request.setResponseCode(501)
+            return error_response(e)
+        except ExecutorOverloaded as e:
+            cursor.close()
+            request.setHeader(_content_type_key, _content_type_value)
+            return overloaded_response(request, e)
+        request.setHeader(_content_type_key, CONTENT_TYPES[export_format])
+        request.setHeader('Content-Disposition', f'attachment; filename="{self.group_name}.{export_format}"')
+        return NOT_DONE_YET
 
 
-def decode_arg_key(arg_key):
-    arg_key = arg_key.decode('utf-8')
-    for postfix, value_type in _value_type_postfix.items():
-        if arg_key.endswith(postfix):
-            def convert(value_str):
-                return value_type(value_str) if value_str else ''
-            return arg_key[:-len(postfix)], convert
-    return arg_key, str     # default
+class TailPage(Resource):
+    """Live tail of a group: the logs which are inserted after the request and matched by the query arguments
+    are pushed as Server-Sent Events, until the client closes the connection."""
+    isLeaf = True
 
+    def __init__(self, home, group_name):
+        super().__init__()
+        self.home = home
+        self.tail = home.tail
+        self.group_name = group_name
 
-def decode_query_argument(arg_key, arg_values):
-    arg_key, convert = decode_arg_key(arg_key)
-    arg_value = arg_values[0].decode('utf-8')
-    if arg_value.startswith('[') and arg_value.endswith(']'):
-        range_segments = arg_value[1:-1].split(":")
-        if len(range_segments) == 2:
-            try:
-                range_dict = {
-                    '$gte': convert(range_segments[0]),
-                    '$lt': convert(range_segments[1]),
-                }
-                return arg_key, {k: v for k, v in range_dict.items() if v}
-            except ValueError:
-                raise
-    return arg_key, convert(arg_value)
+    def render_GET(self, request):
+        rejected_body = admission_response(self.home, request, self.group_name)
+        if rejected_body is not None:
+            return rejected_body
+        try:
+            plan = query_plan(self.home, request, 'tail', self.group_name, dict(request.args))
+        except ValueError as e:
+            request.setHeader(_content_type_key, _content_type_value)
+            request.setResponseCode(400)
+            return error_response(e)
+        try:
+            self.tail.subscribe(request, self.group_name, plan.matches)
+        except TooManySubscribers as e:
+            request.setHeader(_content_type_key, _content_type_value)
+            return overloaded_response(request, e)
+        return NOT_DONE_YET
 
 
-if __name__ == '__main__':
-    mongo_host = 'mongo'
-    connection = pymongo.MongoClient(f'mongodb://{mongo_host}')
-    print(f'simplog > connect to database...')
-
-    root = SimplogHome(connection)
-    site_factory = Site(root)
-    server_port = 8080
-    reactor.listenTCP(server_port, site_factory)
-    print(f'simplog > listening {server_port}...')
+class MetricsPage(Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(_content_type_key, METRICS_CONTENT_TYPE)
+        return self.metrics.render()
+
+
+def respond_later(request, d, timer=None):
+    """Writes the result(bytes) of `d` as the response, or 500 if it fails.
+
+    The time of writing the response is added to `timer`(RequestTimer) if given.
+    """
+    finished = [False]
+
+    def on_finish(_):
+        finished[0] = True
+    request.notifyFinish().addBoth(on_finish)
+
+    def write_response(body):
+        if not finished[0]:
+            if timer is not None:
+                with timer.phase(PHASE_WRITE):
+                    request.write(body)
+            else:
+                request.write(body)
+            request.finish()
+
+    def write_error(failure):
+        if failure.check(ExecutorOverloaded):   # e.g. the spool is full
+            if not finished[0]:
+                request.write(overloaded_response(request, failure.value))
+                request.finish()
+            return
+        if failure.check(UnsupportedFeature):   # e.g. a query the storage can not run
+            if not finished[0]:
+                request.write(unsupported_response(request, failure.value))
+                request.finish()
+            return
+        log.err(failure, 'simplog > request failed')
+        if not finished[0]:
+            request.setResponseCode(500)
+            request.write(error_response(failure.value))
+            request.finish()
+
+    d.addCallbacks(write_response, write_error)
+    return NOT_DONE_YET
+
+
+def cached_response(request, cache, group_name, cache_key):
+    """Returns the cached body(or empty body with 304 if the etag matches) of the request, or None if not cached."""
+    entry = cache.lookup(group_name, cache_key)
+    if entry is None:
+        return None
+    request.setHeader(_etag_key, entry.etag)
+    if etag_matches(request, entry.etag):
+        request.setResponseCode(304)
+        return b''
+    return entry.body
+
+
+def cache_filler(request, cache, group_name, cache_key):
+    """Sets the etag of a response which is not cached, and returns the function to store the response body."""
+    version, etag = cache.version(group_name), cache.new_etag()
+    request.setHeader(_etag_key, etag)
+
+    def on_complete(body):
+        cache.store(group_name, cache_key, version, etag, body)
+    return on_complete
+
+
+def decode_logs(raw_log_data, schema=None, ingested=None):
+    """Returns the logs of a JSON body, normalized by `schema`(GroupSchema) of the group if given."""
+    logs = json.loads(raw_log_data.decode('utf-8'))
+    if not isinstance(logs, list):
+        raise TypeError(f'logs should be list: {type(logs).__name__}')
+    for log_object in logs:
+        if not isinstance(log_object, dict):
+            raise TypeError(f'log should be object: {type(log_object).__name__}')
+    if schema is not None:
+        schema.normalize_all(logs, ingested)
+    return logs
+
+
+def inserted_response(log_ids):
+    return json.dumps({
+        'success': True,
+        'id': [str(log_id) for log_id in log_ids],
+    }).encode("utf-8")
+
+
+def error_response(e):
+    return json.dumps({'success': False, 'error': repr(e)}).encode("utf-8")
+
+
+def overloaded_response(request, e):
+    request.setResponseCode(503)
+    request.setHeader(_retry_after_key, _retry_after_value)
+    return error_response(e)
+
+
+def unsupported_response(request, e):
+    request.setResponseCode(501)
+    return error_response(e)
+
+
+def admission_response(home, request, group_name, write=False):
+    """Returns the error response of a request which is not admitted by `home.admission`(AdmissionControl),
+    or None if it is admitted: 413 for a too large body, 429 for used up quotas and 503 for too many reads."""
+    admission = home.admission
+    if admission is None:
+        return None
+    size = body_size(request) if write else 0
+    try:
+        if getattr(request, 'body_too_large', False) or \
+                (admission.max_body_bytes is not None and size > admission.max_body_bytes):
+            request.setHeader(_content_type_key, _content_type_value)
+            request.setResponseCode(413)
+            return error_response(ValueError(f'request body should be at most {admission.max_body_bytes} bytes'))
+        admission.admit(group_name, client_of(request), write=write, size=size)
+    except QuotaExceeded as e:
+        request.setHeader(_content_type_key, _content_type_value)
+        return quota_response(request, e)
+    except ExecutorOverloaded as e:
+        request.setHeader(_content_type_key, _content_type_value)
+        return overloaded_response(request, e)
+    return None
+
+
+def quota_response(request, e):
+    request.setResponseCode(429)
+    request.setHeader(_retry_after_key, str(e.retry_after))
+    return error_response(e)
+
+
+def charge_docs(home, request, group_name, docs):
+    if home.admission is not None:
+        home.admission.charge_docs(group_name, client_of(request), docs)
+
+
+def limit_page(home, page):
+    if home.admission is not None:
+        home.admission.limit_page(page)
+
+
+def client_of(request):
+    return getattr(request.getClientAddress(), 'host', '')
+
+
+def body_size(request):
+    length = request.getHeader(b'Content-Length')
+    if length is not None and length.isdigit():
+        return int(length)
+    request.content.seek(0, os.SEEK_END)
+    return request.content.tell()
+
+
+def read_body(request):
+    # large request bodies are in a temporary file rather than BytesIO
+    request.content.seek(0)
+    return request.content.read()
+
+
+def find_logs(home, group_name, page, query):
+    """Returns the cursor of the logs of a group found by `page`(PageOptions), of all partitions if partitioned."""
+    retention = home.retention
+    if not retention.partitioned(group_name):
+        return page.find(home.log_db[group_name], query)
+    return MergedCursor(
+        lambda: retention.group_collections(group_name, query),
+        lambda collection: page.find(collection, query), sort=page.sort(), limit=page.limit,
+    )
+
+
+def query_plan(home, request, route, group_name, args):
+    """Returns the QueryPlan of query arguments(request.args without the reserved arguments of the route),
+    which is compiled once for each query string of the route(and the group if it has a schema)."""
+    query_string = request.uri.partition(b'?')[2]
+    schema = home.schemas.get(group_name)
+    if schema is None:
+        return home.queries.compile((route, query_string), args)
+    return home.queries.compile((route, group_name, query_string), args, schema.query_types)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simple standalone log server.')
+    parser.add_argument('--storage', type=str, choices=[STORAGE_MONGO, STORAGE_SQLITE], default=STORAGE_MONGO,
+                        help='store logs in mongodb, or in an embedded SQLite file(without aggregations, $search, '
+                             'retention and change streams)')
+    parser.add_argument('--sqlite-path', type=str, default='simplog.db', help='database file of --storage sqlite')
+    parser.add_argument('--mongo-host', type=str, default='mongo', help='database host address')
+    parser.add_argument('-p', dest='port', type=int, default=8080, help='port number')
+    parser.add_argument('--db-config', type=str, default=None,
+                        help='JSON file of database options: {"uri": ..., "max_pool_size": ..., ...}, '
+                             'overridden by SIMPLOG_MONGO_{OPTION} environment variables')
+    parser.add_argument('--breaker-failures', type=int, default=5,
+                        help='fail fast with 503 after N consecutive database connection errors, 0 to disable')
+    parser.add_argument('--breaker-reset', type=float, default=10.0,
+                        help='seconds to fail fast before trying the database again')
+    parser.add_argument('--db-workers', type=int, default=10, help='max number of concurrent database calls')
+    parser.add_argument('--db-queue', type=int, default=100,
+                        help='max number of database calls waiting for a worker, 503 is returned beyond it')
+    parser.add_argument('--index-config', type=str, default=None,
+                        help='JSON file of indexes to create at startup: {"{group}": [{"keys": [...]}, ...]}')
+    parser.add_argument('--auto-index', type=int, default=None, metavar='N',
+                        help='create an index of a field when it is used in N queries of a group')
+    parser.add_argument('--retention-config', type=str, default=None,
+                        help='JSON file of retention policies of groups: {"{group}": {"ttl": seconds}, ...}')
+    parser.add_argument('--retention-interval', type=float, default=60.0,
+                        help='seconds between the checks of expired partitions')
+    parser.add_argument('--schema-config', type=str, default=None,
+                        help='JSON file of ingest schemas of groups: {"{group}": {"fields": {"{field}": "int"}}, ...}, '
+                             'field types are int, float, date and string')
+    parser.add_argument('--ingest-batch-size', type=int, default=1000,
+                        help='number of logs inserted at once in NDJSON POST requests')
+    parser.add_argument('--write-buffer', type=int, default=None, metavar='SIZE',
+                        help='buffer small POST requests of a group and insert them at once '
+                             'when SIZE logs are buffered')
+    parser.add_argument('--write-buffer-delay', type=float, default=0.05,
+                        help='max seconds to keep logs in the write buffer')
+    parser.add_argument('--write-ack', type=str, choices=[ACK_BUFFERED, ACK_DURABLE], default=ACK_DURABLE,
+                        help='respond to buffered POST requests when the logs are buffered or written')
+    parser.add_argument('--spool', type=str, default=None, metavar='DIR',
+                        help='append POSTed logs to a local spool in DIR and respond, '
+                             'and insert them into the database in the background')
+    parser.add_argument('--spool-fsync', type=str, choices=[FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER],
+                        default=FSYNC_INTERVAL, help='sync the spool to the disk on every POST, periodically or never')
+    parser.add_argument('--spool-fsync-interval', type=float, default=1.0, help='seconds between syncs of the spool')
+    parser.add_argument('--spool-segment-bytes', type=int, default=64 * 1024 * 1024,
+                        help='size of a spool file, drained files are deleted')
+    parser.add_argument('--spool-max-bytes', type=int, default=1024 * 1024 * 1024,
+                        help='max size of the logs not inserted yet, 503 is returned beyond it')
+    parser.add_argument('--quota-config', type=str, default=None,
+                        help='JSON file of token-bucket quotas of groups and clients(IP addresses): '
+                             '{"groups": {"{group}": {"requests": ..., "docs": ..., "bytes": ...}, "*": {...}}, '
+                             '"clients": {...}}, 429 is returned beyond them')
+    parser.add_argument('--max-body-bytes', type=int, default=None,
+                        help='max size of request bodies, 413 is returned beyond it')
+    parser.add_argument('--max-result-logs', type=int, default=None,
+                        help='max number of logs in a GET response, the rest are in the next pages')
+    parser.add_argument('--read-share', type=float, default=0.8,
+                        help='share of --db-workers and --db-queue which reads can use, '
+                             'the rest is kept for writes and 503 is returned to reads beyond it')
+    parser.add_argument('--serializer', type=str, choices=[SERIALIZER_AUTO, SERIALIZER_ORJSON, SERIALIZER_JSON],
+                        default=SERIALIZER_AUTO, help='JSON encoder of GET responses, auto uses orjson if installed')
+    parser.add_argument('--cache', type=int, default=None, metavar='ENTRIES',
+                        help='cache at most ENTRIES GET responses, invalidated on POST to the group')
+    parser.add_argument('--cache-ttl', type=float, default=5.0, help='seconds to keep a cached GET response')
+    parser.add_argument('--cache-max-bytes', type=int, default=64 * 1024 * 1024, help='max total size of the cache')
+    parser.add_argument('--cache-max-entry-bytes', type=int, default=1024 * 1024,
+                        help='max size of a cached GET response, larger ones are not cached')
+    parser.add_argument('--query-plans', type=int, default=1000,
+                        help='number of compiled query plans kept for repeated query strings')
+    parser.add_argument('--tail-source', type=str, choices=[SOURCE_INGEST, SOURCE_CHANGE_STREAM],
+                        default=SOURCE_INGEST,
+                        help='push logs to tail subscribers from POST requests of the process, '
+                             'or from a change stream of the database(requires a replica set, for --workers)')
+    parser.add_argument('--tail-max-subscribers', type=int, default=10000,
+                        help='max number of tail subscribers, 503 is returned beyond it')
+    parser.add_argument('--metrics-max-groups', type=int, default=100,
+                        help='max number of groups labelled in /metrics, the other groups are counted as _other')
+    parser.add_argument('--fanout-max-groups', type=int, default=100,
+                        help='max number of groups read by a query of several groups(GET /groups?$groups=...)')
+    parser.add_argument('--stream-batch-size', type=int, default=500,
+                        help='number of logs read from the database and written at once in GET responses')
+    parser.add_argument('--export-batch-size', type=int, default=10000,
+                        help='number of logs in a record batch(row group) of exports')
+    parser.add_argument('--export-schema-sample', type=int, default=10000,
+                        help='number of logs from which the columns of exports are inferred, they are held until then')
+    parser.add_argument('--compression', type=str, default=','.join(available_encodings()),
+                        help='response encodings negotiated by Accept-Encoding in the order of preference, '
+                             f'of {", ".join(available_encodings())}, or none')
+    parser.add_argument('--compression-min-bytes', type=int, default=1024,
+                        help='compress responses of at least the given bytes, smaller ones are sent as is')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of server processes sharing the port, each has its own database connection')
+    parser.add_argument('--heartbeat-timeout', type=float, default=30.0,
+                        help='kill a server process which does not respond for the given seconds')
+    parser.add_argument('--worker-fd', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--heartbeat-fd', type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run_supervisor(args, argv):
+    supervisor = WorkerSupervisor(args.port, args.workers, argv, heartbeat_timeout=args.heartbeat_timeout)
+    supervisor.start()
+    install_signal_handlers(supervisor)
+    reactor.addSystemEventTrigger('before', 'shutdown', supervisor.stop)
+    print(f'simplog > listening {args.port} with {args.workers} workers...')
     reactor.run()
+
+
+def open_storage(args, connection=None):
+    if connection is not None:
+        return get_storage(connection)
+    if args.storage == STORAGE_SQLITE:
+        print(f'simplog > open {args.sqlite_path}...')
+        storage = SQLiteEngine(args.sqlite_path)
+    else:
+        print(f'simplog > connect to database...')
+        storage = MongoEngine(DatabaseConfig.load(f'mongodb://{args.mongo_host}', args.db_config).connect())
+    if args.retention_config:
+        storage.require(FEATURE_RETENTION)
+    if args.tail_source == SOURCE_CHANGE_STREAM:
+        storage.require(FEATURE_CHANGE_STREAM)
+    return storage
+
+
+def run_server(args, connection=None):
+    try:
+        storage = open_storage(args, connection)
+    except UnsupportedFeature as e:
+        sys.exit(f'simplog > {e}')
+    reactor.addSystemEventTrigger('after', 'shutdown', storage.close)
+
+    breaker = None
+    if args.breaker_failures > 0:
+        breaker = CircuitBreaker(failure_threshold=args.breaker_failures, reset_timeout=args.breaker_reset)
+    executor = BoundedExecutor(max_workers=args.db_workers, max_queue=args.db_queue, breaker=breaker)
+    executor.start()
+    reactor.addSystemEventTrigger('during', 'shutdown', executor.stop)
+
+    retention = RetentionManager(storage.log_db, executor, check_interval=args.retention_interval)
+    if args.retention_config:
+        retention.load_config(args.retention_config)
+    retention.start()
+    reactor.addSystemEventTrigger('before', 'shutdown', retention.stop)
+
+    index_manager = IndexManager(
+        storage.log_db, executor, auto_index_threshold=args.auto_index, retention=retention,
+    )
+    if args.index_config:
+        index_manager.load_config(args.index_config)
+
+    schemas = IngestSchemas()
+    if args.schema_config:
+        schemas.load_config(args.schema_config)
+
+    admission = AdmissionControl(
+        executor=executor, read_share=args.read_share, max_body_bytes=args.max_body_bytes,
+        max_result_logs=args.max_result_logs,
+    )
+    if args.quota_config:
+        admission.load_config(args.quota_config)
+
+    cache = None
+    if args.cache:
+        cache = ResponseCache(
+            max_entries=args.cache, max_bytes=args.cache_max_bytes, max_entry_bytes=args.cache_max_entry_bytes,
+            ttl=args.cache_ttl,
+        )
+
+    spool, write_executor, insert_collection = None, executor, retention.insert_collection
+    if args.spool:
+        spool = Spool(
+            args.spool, segment_bytes=args.spool_segment_bytes, max_bytes=args.spool_max_bytes, fsync=args.spool_fsync,
+            fsync_interval=args.spool_fsync_interval,
+        )
+        spool.open()
+        spool.start()
+        # appends to the spool do not wait for the database, nor fail fast with it
+        write_executor = BoundedExecutor(max_workers=2, max_queue=args.db_queue, name='simplog-spool')
+        write_executor.start()
+        drainer = SpoolDrainer(
+            spool, executor, retention.insert_collection, batch_size=args.ingest_batch_size,
+            on_drained=cache.invalidate if cache is not None else None,
+        )
+        drainer.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', drainer.stop)
+        reactor.addSystemEventTrigger('during', 'shutdown', write_executor.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', spool.close)
+        insert_collection = functools.partial(SpoolCollection, spool)
+        print(f'simplog > spool {args.spool}: {spool.size} bytes to insert...')
+
+    write_buffers = None
+    if args.write_buffer:
+        write_buffers = WriteBuffers(
+            storage.log_db, write_executor, max_size=args.write_buffer, max_delay=args.write_buffer_delay,
+            ack=args.write_ack, insert_collection=insert_collection,
+        )
+        reactor.addSystemEventTrigger('before', 'shutdown', write_buffers.close)
+
+    metrics = Metrics(max_groups=args.metrics_max_groups)
+    lag_monitor = ReactorLagMonitor(metrics)
+    lag_monitor.start()
+    reactor.addSystemEventTrigger('before', 'shutdown', lag_monitor.stop)
+
+    serializer = get_serializer(args.serializer)
+    tail = TailHub(serializer, source=args.tail_source, max_subscribers=args.tail_max_subscribers)
+    tail.start()
+    reactor.addSystemEventTrigger('before', 'shutdown', tail.stop)
+    if args.tail_source == SOURCE_CHANGE_STREAM:
+        change_stream = ChangeStreamSource(storage.log_db, tail, group_of=retention.group_of)
+        change_stream.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', change_stream.stop)
+
+    root = SimplogHome(
+        storage, executor,
+        stream_batch_size=args.stream_batch_size, index_manager=index_manager, ingest_batch_size=args.ingest_batch_size,
+        write_buffers=write_buffers, serializer=serializer, cache=cache, metrics=metrics, retention=retention,
+        tail=tail, queries=QueryPlanCache(max_entries=args.query_plans), export_batch_size=args.export_batch_size,
+        spool=spool, write_executor=write_executor, schemas=schemas, fanout_max_groups=args.fanout_max_groups,
+        admission=admission, export_schema_sample=args.export_schema_sample,
+    )
+    compression = None
+    if args.compression != 'none':
+        compression = ResponseCompression(
+            [encoding.strip() for encoding in args.compression.split(',')], min_bytes=args.compression_min_bytes,
+        )
+    site_factory = CompressingSite(root, compression=compression, requestFactory=LimitedRequest)
+    site_factory.max_body_bytes = args.max_body_bytes
+    if args.worker_fd is not None:
+        reactor.adoptStreamPort(args.worker_fd, socket.AF_INET, site_factory)
+        os.close(args.worker_fd)
+        start_heartbeat(args.heartbeat_fd)
+        print(f'simplog > worker {os.getpid()} started...')
+    else:
+        server_port = args.port
+        reactor.listenTCP(server_port, site_factory)
+        print(f'simplog > listening {server_port}...')
+    reactor.run()
+
+
+if __name__ == '__main__':
+    globalLogBeginner.beginLoggingTo([textFileLogObserver(sys.stderr)], redirectStandardIO=False)
+    cli_args = parse_args()
+    if cli_args.workers > 1 and cli_args.worker_fd is None:
+        run_supervisor(cli_args, sys.argv[1:] + ['--workers', '1'])
+    else:
+        run_server(cli_args)
@@ -0,0 +1,123 @@
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from twisted.internet import reactor as default_reactor
+from twisted.internet.defer import Deferred, DeferredList, succeed
+from twisted.python import log
+
+ACK_BUFFERED = 'buffered'
+ACK_DURABLE = 'durable'
+
+
+class BufferedWriteError(Exception):
+    pass
+
+
+class WriteBuffer:
+    """Coalesces the inserts of a group across requests into one insert_many.
+
+    Logs are flushed when `max_size` logs are buffered or `max_delay` seconds passed since the first one.
+    _id is assigned when the logs are added, so the ids are known before they are written.
+    """
+    def __init__(self, collection, executor, max_size=1000, max_delay=0.05, reactor=None):
+        self.collection = collection
+        self.executor = executor
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.reactor = reactor or default_reactor
+        self.logs = []
+        self.waiters = []       # (Deferred, start index, end index) of each add()
+        self.timer = None
+        self.flushing = set()
+
+    def add(self, logs):
+        """Buffers `logs` and returns a Deferred which fires with their ids after they are written."""
+        for log_object in logs:
+            if '_id' not in log_object:
+                log_object['_id'] = ObjectId()
+        d = Deferred()
+        start = len(self.logs)
+        self.logs.extend(logs)
+        self.waiters.append((d, start, len(self.logs)))
+        if len(self.logs) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.reactor.callLater(self.max_delay, self.flush)
+        return d
+
+    def flush(self):
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        if not self.logs:
+            return succeed(None)
+        logs, waiters = self.logs, self.waiters
+        self.logs, self.waiters = [], []
+        d = self.executor.submit_admitted(self._insert, logs)
+        self.flushing.add(d)
+        d.addCallbacks(self._notify_written, self._notify_failed, callbackArgs=(logs, waiters),
+                       errbackArgs=(waiters,))
+        d.addBoth(self._flush_done, d)
+        return d
+
+    def close(self):
+        """Flushes the buffered logs and returns a Deferred which fires when all flushes are done."""
+        self.flush()
+        return DeferredList(list(self.flushing))
+
+    def _insert(self, logs):
+        # runs in a worker thread of the executor
+        try:
+            self.collection.insert_many(logs, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {write_error['index']: write_error.get('errmsg') for write_error in e.details['writeErrors']}
+
+    def _notify_written(self, failed, logs, waiters):
+        for d, start, end in waiters:
+            errors = [failed[i] for i in range(start, end) if i in failed]
+            if errors:
+                d.errback(BufferedWriteError(errors))
+            else:
+                d.callback([log_object['_id'] for log_object in logs[start:end]])
+
+    def _notify_failed(self, failure, waiters):
+        log.err(failure, f'simplog > failed to flush buffered logs of {self.collection.name}')
+        for d, _, _ in waiters:
+            d.errback(failure)
+
+    def _flush_done(self, result, d):
+        self.flushing.discard(d)
+
+
+class WriteBuffers:
+    """WriteBuffer of each group.
+
+    With ACK_BUFFERED, POST requests are answered when the logs are buffered,
+    with ACK_DURABLE, when the logs are written to the database.
+    `insert_collection(group_name)` returns the collection to insert the logs of a group, `log_db[group_name]`
+    by default.
+    """
+    def __init__(self, log_db, executor, max_size=1000, max_delay=0.05, ack=ACK_DURABLE, reactor=None,
+                 insert_collection=None):
+        if ack not in (ACK_BUFFERED, ACK_DURABLE):
+            raise ValueError(f'unknown ack: {ack}')
+        self.log_db = log_db
+        self.executor = executor
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.ack = ack
+        self.reactor = reactor
+        self.insert_collection = insert_collection or (lambda group_name: log_db[group_name])
+        self.buffers = {}
+
+    def get(self, group_name):
+        if group_name not in self.buffers:
+            self.buffers[group_name] = WriteBuffer(
+                self.insert_collection(group_name), self.executor,
+                max_size=self.max_size, max_delay=self.max_delay, reactor=self.reactor,
+            )
+        return self.buffers[group_name]
+
+    def close(self):
+        return DeferredList([write_buffer.close() for write_buffer in self.buffers.values()])
@@ -0,0 +1,83 @@
+import os
+import time
+from collections import OrderedDict, defaultdict
+
+
+class CacheEntry:
+    def __init__(self, etag, body, version, expires):
+        self.etag = etag
+        self.body = body
+        self.version = version
+        self.expires = expires
+
+
+class ResponseCache:
+    """LRU cache of serialized GET responses, keyed by group and normalized query arguments.
+
+    Entries are evicted when they are older than `ttl` seconds, or the least recently used ones
+    when there are more than `max_entries` entries or `max_bytes` bytes.
+    Each group has a version which is increased by `invalidate`(on writes), and the response of a query
+    which started before the version was increased is not stored.
+    """
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, max_entry_bytes=1024 * 1024, ttl=5.0,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()        # (group, key) -> CacheEntry
+        self.size = 0
+        self.versions = defaultdict(int)    # group -> version
+        self.etag_prefix = os.urandom(4).hex()     # etags of other server processes do not match
+        self.etag_seq = 0
+
+    @staticmethod
+    def normalize(args):
+        """Returns the cache key of query arguments(request.args)."""
+        return tuple(sorted((k, tuple(v)) for k, v in args.items()))
+
+    def version(self, group_name):
+        return self.versions[group_name]
+
+    def new_etag(self):
+        self.etag_seq += 1
+        return f'"{self.etag_prefix}-{self.etag_seq}"'
+
+    def lookup(self, group_name, key):
+        entry = self.entries.get((group_name, key))
+        if entry is None:
+            return None
+        if entry.expires <= self.clock() or entry.version != self.versions[group_name]:
+            self._remove((group_name, key))
+            return None
+        self.entries.move_to_end((group_name, key))
+        return entry
+
+    def store(self, group_name, key, version, etag, body):
+        if version != self.versions[group_name] or len(body) > self.max_entry_bytes:
+            return False
+        self._remove((group_name, key))
+        self.entries[(group_name, key)] = CacheEntry(etag, body, version, self.clock() + self.ttl)
+        self.size += len(body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+        return True
+
+    def invalidate(self, group_name):
+        self.versions[group_name] += 1
+        for cache_key in [cache_key for cache_key in self.entries if cache_key[0] == group_name]:
+            self._remove(cache_key)
+
+    def _remove(self, cache_key):
+        entry = self.entries.pop(cache_key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+
+def etag_matches(request, etag):
+    if_none_match = request.getHeader(b'If-None-Match')
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.decode('ascii', 'replace').split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
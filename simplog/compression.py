@@ -0,0 +1,192 @@
+import zlib
+
+from twisted.web.http import NO_BODY_CODES
+from twisted.web.server import Request, Site
+
+try:
+    import zstandard
+except ImportError:     # optional
+    zstandard = None
+try:
+    import brotli
+except ImportError:     # optional
+    brotli = None
+
+ENCODING_GZIP = 'gzip'
+ENCODING_ZSTD = 'zstd'
+ENCODING_BROTLI = 'br'
+
+# content types which are not compressed: events should not wait for more events, parquet is compressed already
+_uncompressed_content_types = ('text/event-stream', 'application/vnd.apache.parquet')
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+# encoding -> (compressor, default level), in the order of preference
+_compressors = {
+    ENCODING_ZSTD: (_ZstdCompressor, 3),
+    ENCODING_BROTLI: (_BrotliCompressor, 4),
+    ENCODING_GZIP: (_GzipCompressor, 6),
+}
+
+
+def available_encodings():
+    """Returns the response encodings whose libraries are installed, in the order of preference."""
+    return [
+        encoding for encoding in _compressors
+        if (encoding != ENCODING_ZSTD or zstandard is not None) and (encoding != ENCODING_BROTLI or brotli is not None)
+    ]
+
+
+def negotiate(accept_encoding, encodings):
+    """Returns the encoding of `encodings` with the highest q-value in Accept-Encoding, or None.
+
+    Encodings of the same q-value are chosen in the order of `encodings`.
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class ResponseCompression:
+    """Settings of the response compression: bodies of at least `min_bytes` are compressed by one of `encodings`
+    accepted by the client(Accept-Encoding). `levels` overrides the default levels of encodings."""
+    def __init__(self, encodings=None, min_bytes=1024, levels=None):
+        available = available_encodings()
+        encodings = available if encodings is None else encodings
+        for encoding in encodings:
+            if encoding not in available:
+                raise ValueError(f'unsupported response encoding: {encoding}')
+        self.encodings = encodings
+        self.min_bytes = min_bytes
+        self.levels = {encoding: level for encoding, (_, level) in _compressors.items()}
+        self.levels.update(levels or {})
+
+    def compressible(self, request):
+        """Tells whether the response may be compressed, by its status code and content type."""
+        if request.method == b'HEAD' or request._inFakeHead or request.code in NO_BODY_CODES:
+            return False
+        content_type = request.responseHeaders.getRawHeaders(b'Content-Type', [b''])[0]
+        return content_type.decode('ascii', 'replace').split(';')[0].strip().lower() not in _uncompressed_content_types
+
+    def encoding_for(self, request):
+        accept_encoding = request.getHeader(b'Accept-Encoding')
+        return negotiate(accept_encoding.decode('ascii', 'replace') if accept_encoding else None, self.encodings)
+
+    def compressor(self, encoding):
+        compressor_type, _ = _compressors[encoding]
+        return compressor_type(self.levels[encoding])
+
+
+class CompressingRequest(Request):
+    """Request which compresses the response body by `site.compression`(ResponseCompression).
+
+    Both whole and streamed bodies are compressed, and each write is flushed so streamed batches are not delayed.
+    The body is held until `min_bytes` are written, and sent as is if it finishes before that.
+    Strong ETags become weak ones, since compressed bodies are not the same bytes.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoding = None
+        self.compressor = None
+        self.pending = None     # body held until deciding whether to compress it
+        self.compression_decided = False
+
+    def write(self, data):
+        if not self.compression_decided:
+            self.compression_decided = True
+            self._decide()
+        if self.pending is not None:
+            self.pending += data
+            if len(self.pending) < self.channel.site.compression.min_bytes:
+                return
+            data, self.pending = bytes(self.pending), None
+            self._start_compression()
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        if data or not self.startedWriting:     # an empty write sends the headers, e.g. of 304 and HEAD
+            super().write(data)
+
+    def finish(self):
+        # an empty body is not compressed
+        self.compression_decided = True
+        if self.pending is not None:
+            data, self.pending = bytes(self.pending), None
+            if data:
+                super().write(data)
+        elif self.compressor is not None and not self._disconnected:
+            super().write(self.compressor.finish())
+        return super().finish()
+
+    def _decide(self):
+        compression = getattr(self.channel.site, 'compression', None)
+        if compression is None or self.startedWriting or not compression.compressible(self):
+            return
+        self.responseHeaders.addRawHeader(b'Vary', b'Accept-Encoding')
+        self.encoding = compression.encoding_for(self)
+        if self.encoding is not None:
+            self.pending = bytearray()
+
+    def _start_compression(self):
+        self.compressor = self.channel.site.compression.compressor(self.encoding)
+        self.responseHeaders.setRawHeaders(b'Content-Encoding', [self.encoding.encode('ascii')])
+        self.responseHeaders.removeHeader(b'Content-Length')
+        etag = self.responseHeaders.getRawHeaders(b'ETag')
+        if etag and not etag[0].startswith(b'W/'):
+            self.responseHeaders.setRawHeaders(b'ETag', [b'W/' + etag[0]])
+
+
+class CompressingSite(Site):
+    requestFactory = CompressingRequest
+
+    def __init__(self, resource, compression=None, **kwargs):
+        super().__init__(resource, **kwargs)
+        self.compression = compression
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+
+import pymongo
+from pymongo.errors import ConnectionFailure
+from twisted.python.failure import Failure
+
+from simplog.executor import ExecutorOverloaded
+
+_env_prefix = 'SIMPLOG_MONGO_'
+_read_preferences = ('primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest')
+_booleans = {'true': True, 'false': False, '1': True, '0': False}
+
+# config key -> (MongoClient option, type, multiplier), timeouts are in seconds in the config
+_client_options = {
+    'max_pool_size': ('maxPoolSize', int, None),
+    'min_pool_size': ('minPoolSize', int, None),
+    'server_selection_timeout': ('serverSelectionTimeoutMS', float, 1000),
+    'connect_timeout': ('connectTimeoutMS', float, 1000),
+    'socket_timeout': ('socketTimeoutMS', float, 1000),
+    'wait_queue_timeout': ('waitQueueTimeoutMS', float, 1000),
+    'read_preference': ('readPreference', str, None),
+    'max_staleness': ('maxStalenessSeconds', int, None),
+    'retry_reads': ('retryReads', bool, None),
+    'retry_writes': ('retryWrites', bool, None),
+}
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class InvalidDatabaseConfig(ValueError):
+    pass
+
+
+class DatabaseUnavailable(ExecutorOverloaded):
+    pass
+
+
+class DatabaseConfig:
+    """Connection options of the database: {"uri": "mongodb://...", "max_pool_size": 20, ...}
+
+    Timeouts are in seconds. Options are read from a JSON file, and then from environment variables
+    of the upper case option names prefixed with SIMPLOG_MONGO_(e.g. SIMPLOG_MONGO_READ_PREFERENCE).
+    With `read_preference` of secondaries, find queries and aggregations are read from secondaries,
+    and writes are always sent to the primary.
+    """
+    defaults = {
+        'server_selection_timeout': 5.0,
+        'connect_timeout': 5.0,
+        'socket_timeout': 60.0,
+        'wait_queue_timeout': 5.0,
+    }
+
+    def __init__(self, uri, options=None):
+        self.uri = uri
+        self.options = dict(self.defaults, **(options or {}))
+
+    @classmethod
+    def load(cls, uri, path=None, environ=None):
+        """Returns the config of `uri` overridden by the JSON file of `path` and the environment variables."""
+        config = {}
+        if path is not None:
+            with open(path, encoding='utf-8') as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise InvalidDatabaseConfig(f'database config should be object: {config}')
+        environ = os.environ if environ is None else environ
+        for key in ['uri'] + list(_client_options):
+            env_value = environ.get(_env_prefix + key.upper())
+            if env_value is not None:
+                config[key] = env_value
+        return cls.from_dict(dict(config, uri=config.get('uri', uri)))
+
+    @classmethod
+    def from_dict(cls, config):
+        options = {}
+        for key, value in config.items():
+            if key == 'uri':
+                continue
+            if key not in _client_options:
+                raise InvalidDatabaseConfig(f'unknown database option: {key}')
+            options[key] = _convert(key, value, _client_options[key][1])
+        if options.get('read_preference', 'primary') not in _read_preferences:
+            raise InvalidDatabaseConfig(f'read_preference should be one of {", ".join(_read_preferences)}')
+        return cls(config['uri'], options)
+
+    def client_options(self):
+        client_options = {}
+        for key, value in self.options.items():
+            if value is None:
+                continue
+            option, _, multiplier = _client_options[key]
+            client_options[option] = int(value * multiplier) if multiplier else value
+        return client_options
+
+    def connect(self, **kwargs):
+        return pymongo.MongoClient(self.uri, **dict(self.client_options(), **kwargs))
+
+
+def _convert(key, value, value_type):
+    if value is None:
+        return None
+    if isinstance(value, str) and value_type is bool:     # environment variables are strings
+        value = _booleans.get(value.lower(), value)
+    elif isinstance(value, str) and value_type is not str:
+        try:
+            value = value_type(value)
+        except ValueError:
+            pass
+    valid_types = (int, float) if value_type is float else (value_type,)
+    if not isinstance(value, valid_types) or (value_type is not bool and isinstance(value, bool)):
+        raise InvalidDatabaseConfig(f'{key} should be {value_type.__name__}: {value}')
+    if value_type in (int, float) and value < 0:
+        raise InvalidDatabaseConfig(f'{key} should not be negative: {value}')
+    return value
+
+
+class CircuitBreaker:
+    """Fails database calls fast while the database is unhealthy.
+
+    The circuit opens after `failure_threshold` consecutive calls failed with connection errors(e.g. server
+    selection or socket timeouts), and calls are rejected with DatabaseUnavailable for `reset_timeout` seconds.
+    Then one call is let through(half open): the circuit closes if it succeeds, otherwise opens again.
+    Only the result of that trial call changes the state of an open circuit, results of the other calls
+    (admitted before the circuit opened, or follow-up calls) do not.
+    Calls are admitted and recorded in the reactor thread.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=10.0, failure_types=(ConnectionFailure,),
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_types = failure_types
+        self.clock = clock
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial = None   # token of the trial call while half open
+
+    def admit(self):
+        """Raises DatabaseUnavailable if a call should not be sent to the database now.
+
+        Returns the token of the trial call while half open, which is passed to `record` with its result,
+        or None.
+        """
+        if self.state == CIRCUIT_CLOSED:
+            return None
+        if self.state == CIRCUIT_OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = CIRCUIT_HALF_OPEN
+        if self.state == CIRCUIT_HALF_OPEN and self.trial is None:
+            self.trial = object()
+            return self.trial
+        raise DatabaseUnavailable(f'database is unavailable after {self.failures} failed calls')
+
+    def record(self, result, trial=None):
+        """Records the result of a call(a Failure if it failed) admitted with `trial`(token of admit),
+        and returns the result."""
+        failed = isinstance(result, Failure) and result.check(*self.failure_types) is not None
+        if trial is not None:
+            if trial is not self.trial:
+                return result
+            self.trial = None
+            if failed:
+                self.failures += 1
+                self._open()
+            else:
+                self.failures = 0
+                self.state = CIRCUIT_CLOSED
+        elif self.state == CIRCUIT_CLOSED:
+            if failed:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self.failures = 0
+        return result
+
+    def _open(self):
+        self.state = CIRCUIT_OPEN
+        self.opened_at = self.clock()
@@ -0,0 +1,64 @@
+from twisted.internet import reactor as default_reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+
+class ExecutorOverloaded(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Runs blocking calls (e.g. pymongo) in a thread pool, off the reactor thread.
+
+    At most `max_workers` calls run at the same time and at most `max_queue` calls wait for a worker.
+    `submit` raises ExecutorOverloaded when both are full, so callers can shed load immediately.
+    With `breaker`(CircuitBreaker), `submit` also raises its DatabaseUnavailable(an ExecutorOverloaded)
+    while the database is unhealthy, and the results of all calls are recorded to it.
+    """
+    def __init__(self, max_workers=10, max_queue=100, name='simplog-db', reactor=None, breaker=None):
+        if max_workers < 1:
+            raise ValueError(f'max_workers should be positive: {max_workers}')
+        if max_queue < 0:
+            raise ValueError(f'max_queue should not be negative: {max_queue}')
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.reactor = reactor or default_reactor
+        self.breaker = breaker
+        self.thread_pool = ThreadPool(minthreads=0, maxthreads=max_workers, name=name)
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def start(self):
+        self.thread_pool.start()
+
+    def stop(self):
+        self.thread_pool.stop()
+
+    def submit(self, func, *args, **kwargs):
+        if self.pending >= self.capacity:
+            raise ExecutorOverloaded(f'too many pending tasks: {self.pending}')
+        trial = self.breaker.admit() if self.breaker is not None else None
+        return self._run(func, args, kwargs, trial)
+
+    def submit_admitted(self, func, *args, **kwargs):
+        """Runs a follow-up call of an already admitted request(e.g. the next batch of a streamed response).
+
+        It is not limited by `max_queue` or the breaker, so a request which was accepted is not cut off
+        in the middle.
+        """
+        return self._run(func, args, kwargs, None)
+
+    def _run(self, func, args, kwargs, trial):
+        self.pending += 1
+        d = deferToThreadPool(self.reactor, self.thread_pool, func, *args, **kwargs)
+        d.addBoth(self._task_done)
+        if self.breaker is not None:
+            d.addBoth(self.breaker.record, trial)
+        return d
+
+    def _task_done(self, result):
+        self.pending -= 1
+        return result
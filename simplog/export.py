@@ -0,0 +1,216 @@
+import datetime
+import io
+import itertools
+from collections import OrderedDict
+
+from twisted.python import log
+
+from simplog.serializer import encode_bson_value
+from simplog.streaming import CursorProducer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:     # optional
+    pyarrow = None
+
+FORMAT_ARROW = 'arrow'
+FORMAT_PARQUET = 'parquet'
+CONTENT_TYPES = {
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+}
+
+_int64_range = (-2 ** 63, 2 ** 63 - 1)
+
+
+def infer_schema(docs):
+    """Returns the arrow schema of the top level fields of documents, in the order they appear.
+
+    Integers are int64, integers with floats are float64, and dates are timestamps.
+    Strings, fields of mixed types and nested objects or arrays(encoded as JSON) are strings.
+    """
+    kinds = OrderedDict()
+    for doc in docs:
+        for field, value in doc.items():
+            kinds.setdefault(field, set()).add(_kind(value))
+    if not kinds:
+        kinds['_id'] = {'string'}
+    return pyarrow.schema([pyarrow.field(field, _column_type(field_kinds)) for field, field_kinds in kinds.items()])
+
+
+def to_record_batch(docs, schema, serializer):
+    """Returns the record batch of documents, the values which do not fit the type of their column are null."""
+    arrays = []
+    for field in schema:
+        convert = _converters.get(field.type.id, _to_string)
+        values = [doc.get(field.name) for doc in docs]
+        arrays.append(pyarrow.array([
+            None if value is None else convert(value, serializer) for value in values
+        ], type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, names=schema.names)
+
+
+class ColumnarEncoder:
+    """Encodes batches of documents as an Arrow IPC stream or a Parquet file(a row group for each batch).
+
+    The schema of a stream or a file can not change after its header, so it is inferred from the first
+    `sample_size` documents, and the batches are held until then. Fields which appear only after them
+    are not exported, and their names are kept in `dropped_fields`.
+    """
+    def __init__(self, export_format, serializer, sample_size=10000):
+        if pyarrow is None:
+            raise ImportError('pyarrow is not installed')
+        self.format = export_format
+        self.serializer = serializer
+        self.sample_size = sample_size
+        self.sink = io.BytesIO()
+        self.schema = None
+        self.writer = None
+        self.sampled = []   # batches held until the schema is inferred
+        self.sampled_count = 0
+        self.dropped_fields = set()
+
+    def encode(self, docs, last=False):
+        """Returns the bytes of a batch, including the header of the stream when the schema is inferred.
+
+        Batches are held(b'' is returned) until `sample_size` documents are given or the `last` batch.
+        """
+        if self.writer is None:
+            if docs:
+                self.sampled.append(docs)
+                self.sampled_count += len(docs)
+            if self.sampled_count < self.sample_size and not last:
+                return b''
+            return self._write_sampled()
+        names = set(self.schema.names)
+        for doc in docs:
+            if not doc.keys() <= names:
+                self.dropped_fields.update(doc.keys() - names)
+        self._write(docs)
+        return self._drain()
+
+    def close(self):
+        """Returns the rest of the stream(the end of an Arrow stream or the footer of a Parquet file)."""
+        data = self._write_sampled() if self.writer is None else b''
+        self.writer.close()
+        return data + self._drain()
+
+    def _write_sampled(self):
+        batches, self.sampled = self.sampled, []
+        self._open(infer_schema(itertools.chain.from_iterable(batches)))
+        for docs in batches:
+            self._write(docs)
+        return self._drain()
+
+    def _write(self, docs):
+        if not docs:
+            return
+        batch = to_record_batch(docs, self.schema, self.serializer)
+        if self.format == FORMAT_PARQUET:
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def _open(self, schema):
+        self.schema = schema
+        if self.format == FORMAT_PARQUET:
+            self.writer = pyarrow.parquet.ParquetWriter(self.sink, schema)
+        else:
+            self.writer = pyarrow.RecordBatchStreamWriter(self.sink, schema)
+
+    def _drain(self):
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+
+class ExportProducer(CursorProducer):
+    """Streams the documents of a cursor in a columnar format, one record batch for each batch of the cursor.
+
+    The schema is inferred from the first `schema_sample` documents(ColumnarEncoder), and the fields
+    dropped from the export are logged.
+    """
+    separator = b''
+
+    def __init__(self, request, executor, cursor, serializer, export_format, batch_size=10000, schema_sample=10000,
+                 timer=None):
+        super().__init__(request, executor, cursor, serializer, batch_size=batch_size, timer=timer)
+        self.prefix = b''
+        self.encoder = ColumnarEncoder(export_format, serializer, sample_size=schema_sample)
+
+    def encode(self, docs):
+        # runs in a worker thread of the executor
+        return self.encoder.encode(docs, last=len(docs) < self.batch_size)
+
+    def suffix(self):
+        data = self.encoder.close()
+        if self.encoder.dropped_fields:
+            log.msg(
+                f'simplog > fields not in the first {self.encoder.sampled_count} logs are not exported'
+                f' by {self.request.uri.decode("utf-8", "replace")}: {", ".join(sorted(self.encoder.dropped_fields))}'
+            )
+        return data
+
+
+def _kind(value):
+    if value is None:
+        return None
+    elif isinstance(value, bool):
+        return 'bool'
+    elif isinstance(value, int):
+        return 'int' if _int64_range[0] <= value <= _int64_range[1] else 'string'
+    elif isinstance(value, float):
+        return 'float'
+    elif isinstance(value, datetime.datetime):
+        return 'timestamp'
+    return 'string'
+
+
+def _column_type(kinds):
+    kinds = kinds - {None}
+    if kinds == {'bool'}:
+        return pyarrow.bool_()
+    elif kinds == {'int'}:
+        return pyarrow.int64()
+    elif kinds and kinds <= {'int', 'float'}:
+        return pyarrow.float64()
+    elif kinds == {'timestamp'}:
+        return pyarrow.timestamp('ms', tz='UTC')    # dates of mongodb are UTC
+    return pyarrow.string()
+
+
+def _to_bool(value, serializer):
+    return value if isinstance(value, bool) else None
+
+
+def _to_int(value, serializer):
+    if isinstance(value, int) and not isinstance(value, bool) and _int64_range[0] <= value <= _int64_range[1]:
+        return value
+    return None
+
+
+def _to_float(value, serializer):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _to_timestamp(value, serializer):
+    return value if isinstance(value, datetime.datetime) else None
+
+
+def _to_string(value, serializer):
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, (dict, list)):
+        return serializer.dumps(value).decode('utf-8')
+    return encode_bson_value(value)
+
+
+if pyarrow is not None:
+    _converters = {
+        pyarrow.bool_().id: _to_bool,
+        pyarrow.int64().id: _to_int,
+        pyarrow.float64().id: _to_float,
+        pyarrow.timestamp('ms').id: _to_timestamp,
+    }
@@ -0,0 +1,265 @@
+import fnmatch
+import heapq
+import itertools
+import json
+import time
+from collections import deque
+
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+from zope.interface import implementer
+
+from simplog.merge import get_path, order_key
+from simplog.metrics import PHASE_DB, PHASE_SERIALIZE, PHASE_WRITE
+
+GROUP_FIELD = '_group'     # name of the group of a log in responses of several groups
+
+_glob_characters = '*?['
+
+
+class InvalidGroups(ValueError):
+    pass
+
+
+def parse_groups(value, max_groups):
+    """Returns the group names and glob patterns of `$groups`, e.g. "web,api-*"."""
+    patterns = list(dict.fromkeys(pattern.strip() for pattern in value.split(',') if pattern.strip()))
+    if not patterns:
+        raise InvalidGroups('$groups should not be empty')
+    if len(patterns) > max_groups:
+        raise InvalidGroups(f'$groups should have at most {max_groups} groups: {len(patterns)}')
+    return patterns
+
+
+def is_glob(pattern):
+    return any(c in pattern for c in _glob_characters)
+
+
+def resolve_groups(log_db, patterns, group_of, max_groups):
+    """Returns the names of the groups matched by the names and glob patterns, in the order of the patterns.
+
+    `group_of(collection name)` maps partitions to their groups.
+    """
+    # runs in a worker thread of the executor if any pattern is a glob
+    if any(is_glob(pattern) for pattern in patterns):
+        names = sorted({group_of(name) for name in log_db.list_collection_names()})
+    else:
+        names = []
+    groups = []
+    for pattern in patterns:
+        if is_glob(pattern):
+            groups.extend(name for name in names if fnmatch.fnmatchcase(name, pattern))
+        else:
+            groups.append(pattern)
+    groups = list(dict.fromkeys(groups))
+    if len(groups) > max_groups:
+        raise InvalidGroups(f'$groups matched more than {max_groups} groups: {len(groups)}')
+    return groups
+
+
+class _Descending:
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+class _GroupSource:
+    def __init__(self, index, group_name, cursor):
+        self.index = index
+        self.group_name = group_name
+        self.cursor = cursor
+        self.docs = deque()     # (log, encoded log)
+        self.exhausted = False
+        self.fetching = False
+        self.closed = False
+
+
+@implementer(IPushProducer)
+class FanOutProducer:
+    """Streams the logs of several groups merged in a sort order as one JSON object: {"logs": [...]}
+
+    `cursors` are (group name, cursor) of the groups, each sorted by `sort`([(field, direction), ...] of one
+    direction). They are read and encoded in batches in the executor concurrently, one batch of each group
+    at a time, and merged in the reactor thread by a k-way merge of the first buffered logs of the groups.
+    A log is written only when every group which is not exhausted has a buffered log, so at most a batch
+    of each group is kept in memory, and nothing is read while the consumer(transport) is paused.
+    With `limit`, all cursors are closed as soon as `limit` logs are written.
+    Each log has the name of its group in `_group`.
+
+    `trailer(last_doc, count)` returns the other items of the object(e.g. the next page token).
+    The time of reading, encoding and writing batches and the number of logs are added to `timer`(RequestTimer).
+    """
+    separator = b', '
+
+    def __init__(self, request, executor, cursors, serializer, sort, batch_size=500, limit=None, trailer=None,
+                 timer=None):
+        self.request = request
+        self.executor = executor
+        self.sources = [_GroupSource(i, group_name, cursor) for i, (group_name, cursor) in enumerate(cursors)]
+        self.serializer = serializer
+        self.fields = [field for field, _ in sort]
+        self.descending = sort[0][1] < 0
+        self.batch_size = batch_size
+        self.limit = limit
+        self.trailer = trailer
+        self.timer = timer
+        self.heap = []      # (sort key, index, source) of the sources which have buffered logs
+        self.waiting = 0    # sources which have no buffered logs and are not exhausted
+        self.last_doc = None
+        self.count = 0
+        self.started = False
+        self.paused = False
+        self.merging = False
+        self.stopped = False
+
+    def start(self):
+        # the first batch is admitted by the executor limits, ExecutorOverloaded is raised when it is full
+        for source in self.sources:
+            submit = self.executor.submit if source.index == 0 else self.executor.submit_admitted
+            self._fetch(source, submit)
+        self.request.registerProducer(self, True)
+        self.request.notifyFinish().addErrback(lambda _: self.stopProducing())
+        if not self.sources:
+            self._merge()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if not self.stopped:
+            self._merge()
+
+    def stopProducing(self):
+        if not self.stopped:
+            self.stopped = True
+            self._close_all()
+
+    def _fetch(self, source, submit=None):
+        d = (submit or self.executor.submit_admitted)(self._read_batch, source)
+        source.fetching = True
+        self.waiting += 1
+        d.addCallbacks(self._batch_read, self._fail, callbackArgs=(source,), errbackArgs=(source,))
+
+    def _read_batch(self, source):
+        # runs in a worker thread of the executor
+        started = time.perf_counter()
+        docs = list(itertools.islice(source.cursor, self.batch_size))
+        fetched = time.perf_counter()
+        for doc in docs:
+            doc[GROUP_FIELD] = source.group_name
+        encoded = [(doc, self.serializer.dumps(doc)) for doc in docs]
+        return encoded, fetched - started, time.perf_counter() - fetched
+
+    def _batch_read(self, result, source):
+        docs, read_seconds, encode_seconds = result
+        source.fetching = False
+        self.waiting -= 1
+        if self.timer is not None:
+            # batches of the groups are read at the same time, so the time is added in the reactor thread
+            self.timer.add(PHASE_DB, read_seconds)
+            self.timer.add(PHASE_SERIALIZE, encode_seconds)
+        if self.stopped:
+            self._close(source)
+            return
+        source.docs.extend(docs)
+        if len(docs) < self.batch_size:
+            source.exhausted = True
+            self._close(source)
+        if source.docs:
+            self._push(source)
+        self._merge()
+
+    def _push(self, source):
+        key = tuple(order_key(get_path(source.docs[0][0], field)) for field in self.fields)
+        heapq.heappush(self.heap, (_Descending(key) if self.descending else key, source.index, source))
+
+    def _merge(self):
+        if self.merging or self.stopped or self.paused or self.waiting:
+            return
+        self.merging = True
+        try:
+            docs = []
+            while self.heap and not self.waiting and (self.limit is None or self.count < self.limit):
+                _, _, source = heapq.heappop(self.heap)
+                docs.append(source.docs.popleft())
+                self.count += 1
+                if source.docs:
+                    self._push(source)
+                elif not source.exhausted and (self.limit is None or self.count < self.limit):
+                    self._fetch(source)
+                if len(docs) >= self.batch_size:
+                    self._write_docs(docs)
+                    docs = []
+                    if self.paused:
+                        break
+            if docs:
+                self._write_docs(docs)
+            if not self.waiting and (not self.heap or self.count == self.limit):
+                self._finish()
+        finally:
+            self.merging = False
+
+    def _write_docs(self, docs):
+        self.last_doc = docs[-1][0]
+        chunk = b', '.join(encoded for _, encoded in docs)     # encoded in the worker threads
+        if not self.started:
+            self.started = True
+            self._write(b'{"logs": [')
+        elif self.separator:
+            self._write(self.separator)
+        self._write(chunk)
+
+    def _finish(self):
+        self.stopped = True
+        self.request.unregisterProducer()
+        if not self.started:
+            self._write(b'{"logs": [')
+        extra = self.trailer(self.last_doc, self.count) if self.trailer is not None else None
+        self._write(b'], ' + self.serializer.dumps(extra)[1:] if extra else b']}')
+        if self.timer is not None:
+            self.timer.returned = self.count
+        self.request.finish()
+        self._close_all()
+
+    def _write(self, data):
+        if self.timer is not None:
+            with self.timer.phase(PHASE_WRITE):
+                self.request.write(data)
+        else:
+            self.request.write(data)
+
+    def _close(self, source):
+        if not source.closed:
+            source.closed = True
+            self.executor.submit_admitted(source.cursor.close)
+
+    def _close_all(self):
+        # cursors of batches in flight are closed when the batches are read
+        for source in self.sources:
+            if not source.fetching:
+                self._close(source)
+
+    def _fail(self, failure, source):
+        source.fetching = False
+        self.waiting -= 1
+        self._close(source)
+        log.err(failure, 'simplog > streaming response of several groups failed')
+        if self.stopped:
+            return
+        self.stopped = True
+        self._close_all()
+        self.request.unregisterProducer()
+        if not self.started:
+            self.request.setResponseCode(500)
+            self.request.write(json.dumps({'success': False, 'error': repr(failure.value)}).encode('utf-8'))
+            self.request.finish()
+        else:
+            self.request.loseConnection()
@@ -0,0 +1,192 @@
+import json
+from collections import Counter, defaultdict
+
+import pymongo
+from twisted.python import log
+
+from simplog.executor import ExecutorOverloaded
+
+_id_field = '_id'
+_text_index_fields = ('_fts', '_ftsx')     # keys of text indexes in index_information
+
+STATUS_READY = 'ready'
+STATUS_BUILDING = 'building'
+STATUS_FAILED = 'failed'
+
+
+class InvalidIndexSpec(ValueError):
+    pass
+
+
+class IndexSpec:
+    """Index declaration: {"keys": ["field1", "-field2"], "text": ["field3"], "name": "...", "unique": false}
+
+    '-' prefixed keys are in descending order like $sort.
+    `text` fields are indexed for `$search`("$**" for all string fields), a group can have one text index.
+    """
+    def __init__(self, keys, name=None, unique=False):
+        if not keys:
+            raise InvalidIndexSpec('index keys should not be empty')
+        self.keys = keys
+        self.name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        self.unique = unique
+
+    @classmethod
+    def from_dict(cls, spec):
+        if not isinstance(spec, dict) or not isinstance(spec.get('keys', []), list) \
+                or not isinstance(spec.get('text', []), list) or ('keys' not in spec and 'text' not in spec):
+            raise InvalidIndexSpec(f'index should have a list of keys: {spec}')
+        keys = []
+        for key in spec.get('keys', []):
+            if not isinstance(key, str) or key in ('', '-'):
+                raise InvalidIndexSpec(f'invalid index key: {key}')
+            keys.append((key[1:], pymongo.DESCENDING) if key.startswith('-') else (key, pymongo.ASCENDING))
+        for field in spec.get('text', []):
+            if not isinstance(field, str) or field == '':
+                raise InvalidIndexSpec(f'invalid text index field: {field}')
+            keys.append((field, pymongo.TEXT))
+        return cls(keys, name=spec.get('name'), unique=bool(spec.get('unique', False)))
+
+    @classmethod
+    def from_index_information(cls, name, info):
+        keys = [(field, direction) for field, direction in info['key'] if field not in _text_index_fields]
+        # fields of a text index are listed in the weights
+        keys += [(field, pymongo.TEXT) for field in info.get('weights', {})]
+        return cls(keys, name=name, unique=bool(info.get('unique', False)))
+
+    def to_dict(self):
+        spec = {
+            'name': self.name,
+            'keys': [
+                field if direction == pymongo.ASCENDING else f'-{field}'
+                for field, direction in self.keys if direction != pymongo.TEXT
+            ],
+            'unique': self.unique,
+        }
+        if self.text:
+            spec['text'] = self.text
+        return spec
+
+    @property
+    def text(self):
+        return [field for field, direction in self.keys if direction == pymongo.TEXT]
+
+
+class IndexManager:
+    """Creates and lists indexes of log groups, and optionally creates indexes of frequently queried fields.
+
+    With `auto_index_threshold`, the fields in the query filters and sort keys are counted for each group,
+    and a single field index is created when a field is used in `auto_index_threshold` queries.
+    With `retention`(RetentionManager), the indexes of a partitioned group are created in all of its partitions,
+    and in the partitions created later.
+    """
+    def __init__(self, log_db, executor, auto_index_threshold=None, retention=None):
+        self.log_db = log_db
+        self.executor = executor
+        self.auto_index_threshold = auto_index_threshold
+        self.retention = retention
+        self.builds = defaultdict(dict)         # group -> name -> {'spec': IndexSpec, 'status': ..., 'error': ...}
+        self.field_usage = defaultdict(Counter)  # group -> field -> number of queries
+        if retention is not None:
+            retention.partition_hooks.append(self._index_partition)
+
+    def load_config(self, path):
+        """Creates the indexes declared in a JSON file: {"{group}": [{index declaration}, ...], ...}"""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        for group_name, specs in config.items():
+            for spec in specs:
+                self.create(group_name, IndexSpec.from_dict(spec), admitted=True)
+
+    def create(self, group_name, spec, admitted=False):
+        """Starts to build an index and returns the Deferred of the build.
+
+        ExecutorOverloaded is raised if the build is not admitted and the executor is full.
+        """
+        submit = self.executor.submit_admitted if admitted else self.executor.submit
+        d = submit(self._create_index, group_name, spec)
+        self.builds[group_name][spec.name] = {'spec': spec, 'status': STATUS_BUILDING, 'error': None}
+
+        def on_success(result):
+            self.builds[group_name][spec.name]['status'] = STATUS_READY
+            return result
+
+        def on_failure(failure):
+            log.err(failure, f'simplog > failed to create index {spec.name} of {group_name}')
+            self.builds[group_name][spec.name].update(status=STATUS_FAILED, error=repr(failure.value))
+            return failure
+
+        return d.addCallbacks(on_success, on_failure)
+
+    def drop(self, group_name, name):
+        d = self.executor.submit(self._drop_index, group_name, name)
+        self.builds[group_name].pop(name, None)
+        return d
+
+    def status(self, group_name):
+        """Returns the Deferred of the indexes of a group with their build status."""
+        return self.executor.submit(self._index_status, group_name).addCallback(self._merge_builds, group_name)
+
+    def record_query(self, group_name, fields):
+        if self.auto_index_threshold is None:
+            return
+        usage = self.field_usage[group_name]
+        for field in fields:
+            if field == _id_field or field.startswith('$'):
+                continue
+            usage[field] += 1
+            if usage[field] == self.auto_index_threshold:
+                self._create_auto_index(group_name, field)
+
+    def _create_auto_index(self, group_name, field):
+        spec = IndexSpec([(field, pymongo.ASCENDING)])
+        if spec.name in self.builds[group_name]:
+            return
+        try:
+            self.create(group_name, spec).addErrback(lambda _: None)    # logged in create()
+        except ExecutorOverloaded:
+            self.field_usage[group_name][field] -= 1    # try again with the next query
+
+    def _collections(self, group_name):
+        if self.retention is None:
+            return [self.log_db[group_name]]
+        return self.retention.group_collections(group_name)
+
+    def _create_index(self, group_name, spec):
+        # runs in a worker thread of the executor
+        for collection in self._collections(group_name):
+            collection.create_index(spec.keys, name=spec.name, unique=spec.unique)
+        return spec.name
+
+    def _drop_index(self, group_name, name):
+        # runs in a worker thread of the executor
+        for collection in self._collections(group_name):
+            collection.drop_index(name)
+
+    def _index_partition(self, group_name, collection):
+        # runs in a worker thread of the executor, when a partition of the group is created
+        for build in list(self.builds[group_name].values()):
+            if build['status'] != STATUS_FAILED:
+                spec = build['spec']
+                collection.create_index(spec.keys, name=spec.name, unique=spec.unique)
+
+    def _index_status(self, group_name):
+        # runs in a worker thread of the executor
+        index_information = {}
+        for collection in self._collections(group_name):
+            index_information.update(collection.index_information())
+        return index_information
+
+    def _merge_builds(self, index_information, group_name):
+        indexes = []
+        for name, info in index_information.items():
+            spec = IndexSpec.from_index_information(name, info)
+            indexes.append(dict(spec.to_dict(), status=STATUS_READY))
+        for name, build in self.builds[group_name].items():
+            if build['status'] != STATUS_READY:
+                indexes = [index for index in indexes if index['name'] != name]
+                indexes.append(dict(build['spec'].to_dict(), status=build['status'], error=build['error']))
+        return {
+            'indexes': indexes,
+            'field_usage': dict(self.field_usage[group_name]),
+        }
@@ -0,0 +1,184 @@
+import gzip
+import io
+import json
+import time
+
+from pymongo.errors import BulkWriteError
+
+try:
+    import zstandard
+except ImportError:     # optional
+    zstandard = None
+
+_ndjson_content_types = ('application/x-ndjson', 'application/ndjson')
+# errors of broken compressed streams
+_stream_errors = (OSError, EOFError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def is_ndjson(request):
+    content_type = request.getHeader(b'Content-Type')
+    if content_type is None:
+        return False
+    return content_type.decode('ascii', 'replace').split(';')[0].strip().lower() in _ndjson_content_types
+
+
+def content_encoding(request):
+    encoding = request.getHeader(b'Content-Encoding')
+    return encoding.decode('ascii', 'replace').strip().lower() if encoding else 'identity'
+
+
+def open_body(content, encoding, max_bytes=None):
+    """Returns a binary stream of the request body `content` decompressed by `encoding`(Content-Encoding).
+
+    Reading more than `max_bytes` decompressed bytes raises BodyTooLarge, so a small compressed body
+    can not expand without a limit.
+    """
+    content.seek(0)
+    if encoding == 'identity':
+        return content
+    elif encoding in ('gzip', 'x-gzip'):
+        stream = gzip.GzipFile(fileobj=content, mode='rb')
+    elif encoding == 'zstd' and zstandard is not None:
+        stream = zstandard.ZstdDecompressor().stream_reader(content)
+    else:
+        raise UnsupportedEncoding(f'unsupported Content-Encoding: {encoding}')
+    return io.BufferedReader(_LimitedReader(stream, max_bytes))
+
+
+class _LimitedReader(io.RawIOBase):
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        if self.max_bytes is not None:
+            if self.size >= self.max_bytes:
+                if self.stream.read(1):
+                    raise BodyTooLarge(f'decompressed request body should be at most {self.max_bytes} bytes')
+                return 0
+            size = min(size, self.max_bytes - self.size)
+        data = self.stream.read(size)
+        self.size += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_stream(stream):
+    """Returns the whole body of a stream from open_body, raises ValueError if the compressed body is broken."""
+    try:
+        return stream.read()
+    except _stream_errors as e:
+        raise ValueError(f'broken request body: {e!r}') from e
+
+
+class NDJSONIngest:
+    """Inserts newline-delimited JSON logs read from a stream, `batch_size` logs at a time.
+
+    Invalid lines and logs which failed to be inserted are reported with their line numbers(1-based),
+    and the other logs are inserted anyway(ordered=False).
+    `normalize(log)`(e.g. of the schema of the group) is called with each log, and the lines of logs
+    it rejects with ValueError are reported.
+    `on_insert(logs)` is called with the inserted logs of each batch.
+    If a batch fails otherwise(e.g. the database is unreachable) after logs are stored, the rest of the stream
+    is not read, and the error is reported at the first line of the batch with the logs inserted so far.
+    The error is raised if no log is stored yet, so the request can be sent again.
+    """
+    def __init__(self, collection, batch_size=1000, max_reported_errors=100, on_insert=None, normalize=None):
+        self.collection = collection
+        self.on_insert = on_insert
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self.max_reported_errors = max_reported_errors
+        self.inserted = 0
+        self.insert_seconds = 0.0
+        self.error_count = 0
+        self.errors = []
+        self.failure = None
+
+    def run(self, stream):
+        batch = []
+        try:
+            for line_no, log in self._parse_lines(stream):
+                batch.append((line_no, log))
+                if len(batch) >= self.batch_size:
+                    self._insert_batch(batch)
+                    batch = []
+                    if self.failure is not None:
+                        break
+        except _stream_errors + (BodyTooLarge,) as e:
+            # logs before the broken or too large part of the stream are kept
+            self._add_error(None, e)
+        if batch:
+            self._insert_batch(batch)
+        return self.result()
+
+    def result(self):
+        return {
+            'success': self.error_count == 0,
+            'inserted': self.inserted,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def _parse_lines(self, stream):
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                log = json.loads(line.decode('utf-8'))
+            except ValueError as e:     # JSONDecodeError, UnicodeDecodeError
+                self._add_error(line_no, e)
+                continue
+            if not isinstance(log, dict):
+                self._add_error(line_no, TypeError(f'log should be object: {type(log).__name__}'))
+                continue
+            if self.normalize is not None:
+                try:
+                    self.normalize(log)
+                except ValueError as e:
+                    self._add_error(line_no, e)
+                    continue
+            yield line_no, log
+
+    def _insert_batch(self, batch):
+        line_numbers = [line_no for line_no, _ in batch]
+        logs = [log for _, log in batch]
+        failed = set()
+        started = time.perf_counter()
+        try:
+            self.collection.insert_many(logs, ordered=False)
+            self.inserted += len(batch)
+        except BulkWriteError as e:
+            self.inserted += e.details.get('nInserted', 0)
+            for write_error in e.details.get('writeErrors', []):
+                failed.add(write_error['index'])
+                self._add_error(line_numbers[write_error['index']], write_error.get('errmsg'))
+        except Exception as e:
+            if not self.inserted:
+                raise
+            self.failure = e
+            self._add_error(line_numbers[0], f'logs from this line were not inserted: {e!r}')
+            return
+        finally:
+            self.insert_seconds += time.perf_counter() - started
+        if self.on_insert is not None:
+            self.on_insert([log for i, log in enumerate(logs) if i not in failed])
+
+    def _add_error(self, line_no, error):
+        self.error_count += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({'line': line_no, 'error': error if isinstance(error, str) else repr(error)})
@@ -0,0 +1,91 @@
+import datetime
+import heapq
+import itertools
+
+from bson import Decimal128, ObjectId
+
+
+def order_key(value):
+    """Returns the key which sorts values of different types in the order of mongodb:
+    null < numbers < strings < objects < arrays < binary < ObjectId < booleans < dates
+    """
+    if value is None:
+        return (0,)
+    elif isinstance(value, bool):
+        return 8, value
+    elif isinstance(value, (int, float)):
+        return 1, value
+    elif isinstance(value, Decimal128):
+        return 1, value.to_decimal()
+    elif isinstance(value, str):
+        return 2, value
+    elif isinstance(value, dict):
+        return 3, tuple((k, order_key(v)) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return 4, tuple(order_key(v) for v in value)
+    elif isinstance(value, bytes):
+        return 5, value
+    elif isinstance(value, ObjectId):
+        return 6, value
+    elif isinstance(value, datetime.datetime):
+        return 9, value
+    return 10, str(value)
+
+
+def get_path(doc, path):
+    """Returns the value of a dotted field path(e.g. "user.name") of a document, or None."""
+    value = doc
+    for field in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(field)
+    return value
+
+
+class MergedCursor:
+    """Iterates the documents of cursors of several collections as one cursor.
+
+    `collections()` and `find(collection)` are called at the first iteration, in the thread which reads the
+    cursor(a worker thread of the executor). With `sort`([(field, direction), ...] of one direction),
+    the cursors are merged in the sort order(each cursor should be sorted), otherwise they are chained.
+    At most `limit` documents are returned in total.
+    """
+    def __init__(self, collections, find, sort=None, limit=None):
+        self.collections = collections
+        self.find = find
+        self.sort = sort
+        self.limit = limit
+        self.cursors = None
+        self.iterator = None
+        self.cursor_batch_size = None
+
+    def batch_size(self, batch_size):
+        self.cursor_batch_size = batch_size
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.iterator is None:
+            self.iterator = self._open()
+        return next(self.iterator)
+
+    def close(self):
+        for cursor in self.cursors or []:
+            cursor.close()
+
+    def _open(self):
+        self.cursors = [self.find(collection) for collection in self.collections()]
+        if self.cursor_batch_size is not None:
+            for cursor in self.cursors:
+                cursor.batch_size(self.cursor_batch_size)
+        if self.sort is None:
+            docs = itertools.chain.from_iterable(self.cursors)
+        else:
+            fields = [field for field, _ in self.sort]
+            docs = heapq.merge(
+                *self.cursors, key=lambda doc: tuple(order_key(get_path(doc, field)) for field in fields),
+                reverse=self.sort[0][1] < 0,
+            )
+        return itertools.islice(docs, self.limit) if self.limit is not None else docs
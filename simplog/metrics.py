@@ -0,0 +1,243 @@
+import bisect
+import time
+
+from twisted.internet import reactor as default_reactor
+
+PHASE_PARSE = 'parse'
+PHASE_DB = 'db'
+PHASE_SERIALIZE = 'serialize'
+PHASE_WRITE = 'write'
+
+ROUTE_LOGS = 'logs'
+ROUTE_INDEXES = 'indexes'
+ROUTE_EXPORT = 'export'
+ROUTE_FANOUT = 'fanout'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+_other_group = '_other'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}    # label values -> value
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _label_pairs(self.label_names, labels), value
+
+
+class Gauge:
+    """Gauge whose value is read by `func()` when the metrics are rendered."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+
+    def samples(self):
+        yield self.name, (), self.func()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}    # label values -> [counts of buckets(not cumulative) and +Inf, sum]
+
+    def observe(self, labels, value):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            label_pairs = _label_pairs(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', label_pairs + (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', label_pairs, total
+            yield f'{self.name}_count', label_pairs, cumulative
+
+
+class Metrics:
+    """Request counts, latencies and document counts, exposed in the Prometheus text format.
+
+    The latency of a request is split into phases:
+    - parse: decoding of query arguments or the request body
+    - db: database calls(find batches, insert_many, aggregate)
+    - serialize: encoding of the response body
+    - write: writing the response to the transport
+
+    All metrics are updated in the reactor thread, so they need no locks. The phases measured in the
+    worker threads are kept in the RequestTimer of the request and observed when the request finishes.
+    Groups are labelled up to `max_groups` groups, and the others are counted as `_other`.
+    """
+    def __init__(self, max_groups=100):
+        self.max_groups = max_groups
+        self.groups = set()
+        self.requests = Counter(
+            'simplog_requests_total', 'Number of finished requests.', ('route', 'method', 'group', 'code'),
+        )
+        self.request_seconds = Histogram(
+            'simplog_request_duration_seconds', 'Time from the start of rendering to the end of the response.',
+            ('route', 'method', 'group'),
+        )
+        self.phase_seconds = Histogram(
+            'simplog_request_phase_seconds', 'Time of each phase of a request.', ('route', 'method', 'group', 'phase'),
+        )
+        self.response_bytes = Counter(
+            'simplog_response_bytes_total', 'Bytes of response bodies.', ('route', 'method', 'group'),
+        )
+        self.documents_inserted = Counter(
+            'simplog_documents_inserted_total', 'Number of inserted logs.', ('group',),
+        )
+        self.documents_returned = Counter(
+            'simplog_documents_returned_total', 'Number of logs in GET responses.', ('group',),
+        )
+        self.reactor_lag = Histogram(
+            'simplog_reactor_lag_seconds', 'Delay of timed calls of the reactor loop.', buckets=LAG_BUCKETS,
+        )
+        self.gauges = {}
+
+    def add_gauge(self, name, help_text, func):
+        self.gauges[name] = Gauge(name, help_text, func)
+
+    def group_label(self, group_name):
+        if group_name is None:
+            return ''
+        if group_name not in self.groups:
+            if len(self.groups) >= self.max_groups:
+                return _other_group
+            self.groups.add(group_name)
+        return group_name
+
+    def track(self, request, route, group_name=None):
+        """Returns the RequestTimer of a request, which is observed when the request finishes."""
+        return RequestTimer(self, request, route, self.group_label(group_name))
+
+    def observe(self, timer, code, sent_bytes):
+        labels = (timer.route, timer.method, timer.group)
+        self.requests.inc(labels + (str(code),))
+        self.request_seconds.observe(labels, time.perf_counter() - timer.started)
+        for phase, seconds in timer.phases.items():
+            self.phase_seconds.observe(labels + (phase,), seconds)
+        if sent_bytes:
+            self.response_bytes.inc(labels, sent_bytes)
+        if timer.inserted:
+            self.documents_inserted.inc((timer.group,), timer.inserted)
+        if timer.returned:
+            self.documents_returned.inc((timer.group,), timer.returned)
+
+    def render(self):
+        lines = []
+        metrics = [
+            self.requests, self.request_seconds, self.phase_seconds, self.response_bytes,
+            self.documents_inserted, self.documents_returned, self.reactor_lag,
+        ] + list(self.gauges.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, label_pairs, value in metric.samples():
+                lines.append(f'{name}{_format_labels(label_pairs)} {_format_value(value)}')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class RequestTimer:
+    """Phase durations and document counts of a request.
+
+    The phases are measured in the reactor or in a worker thread, one at a time for a request.
+    """
+    def __init__(self, metrics, request, route, group):
+        self.metrics = metrics
+        self.route = route
+        self.method = request.method.decode('ascii', 'replace')
+        self.group = group
+        self.phases = {}
+        self.inserted = 0
+        self.returned = 0
+        self.started = time.perf_counter()
+        request.notifyFinish().addBoth(lambda _: metrics.observe(self, request.code, request.sentLength))
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def phase(self, phase):
+        return _PhaseTimer(self, phase)
+
+
+class _PhaseTimer:
+    __slots__ = ('timer', 'phase', 'started')
+
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.phase, time.perf_counter() - self.started)
+
+
+class ReactorLagMonitor:
+    """Schedules a call every `interval` seconds and observes how late it is called, i.e. how long
+    the reactor loop was blocked."""
+    def __init__(self, metrics, interval=0.5, reactor=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.reactor = reactor or default_reactor
+        self.expected = None
+        self.call = None
+
+    def start(self):
+        self.expected = self.reactor.seconds() + self.interval
+        self.call = self.reactor.callLater(self.interval, self._tick)
+
+    def stop(self):
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        self.call = None
+
+    def _tick(self):
+        self.metrics.reactor_lag.observe((), max(0.0, self.reactor.seconds() - self.expected))
+        self.start()
+
+
+def _label_pairs(label_names, labels):
+    return tuple(zip(label_names, labels))
+
+
+def _format_labels(label_pairs):
+    if not label_pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in label_pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(value)
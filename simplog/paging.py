@@ -0,0 +1,217 @@
+import base64
+import binascii
+import datetime
+
+from bson import Decimal128, ObjectId, json_util
+
+from simplog.merge import get_path
+
+# reserved query argument keys, field names of mongodb documents can not start with '$'
+_limit_key = b'$limit'
+_sort_key = b'$sort'
+_fields_key = b'$fields'
+_after_key = b'$after'
+_search_key = b'$search'
+_id_field = '_id'
+# $type aliases of the values after null in the sort order of mongodb
+_sort_types = ('number', 'string', 'object', 'binData', 'objectId', 'bool', 'date')
+
+SCORE_FIELD = '_score'      # relevance of a log to $search
+
+
+class InvalidPageArgument(ValueError):
+    pass
+
+
+class PageOptions:
+    """Limit, sort order, projection and resume position of a find query.
+
+    Pages are resumed by the position of the last returned document (sort key and _id), not by skipping,
+    so reading a next page costs the same as the first one when the sort field is indexed.
+    With `search`, only the logs which contain the words are found by the text index of the group,
+    and they are sorted by the relevance(`_score` of the logs) unless a sort field is given.
+    With `ordered`, logs are sorted by `_id` without a sort field even if they are not paged.
+    """
+    def __init__(self, limit=None, sort_field=None, descending=False, fields=None, after=None, search=None,
+                 ordered=False):
+        self.limit = limit
+        self.sort_field = sort_field
+        self.descending = descending
+        self.fields = fields
+        self.after = after
+        self.search = search
+        self.ordered = ordered
+
+    @classmethod
+    def from_args(cls, args):
+        """Pops the reserved arguments from `args`(request.args) and returns PageOptions of them."""
+        limit = _pop_arg(args, _limit_key)
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise InvalidPageArgument(f'$limit should be integer: {limit}')
+            if limit <= 0:
+                raise InvalidPageArgument(f'$limit should be positive: {limit}')
+
+        sort_field, descending = _pop_arg(args, _sort_key), False
+        if sort_field is not None and sort_field.startswith('-'):
+            sort_field, descending = sort_field[1:], True
+        if sort_field == _id_field or sort_field == '':
+            sort_field = None
+
+        fields = _pop_arg(args, _fields_key)
+        if fields is not None:
+            fields = [field for field in fields.split(',') if field]
+
+        after = _pop_arg(args, _after_key)
+        if after is not None:
+            after = decode_page_token(after)
+
+        search = _pop_arg(args, _search_key)
+        if search is not None and not search.strip():
+            raise InvalidPageArgument('$search should not be empty')
+        return cls(
+            limit=limit, sort_field=sort_field, descending=descending, fields=fields, after=after, search=search,
+        )
+
+    @property
+    def paged(self):
+        return self.limit is not None or self.after is not None
+
+    @property
+    def ranked(self):
+        """Whether the logs are sorted by the relevance to `search`."""
+        return self.search is not None and self.sort_field is None
+
+    def sort(self):
+        if self.ranked:
+            return [(SCORE_FIELD, -1), (_id_field, -1)]
+        direction = -1 if self.descending else 1
+        if self.sort_field is None:
+            return [(_id_field, direction)] if self.paged or self.ordered else None
+        return [(self.sort_field, direction), (_id_field, direction)]
+
+    def projection(self):
+        if self.fields is None:
+            return None
+        projection = {field: 1 for field in self.fields}
+        if self.sort_field is not None:
+            projection[self.sort_field] = 1     # required to make the next page token
+        return projection
+
+    def query(self, query):
+        """Returns `query` restricted to the documents which contain the search words and are after
+        the resume position."""
+        if self.search is not None:
+            query = dict(query, **{'$text': {'$search': self.search}})
+        if self.after is None or self.ranked:
+            return query
+        after_condition = self._after_condition(self.sort_field, self.descending)
+        return {'$and': [query, after_condition]} if query else after_condition
+
+    def pipeline(self, query):
+        """Returns the aggregation pipeline which finds the logs in the order of the relevance to `search`."""
+        # the relevance is not a field of the logs, so the resume position is matched after it is added
+        stages = [{'$match': self.query(query)}, {'$addFields': {SCORE_FIELD: {'$meta': 'textScore'}}}]
+        if self.after is not None:
+            stages.append({'$match': self._after_condition(SCORE_FIELD, True, mixed=False)})
+        stages.append({'$sort': dict(self.sort())})
+        if self.limit is not None:
+            stages.append({'$limit': self.limit})
+        if self.fields is not None:
+            stages.append({'$project': dict({field: 1 for field in self.fields}, **{SCORE_FIELD: 1})})
+        return stages
+
+    def find(self, collection, query):
+        if self.ranked:
+            return collection.aggregate(self.pipeline(query))
+        cursor = collection.find(self.query(query), self.projection())
+        sort = self.sort()
+        if sort is not None:
+            cursor = cursor.sort(sort)
+        if self.limit is not None:
+            cursor = cursor.limit(self.limit)
+        return cursor
+
+    def next_token(self, last_doc, count):
+        """Returns the token of the next page if the page is full, otherwise None."""
+        if self.limit is None or count < self.limit or last_doc is None:
+            return None
+        position = {'id': last_doc[_id_field]}
+        if self.ranked:
+            position['value'] = last_doc.get(SCORE_FIELD)
+        elif self.sort_field is not None:
+            position['value'] = get_path(last_doc, self.sort_field)
+        return encode_page_token(position)
+
+    def _after_condition(self, sort_field, descending, mixed=True):
+        """Returns the condition of the documents after the resume position in the sort order.
+
+        Comparisons match only values of the same type, so if `mixed`, the values of the types after(or before,
+        if descending) the type of the last value are matched by `$type`, and null or missing values by null.
+        """
+        op = '$lt' if descending else '$gt'
+        last_id = self.after['id']
+        if sort_field is None:
+            return {_id_field: {op: last_id}}
+        last_value = self.after['value']
+        conditions = [{sort_field: last_value, _id_field: {op: last_id}}]
+        if last_value is not None:
+            conditions.insert(0, {sort_field: {op: last_value}})
+        if not mixed:
+            return {'$or': conditions}
+        value_type = _sort_type(last_value)
+        if value_type is None:
+            types = ()
+            if not descending:
+                conditions.append({sort_field: {'$ne': None}})
+        elif value_type not in _sort_types:    # e.g. arrays, which are sorted by their elements
+            types = ()
+        elif descending:
+            types = _sort_types[:_sort_types.index(value_type)]
+            conditions.append({sort_field: None})
+        else:
+            types = _sort_types[_sort_types.index(value_type) + 1:]
+        conditions.extend({sort_field: {'$type': alias}} for alias in types)
+        return {'$or': conditions}
+
+
+def encode_page_token(position):
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token):
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidPageArgument(f'invalid $after: {token}')
+    if not isinstance(position, dict) or 'id' not in position:
+        raise InvalidPageArgument(f'invalid $after: {token}')
+    return position
+
+
+def _sort_type(value):
+    """Returns the $type alias of a value, or None for null."""
+    if value is None:
+        return None
+    elif isinstance(value, bool):
+        return 'bool'
+    elif isinstance(value, (int, float, Decimal128)):
+        return 'number'
+    elif isinstance(value, str):
+        return 'string'
+    elif isinstance(value, dict):
+        return 'object'
+    elif isinstance(value, bytes):
+        return 'binData'
+    elif isinstance(value, ObjectId):
+        return 'objectId'
+    elif isinstance(value, datetime.datetime):
+        return 'date'
+    return type(value).__name__
+
+
+def _pop_arg(args, key):
+    values = args.pop(key, None)
+    return values[0].decode('utf-8') if values else None
@@ -0,0 +1,252 @@
+import datetime
+from collections import OrderedDict
+
+# postfixes of argument keys, e.g. year:int=1984, tag:exists=true, level!=DEBUG
+_value_type_postfix = {
+    ':int': int,
+    ':float': float,
+    ':date': datetime.datetime.fromisoformat,
+}
+_exists_postfix = ':exists'
+_negation_postfix = '!'
+_exists_values = {'true': True, 'false': False}
+
+_missing = object()
+
+
+class Eq:
+    def __init__(self, value):
+        self.value = value
+
+    def operators(self, negated=False):
+        return {'$ne' if negated else '$eq': self.value}
+
+    def matches(self, value):
+        return value is not _missing and value == self.value and _comparable_type(value) == _comparable_type(self.value)
+
+
+class Range:
+    """[low:high) of values, one of the bounds may be open(None)."""
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def operators(self, negated=False):
+        operators = {}
+        if self.low is not None:
+            operators['$gte'] = self.low
+        if self.high is not None:
+            operators['$lt'] = self.high
+        return {'$not': operators} if negated else operators
+
+    def matches(self, value):
+        bound = self.low if self.low is not None else self.high
+        if value is _missing or value is None or _comparable_type(value) != _comparable_type(bound):
+            return False
+        return (self.low is None or value >= self.low) and (self.high is None or value < self.high)
+
+
+class In:
+    def __init__(self, values):
+        self.values = values
+
+    def operators(self, negated=False):
+        return {'$nin' if negated else '$in': self.values}
+
+    def matches(self, value):
+        return any(Eq(candidate).matches(value) for candidate in self.values)
+
+
+class Exists:
+    def __init__(self, exists):
+        self.exists = exists
+
+    def operators(self, negated=False):
+        return {'$exists': self.exists != negated}
+
+    def matches(self, value):
+        return (value is not _missing) == self.exists
+
+
+class Condition:
+    """A condition of a field: one of Eq, Range, In and Exists, or the negation of it."""
+    def __init__(self, field, predicate, negated=False):
+        self.field = field
+        self.predicate = predicate
+        self.negated = negated
+
+    def operators(self):
+        return self.predicate.operators(self.negated)
+
+    def matches(self, log_object):
+        return self.predicate.matches(_lookup(log_object, self.field)) != self.negated
+
+
+class QueryPlan:
+    """Conditions of a find query, all of which should be matched.
+
+    `filter` is the find filter of mongodb, and `matches(log_object)` tells whether a log matches the query
+    without the database(e.g. logs of live tails).
+    """
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.fields = list(OrderedDict.fromkeys(condition.field for condition in conditions))
+        self.filter = self._filter()
+
+    def matches(self, log_object):
+        return all(condition.matches(log_object) for condition in self.conditions)
+
+    def _filter(self):
+        query, clauses = {}, []
+        for field in self.fields:
+            conditions = [condition for condition in self.conditions if condition.field == field]
+            if len(conditions) == 1 and isinstance(conditions[0].predicate, Eq) and not conditions[0].negated:
+                query[field] = conditions[0].predicate.value
+                continue
+            operators = {}
+            for condition in conditions:
+                condition_operators = condition.operators()
+                if operators.keys() & condition_operators.keys():
+                    # the same operator twice, e.g. level!=DEBUG&level!=INFO
+                    clauses.append({field: condition_operators})
+                else:
+                    operators.update(condition_operators)
+            query[field] = operators
+        if clauses:
+            query['$and'] = clauses
+        return query
+
+
+class QueryPlanCache:
+    """LRU cache of the query plans of query strings, so repeated queries are not parsed and validated again."""
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, key, args, types=None):
+        """Returns the plan of `args`(request.args without the reserved arguments of the route) of a query string.
+
+        `key` should identify the query string and the route, since routes take different reserved arguments,
+        and the group if `types`(schema of the group) is given.
+        """
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.hits += 1
+            self.plans.move_to_end(key)
+            return plan
+        self.misses += 1
+        plan = compile_query(args, types)     # invalid queries are not cached, ValueError is raised again
+        if self.max_entries > 0:
+            self.plans[key] = plan
+            if len(self.plans) > self.max_entries:
+                self.plans.popitem(last=False)
+        return plan
+
+
+def compile_query(args, types=None):
+    """Returns the QueryPlan of query arguments(request.args) except the reserved ones.
+
+    - `{field}={value}`: equal to the value, `{field}!={value}`: not equal
+    - `{field}=[{low}:{high}]`: in [low, high), either of the bounds may be omitted
+    - `{field}={{a},{b},...}`: one of the values
+    - `{field}:exists=true|false`: the field exists or not
+    - `{field}:int`, `{field}:float`, `{field}:date`: values are converted to the type
+    Values of the fields in `types`({field: conversion}, e.g. from the schema of the group) are converted
+    without the postfixes.
+    Several values of a key, and keys of the same field, are conditions which should all be matched.
+    """
+    for arg_key in args:
+        if arg_key.startswith(b'$'):
+            raise ValueError(f'unknown reserved argument: {arg_key.decode("utf-8")}')
+    return QueryPlan([
+        condition for arg_key, arg_values in args.items()
+        for condition in compile_argument(arg_key, arg_values, types)
+    ])
+
+
+def compile_argument(arg_key, arg_values, types=None):
+    field, convert, negated = decode_arg_key(arg_key, types)
+    conditions = []
+    for arg_value in arg_values:
+        arg_value = arg_value.decode('utf-8')
+        if convert is None:
+            if arg_value not in _exists_values:
+                raise ValueError(f'{field}:exists should be true or false: {arg_value}')
+            predicate = Exists(_exists_values[arg_value])
+        else:
+            predicate = decode_predicate(arg_value, convert)
+        conditions.append(Condition(field, predicate, negated))
+    return conditions
+
+
+def decode_arg_key(arg_key, types=None):
+    """Returns (field, value conversion, negated) of an argument key, the conversion is None for `:exists`.
+
+    Fields without a postfix are converted by `types`({field: conversion}) if they are in it.
+    """
+    arg_key = arg_key.decode('utf-8')
+    negated = arg_key.endswith(_negation_postfix)
+    if negated:
+        arg_key = arg_key[:-len(_negation_postfix)]
+    if arg_key.endswith(_exists_postfix):
+        return arg_key[:-len(_exists_postfix)], None, negated
+    for postfix, value_type in _value_type_postfix.items():
+        if arg_key.endswith(postfix):
+            return arg_key[:-len(postfix)], _converter(value_type), negated
+    if types and arg_key in types:
+        value_type = types[arg_key]
+        return arg_key, value_type if value_type is str else _converter(value_type), negated
+    return arg_key, str, negated     # default
+
+
+def _converter(value_type):
+    def convert(value_str):
+        return value_type(value_str) if value_str else ''
+    return convert
+
+
+def decode_predicate(arg_value, convert):
+    if arg_value.startswith('[') and arg_value.endswith(']'):
+        range_segments = arg_value[1:-1].split(':')
+        if len(range_segments) > 2 and convert is not str:
+            range_segments = split_range(arg_value[1:-1], convert) or range_segments
+        if len(range_segments) == 2:
+            low, high = (convert(segment) if segment else None for segment in range_segments)
+            if low is not None or high is not None:
+                return Range(low, high)
+    elif arg_value.startswith('{') and arg_value.endswith('}'):
+        return In([convert(value) for value in arg_value[1:-1].split(',')])
+    return Eq(convert(arg_value))
+
+
+def split_range(range_value, convert):
+    """Splits a range of values which contain ':'(e.g. dates with time) at the first ':' between two valid values."""
+    for i, c in enumerate(range_value):
+        if c == ':':
+            try:
+                convert(range_value[:i])
+                convert(range_value[i + 1:])
+            except ValueError:
+                continue
+            return [range_value[:i], range_value[i + 1:]]
+    return None
+
+
+def _lookup(doc, path):
+    value = doc
+    for field in path.split('.'):
+        if not isinstance(value, dict) or field not in value:
+            return _missing
+        value = value[field]
+    return value
+
+
+def _comparable_type(value):
+    # values of different types do not match like mongodb, e.g. "1984" and 1984
+    if isinstance(value, bool):
+        return bool
+    elif isinstance(value, (int, float)):
+        return float
+    return type(value)
@@ -0,0 +1,278 @@
+import datetime
+import json
+import re
+import time
+
+import pymongo
+from pymongo.errors import OperationFailure
+from twisted.internet import reactor as default_reactor
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+
+INGESTED_FIELD = '_ingested'
+
+RETENTION_TTL = 'ttl'
+RETENTION_CAPPED = 'capped'
+RETENTION_PARTITION = 'partition'
+
+PARTITION_DAILY = 'daily'
+PARTITION_HOURLY = 'hourly'
+_partition_formats = {
+    PARTITION_DAILY: ('%Y%m%d', datetime.timedelta(days=1)),
+    PARTITION_HOURLY: ('%Y%m%d%H', datetime.timedelta(hours=1)),
+}
+_ttl_index_name = f'{INGESTED_FIELD}_ttl'
+
+
+class InvalidRetentionPolicy(ValueError):
+    pass
+
+
+class RetentionPolicy:
+    """Retention policy of a group:
+
+    - {"ttl": seconds}: logs are deleted `seconds` after they are stored(TTL index of the ingest time)
+    - {"capped": {"size": bytes, "max": logs}}: the oldest logs are overwritten beyond the size(capped collection)
+    - {"partition": "daily" | "hourly", "retention": seconds}: logs are stored in a collection of each day or hour
+      of the ingest time, and partitions older than `retention` seconds are dropped as a whole
+    """
+    def __init__(self, kind, ttl=None, size=None, max_logs=None, partition=None, retention=None):
+        self.kind = kind
+        self.ttl = ttl
+        self.size = size
+        self.max_logs = max_logs
+        self.partition = partition
+        self.retention = retention
+
+    @classmethod
+    def from_dict(cls, policy):
+        if not isinstance(policy, dict):
+            raise InvalidRetentionPolicy(f'retention policy should be object: {policy}')
+        kinds = [kind for kind in (RETENTION_TTL, RETENTION_CAPPED, RETENTION_PARTITION) if kind in policy]
+        if len(kinds) != 1:
+            raise InvalidRetentionPolicy(f'retention policy should have one of ttl, capped or partition: {policy}')
+        kind = kinds[0]
+        if kind == RETENTION_TTL:
+            return cls(kind, ttl=_positive_int(policy, RETENTION_TTL))
+        elif kind == RETENTION_CAPPED:
+            capped = policy[RETENTION_CAPPED]
+            if not isinstance(capped, dict):
+                raise InvalidRetentionPolicy(f'capped should be object: {capped}')
+            max_logs = _positive_int(capped, 'max') if 'max' in capped else None
+            return cls(kind, size=_positive_int(capped, 'size'), max_logs=max_logs)
+        else:
+            if policy[RETENTION_PARTITION] not in _partition_formats:
+                raise InvalidRetentionPolicy(f'partition should be daily or hourly: {policy[RETENTION_PARTITION]}')
+            return cls(kind, partition=policy[RETENTION_PARTITION], retention=_positive_int(policy, 'retention'))
+
+    @property
+    def stamps_ingest_time(self):
+        return self.kind in (RETENTION_TTL, RETENTION_PARTITION)
+
+    @property
+    def partitioned(self):
+        return self.kind == RETENTION_PARTITION
+
+    def partition_name(self, group_name, ingested):
+        date_format, _ = _partition_formats[self.partition]
+        return f'{group_name}.{ingested.strftime(date_format)}'
+
+    def partition_range(self, group_name, collection_name):
+        """Returns (start, end) of the ingest time of a partition collection, or None if it is not a partition."""
+        date_format, length = _partition_formats[self.partition]
+        suffix = collection_name[len(group_name) + 1:]
+        try:
+            start = datetime.datetime.strptime(suffix, date_format)
+        except ValueError:
+            return None
+        return start, start + length
+
+
+class IngestCollection:
+    """Inserts the logs of a group with a retention policy, like pymongo Collection.insert_many.
+
+    Logs are stamped with the ingest time(`_ingested`), and inserted into the partition of the time
+    if the group is partitioned.
+    """
+    def __init__(self, manager, group_name, policy):
+        self.manager = manager
+        self.group_name = group_name
+        self.policy = policy
+
+    @property
+    def name(self):
+        return self.group_name
+
+    def insert_many(self, documents, ordered=True):
+        ingested = self.manager.now()
+        for document in documents:
+            document[INGESTED_FIELD] = ingested
+        return self.manager.target_collection(self.group_name, self.policy, ingested).insert_many(
+            documents, ordered=ordered,
+        )
+
+
+class RetentionManager:
+    """Applies the retention policies of groups, and resolves the collections of partitioned groups.
+
+    TTL and capped policies are applied to the collection of the group at startup.
+    Partitions are created when the first logs of their time are inserted, and `partition_hooks`
+    (e.g. to create the indexes of the group) are called with (group name, collection) in the worker thread.
+    Partitions which ended `retention` seconds ago are dropped every `check_interval` seconds.
+    """
+    def __init__(self, log_db, executor, check_interval=60.0, clock=time.time, reactor=None):
+        self.log_db = log_db
+        self.executor = executor
+        self.clock = clock
+        self.reactor = reactor or default_reactor
+        self.policies = {}
+        self.partitions = set()     # names of the partitions known to exist
+        self.partition_hooks = []
+        self.expiry = LoopingCall(self.expire)
+        self.expiry.clock = self.reactor
+        self.check_interval = check_interval
+
+    def load_config(self, path):
+        """Sets the policies declared in a JSON file: {"{group}": {retention policy}, ...}"""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        for group_name, policy in config.items():
+            self.policies[group_name] = RetentionPolicy.from_dict(policy)
+
+    def start(self):
+        """Applies the policies and starts to drop expired partitions, returns the Deferred of the policies."""
+        d = DeferredList([
+            self.executor.submit_admitted(self._apply, group_name, policy).addErrback(
+                log.err, f'simplog > failed to apply the retention policy of {group_name}',
+            ) for group_name, policy in self.policies.items()
+        ])
+        if any(policy.partitioned for policy in self.policies.values()):
+            self.expiry.start(self.check_interval, now=True)
+        return d
+
+    def stop(self):
+        if self.expiry.running:
+            self.expiry.stop()
+
+    def now(self):
+        ingested = datetime.datetime.utcfromtimestamp(self.clock())
+        return ingested.replace(microsecond=ingested.microsecond // 1000 * 1000)    # milliseconds like BSON
+
+    def partitioned(self, group_name):
+        policy = self.policies.get(group_name)
+        return policy is not None and policy.partitioned
+
+    def group_of(self, collection_name):
+        """Returns the group of a collection, which is a partition or the collection of the group."""
+        group_name, _, suffix = collection_name.rpartition('.')
+        if group_name and suffix.isdigit() and self.partitioned(group_name):
+            return group_name
+        return collection_name
+
+    def insert_collection(self, group_name):
+        """Returns the collection to insert the logs of a group into."""
+        policy = self.policies.get(group_name)
+        if policy is None or not policy.stamps_ingest_time:
+            return self.log_db[group_name]
+        return IngestCollection(self, group_name, policy)
+
+    def target_collection(self, group_name, policy, ingested):
+        # runs in a worker thread of the executor
+        if not policy.partitioned:
+            return self.log_db[group_name]
+        name = policy.partition_name(group_name, ingested)
+        collection = self.log_db[name]
+        if name not in self.partitions:
+            # creating indexes twice in concurrent inserts is harmless
+            collection.create_index([(INGESTED_FIELD, pymongo.ASCENDING)])
+            for hook in self.partition_hooks:
+                hook(group_name, collection)
+            self.partitions.add(name)
+        return collection
+
+    def group_collections(self, group_name, query=None):
+        """Returns the collections of a group, the partitions which may have logs matched by `query`
+        (`_ingested` conditions) in time order if the group is partitioned."""
+        # runs in a worker thread of the executor
+        policy = self.policies.get(group_name)
+        if policy is None or not policy.partitioned:
+            return [self.log_db[group_name]]
+        low, high = _ingested_range(query or {})
+        collections = []
+        for name, (start, end) in self._list_partitions(group_name, policy):
+            if (low is None or end > low) and (high is None or start <= high):
+                collections.append(self.log_db[name])
+        return collections
+
+    def expire(self):
+        return DeferredList([
+            self.executor.submit_admitted(self._drop_expired, group_name, policy).addErrback(
+                log.err, f'simplog > failed to drop expired partitions of {group_name}',
+            ) for group_name, policy in self.policies.items() if policy.partitioned
+        ])
+
+    def _apply(self, group_name, policy):
+        # runs in a worker thread of the executor
+        if policy.kind == RETENTION_TTL:
+            collection = self.log_db[group_name]
+            try:
+                collection.create_index(
+                    [(INGESTED_FIELD, pymongo.ASCENDING)], name=_ttl_index_name, expireAfterSeconds=policy.ttl,
+                )
+            except OperationFailure:
+                # the index exists with another ttl
+                self.log_db.command('collMod', group_name, index={
+                    'name': _ttl_index_name, 'expireAfterSeconds': policy.ttl,
+                })
+        elif policy.kind == RETENTION_CAPPED:
+            if group_name not in self.log_db.list_collection_names(filter={'name': group_name}):
+                options = {'max': policy.max_logs} if policy.max_logs is not None else {}
+                self.log_db.create_collection(group_name, capped=True, size=policy.size, **options)
+            elif not self.log_db[group_name].options().get('capped'):
+                self.log_db.command('convertToCapped', group_name, size=policy.size)
+
+    def _drop_expired(self, group_name, policy):
+        # runs in a worker thread of the executor
+        expired_before = self.now() - datetime.timedelta(seconds=policy.retention)
+        dropped = []
+        for name, (_, end) in self._list_partitions(group_name, policy):
+            if end <= expired_before:
+                self.log_db.drop_collection(name)
+                self.partitions.discard(name)
+                dropped.append(name)
+        if dropped:
+            log.msg(f'simplog > dropped expired partitions: {", ".join(dropped)}')
+        return dropped
+
+    def _list_partitions(self, group_name, policy):
+        names = self.log_db.list_collection_names(filter={'name': {'$regex': f'^{re.escape(group_name)}\\.\\d+$'}})
+        partitions = []
+        for name in names:
+            partition_range = policy.partition_range(group_name, name)
+            if partition_range is not None:
+                partitions.append((name, partition_range))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _ingested_range(query):
+    """Returns (low, high) of `_ingested` in a query filter, None if it is not bounded."""
+    condition = query.get(INGESTED_FIELD)
+    if isinstance(condition, datetime.datetime):
+        return condition, condition
+    low = high = None
+    if isinstance(condition, dict):
+        for op in ('$gt', '$gte'):
+            if isinstance(condition.get(op), datetime.datetime):
+                low = condition[op]
+        for op in ('$lt', '$lte'):
+            if isinstance(condition.get(op), datetime.datetime):
+                high = condition[op]
+    return low, high
+
+
+def _positive_int(policy, key):
+    value = policy.get(key)
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise InvalidRetentionPolicy(f'{key} should be positive integer: {value}')
+    return value
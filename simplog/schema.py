@@ -0,0 +1,174 @@
+import datetime
+import json
+import math
+
+from simplog.retention import INGESTED_FIELD
+
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_DATE = 'date'
+TYPE_STRING = 'string'
+
+_utc = datetime.timezone.utc
+
+
+class InvalidSchema(ValueError):
+    pass
+
+
+class InvalidLog(ValueError):
+    pass
+
+
+def parse_date(value_str):
+    """Returns the naive UTC datetime of an ISO-8601 string, e.g. 2020-04-10T12:00:00, 2020-04-10T21:00:00+09:00
+    or 2020-04-10T12:00:00Z, in milliseconds like BSON."""
+    value_str = value_str.strip()
+    if value_str[-1:] in ('Z', 'z'):
+        value_str = value_str[:-1] + '+00:00'
+    return _to_bson_date(datetime.datetime.fromisoformat(value_str))
+
+
+def _to_bson_date(date):
+    if date.tzinfo is not None:
+        date = date.astimezone(_utc).replace(tzinfo=None)
+    return date.replace(microsecond=date.microsecond // 1000 * 1000)
+
+
+def _to_int(value):
+    if isinstance(value, str):
+        return int(value.strip())
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise TypeError(f'{type(value).__name__} is not int')
+
+
+def _to_float(value):
+    if isinstance(value, str):
+        value = float(value.strip())
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = float(value)
+    else:
+        raise TypeError(f'{type(value).__name__} is not float')
+    if not math.isfinite(value):
+        raise ValueError(f'{value} is not finite')
+    return value
+
+
+def _to_date(value):
+    if isinstance(value, str):
+        return parse_date(value)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        # seconds since the epoch
+        return _to_bson_date(datetime.datetime.fromtimestamp(value, _utc))
+    raise TypeError(f'{type(value).__name__} is not date')
+
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, (bool, int, float)):
+        return json.dumps(value)
+    raise TypeError(f'{type(value).__name__} is not string')
+
+
+_converters = {
+    TYPE_INT: _to_int,
+    TYPE_FLOAT: _to_float,
+    TYPE_DATE: _to_date,
+    TYPE_STRING: _to_string,
+}
+# conversions of query argument values(str), the same as the postfixes(:int, :float, :date) except dates
+_query_converters = {
+    TYPE_INT: int,
+    TYPE_FLOAT: float,
+    TYPE_DATE: parse_date,
+    TYPE_STRING: str,
+}
+
+
+class GroupSchema:
+    """Ingest schema of a group: {"fields": {"created": "date", "year": "int", "stars": "float"}, "ingested": true}
+
+    - Declared fields(`a.b` for nested ones) of POSTed logs are converted to int, float, date or string,
+      e.g. "1984" to 1984, ISO-8601 strings and seconds since the epoch to dates.
+      Logs which do not have the fields, or have null, are stored as they are.
+    - `ingested` stamps the logs with the time they are received(`_ingested`).
+    Query arguments of the fields are converted to the types without the `:int`, `:float` and `:date` postfixes.
+    """
+    def __init__(self, fields, ingested=False):
+        self.fields = fields
+        self.ingested = ingested
+        # {field: conversion of query argument values} and date fields, including `_ingested` if it is stamped
+        self.query_types = {field: _query_converters[field_type] for field, field_type in fields.items()}
+        self.date_fields = [field for field, field_type in fields.items() if field_type == TYPE_DATE]
+        if ingested:
+            self.query_types[INGESTED_FIELD] = parse_date
+            self.date_fields.append(INGESTED_FIELD)
+
+    @classmethod
+    def from_dict(cls, schema):
+        if not isinstance(schema, dict) or not isinstance(schema.get('fields', {}), dict) \
+                or schema.keys() - {'fields', 'ingested'}:
+            raise InvalidSchema(f'schema should have an object of fields: {schema}')
+        fields = schema.get('fields', {})
+        for field, field_type in fields.items():
+            if not field or field.startswith('$') or field == '_id':
+                raise InvalidSchema(f'invalid schema field: {field}')
+            if field_type not in _converters:
+                raise InvalidSchema(f'type of {field} should be one of {", ".join(_converters)}: {field_type}')
+        ingested = schema.get('ingested', False)
+        if not isinstance(ingested, bool):
+            raise InvalidSchema(f'ingested should be true or false: {ingested}')
+        return cls(dict(fields), ingested=ingested)
+
+    def normalize(self, log_object, ingested=None):
+        """Converts the declared fields of a log in place, raises InvalidLog if a value can not be converted."""
+        for field, field_type in self.fields.items():
+            parent, key = _parent(log_object, field)
+            if parent is None or parent.get(key) is None:
+                continue
+            try:
+                parent[key] = _converters[field_type](parent[key])
+            except (TypeError, ValueError, OverflowError, OSError) as e:
+                raise InvalidLog(f'{field} should be {field_type}: {parent[key]!r}({e})')
+        if self.ingested and ingested is not None:
+            log_object[INGESTED_FIELD] = ingested
+        return log_object
+
+    def normalize_all(self, logs, ingested=None):
+        """Converts the declared fields of logs, raises InvalidLog with the index of the first invalid log."""
+        for i, log_object in enumerate(logs):
+            try:
+                self.normalize(log_object, ingested)
+            except InvalidLog as e:
+                raise InvalidLog(f'log[{i}]: {e}')
+        return logs
+
+
+class IngestSchemas:
+    """Ingest schemas of groups, which are declared at startup."""
+    def __init__(self, schemas=None):
+        self.schemas = dict(schemas or {})
+
+    def load_config(self, path):
+        """Sets the schemas declared in a JSON file: {"{group}": {schema}, ...}"""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        for group_name, schema in config.items():
+            self.schemas[group_name] = GroupSchema.from_dict(schema)
+
+    def get(self, group_name):
+        return self.schemas.get(group_name)
+
+
+def _parent(doc, path):
+    """Returns (the object which has the last field of a path, the field), or (None, None) if it does not exist."""
+    *parents, key = path.split('.')
+    for field in parents:
+        doc = doc.get(field)
+        if not isinstance(doc, dict):
+            return None, None
+    return doc, key
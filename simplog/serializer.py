@@ -0,0 +1,75 @@
+import base64
+import datetime
+import json
+import uuid
+
+from bson import Binary, Decimal128, ObjectId
+
+try:
+    import orjson
+except ImportError:     # optional
+    orjson = None
+
+SERIALIZER_AUTO = 'auto'
+SERIALIZER_JSON = 'json'
+SERIALIZER_ORJSON = 'orjson'
+
+
+def encode_bson_value(o):
+    """Converts a value of a mongodb document which is not JSON serializable.
+
+    - ObjectId, Decimal128, UUID: str
+    - datetime, date: ISO-8601 string
+    - bytes(Binary): base64 string
+    - the others(e.g. Regex, Timestamp): str
+    """
+    if isinstance(o, ObjectId):
+        return str(o)
+    elif isinstance(o, (datetime.datetime, datetime.date)):
+        return o.isoformat()
+    elif isinstance(o, (Decimal128, uuid.UUID)):
+        return str(o)
+    elif isinstance(o, (bytes, Binary)):
+        return base64.b64encode(o).decode('ascii')
+    return str(o)
+
+
+class MongoDocumentEncoder(json.JSONEncoder):
+    def default(self, o):
+        return encode_bson_value(o)
+
+
+class JSONSerializer:
+    name = SERIALIZER_JSON
+
+    def __init__(self):
+        self.encoder = MongoDocumentEncoder()
+
+    def dumps(self, obj):
+        return self.encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonSerializer:
+    """Serializes with orjson, and falls back to the stdlib json for what orjson rejects(e.g. non-str keys)."""
+    name = SERIALIZER_ORJSON
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is not installed')
+        self.fallback = JSONSerializer()
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj, default=encode_bson_value)
+        except TypeError:
+            return self.fallback.dumps(obj)
+
+
+def get_serializer(name=SERIALIZER_AUTO):
+    if name == SERIALIZER_AUTO:
+        name = SERIALIZER_ORJSON if orjson is not None else SERIALIZER_JSON
+    if name == SERIALIZER_ORJSON:
+        return OrjsonSerializer()
+    elif name == SERIALIZER_JSON:
+        return JSONSerializer()
+    raise ValueError(f'unknown serializer: {name}')
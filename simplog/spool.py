@@ -0,0 +1,319 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+from pymongo.results import InsertManyResult
+from twisted.internet import reactor as default_reactor
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThreadPool
+from twisted.python import log
+
+from simplog.executor import ExecutorOverloaded
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+
+_segment_suffix = '.spool'
+_checkpoint_name = 'checkpoint'
+_duplicate_key_error = 11000
+
+
+class SpoolFull(ExecutorOverloaded):
+    pass
+
+
+class Spool:
+    """Append-only local log of accepted logs, which are inserted into the database later by SpoolDrainer.
+
+    Records(a batch of logs of a group, one JSON line each) are appended to segment files of about
+    `segment_bytes` bytes in `directory`. The position up to which the records are inserted is kept in
+    the checkpoint file, and segments before it are deleted. A record torn by a crash is truncated when opened.
+    With FSYNC_ALWAYS, appends are synced before they return, with FSYNC_INTERVAL every `fsync_interval`
+    seconds(records of the last interval may be lost by a power failure, not by a crash of the process).
+    SpoolFull is raised when more than `max_bytes` bytes are not inserted yet.
+    """
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync=FSYNC_INTERVAL, fsync_interval=1.0, clock=time.time, reactor=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.clock = clock
+        self.reactor = reactor or default_reactor
+        self.lock = threading.Lock()
+        self.segments = OrderedDict()   # sequence number -> size
+        self.checkpoint = (0, 0)        # (sequence number, offset) of the first record to insert
+        self.active = None              # file of the last segment
+        self.dirty = False
+        self.size = 0                   # bytes not inserted yet
+        self.oldest_time = None         # time of the oldest record not inserted yet(or of the batch being inserted)
+        self.syncer = LoopingCall(self._sync_in_thread)
+        self.syncer.clock = self.reactor
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.checkpoint = self._read_checkpoint()
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(_segment_suffix):
+                sequence = int(name[:-len(_segment_suffix)])
+                if sequence < self.checkpoint[0]:
+                    os.remove(self._path(sequence))
+                else:
+                    self.segments[sequence] = os.path.getsize(self._path(sequence))
+        if not self.segments:
+            self.segments[self.checkpoint[0]] = 0
+        self._truncate_torn_record(next(reversed(self.segments)))
+        self.active = open(self._path(next(reversed(self.segments))), 'ab')
+        self.size = sum(self.segments.values()) - self.checkpoint[1]
+        records, _ = self.read(1)
+        if records:
+            self.oldest_time = records[0][2]
+
+    def start(self):
+        if self.fsync == FSYNC_INTERVAL:
+            self.syncer.start(self.fsync_interval, now=False)
+
+    def close(self):
+        if self.syncer.running:
+            self.syncer.stop()
+        with self.lock:
+            if self.active is not None:
+                self._sync()
+                self.active.close()
+                self.active = None
+
+    def append(self, group_name, logs):
+        """Appends a batch of logs(with _id) of a group, called in any thread."""
+        now = self.clock()
+        record = (json_util.dumps({'t': now, 'g': group_name, 'logs': logs}) + '\n').encode('utf-8')
+        with self.lock:
+            if self.size + len(record) > self.max_bytes:
+                raise SpoolFull(f'spool is full: {self.size} bytes are not inserted yet')
+            sequence = next(reversed(self.segments))
+            if self.segments[sequence] >= self.segment_bytes:
+                sequence = self._roll(sequence)
+            self.active.write(record)
+            self.active.flush()
+            self.segments[sequence] += len(record)
+            if self.size == 0:
+                self.oldest_time = now
+            self.size += len(record)
+            self.dirty = True
+            if self.fsync == FSYNC_ALWAYS:
+                self._sync()
+
+    def read(self, max_logs, position=None):
+        """Returns the records from `position`(the checkpoint by default) which have about `max_logs` logs
+        in total as [(group, logs, time), ...], and the position after them."""
+        sequence, offset = position or self.checkpoint
+        records, count = [], 0
+        while count < max_logs:
+            with self.lock:
+                end = self.segments.get(sequence)
+                last = sequence == next(reversed(self.segments))
+            if end is None:
+                break
+            if offset >= end:
+                if last:
+                    break
+                sequence, offset = sequence + 1, 0
+                continue
+            with open(self._path(sequence), 'rb') as f:
+                f.seek(offset)
+                while offset < end and count < max_logs:
+                    line = f.readline(end - offset)
+                    offset += len(line)
+                    try:
+                        record = json_util.loads(line.decode('utf-8'))
+                    except ValueError as e:
+                        log.msg(f'simplog > skipped a broken record of the spool at {sequence}:{offset}: {e!r}')
+                        continue
+                    records.append((record['g'], record['logs'], record['t']))
+                    count += len(record['logs'])
+        return records, (sequence, offset)
+
+    def commit(self, position, next_time=None):
+        """Marks the records before `position` as inserted, and deletes the segments before it."""
+        with self.lock:
+            drained = self._distance(self.checkpoint, position)
+            for sequence in [sequence for sequence in self.segments if sequence < position[0]]:
+                del self.segments[sequence]
+                os.remove(self._path(sequence))
+            self.checkpoint = position
+            self.size -= drained
+            self.oldest_time = next_time if self.size > 0 else None
+            self._write_checkpoint()
+
+    def lag(self):
+        """Seconds since the oldest record which is not inserted yet was appended."""
+        oldest_time = self.oldest_time
+        return max(self.clock() - oldest_time, 0.0) if oldest_time is not None and self.size > 0 else 0.0
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync_in_thread(self):
+        return deferToThreadPool(self.reactor, self.reactor.getThreadPool(), self.sync).addErrback(
+            log.err, 'simplog > failed to sync the spool',
+        )
+
+    def _sync(self):
+        if self.dirty and self.active is not None:
+            os.fsync(self.active.fileno())
+            self.dirty = False
+
+    def _roll(self, sequence):
+        self._sync()
+        self.active.close()
+        sequence += 1
+        self.segments[sequence] = 0
+        self.active = open(self._path(sequence), 'ab')
+        return sequence
+
+    def _distance(self, start, end):
+        if start[0] == end[0]:
+            return end[1] - start[1]
+        distance = self.segments.get(start[0], 0) - start[1] + end[1]
+        for sequence, size in self.segments.items():
+            if start[0] < sequence < end[0]:
+                distance += size
+        return distance
+
+    def _truncate_torn_record(self, sequence):
+        path = self._path(sequence)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                log.msg(f'simplog > truncated a torn record of the spool at {sequence}:{end}')
+                f.truncate(end)
+        self.segments[sequence] = end
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, _checkpoint_name), encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            return checkpoint['segment'], checkpoint['offset']
+        except FileNotFoundError:
+            return 0, 0
+
+    def _write_checkpoint(self):
+        path = os.path.join(self.directory, _checkpoint_name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'segment': self.checkpoint[0], 'offset': self.checkpoint[1]}, f)
+            if self.fsync != FSYNC_NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _path(self, sequence):
+        return os.path.join(self.directory, f'{sequence:020d}{_segment_suffix}')
+
+
+class SpoolCollection:
+    """Appends the logs of a group to the spool, like pymongo Collection.insert_many."""
+    def __init__(self, spool, group_name):
+        self.spool = spool
+        self.group_name = group_name
+
+    @property
+    def name(self):
+        return self.group_name
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        for document in documents:
+            if '_id' not in document:
+                document['_id'] = ObjectId()
+        self.spool.append(self.group_name, documents)
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+
+class SpoolDrainer:
+    """Inserts the records of the spool into the database in order, at least once.
+
+    A batch of records(about `batch_size` logs) is inserted in the executor, and committed after all of its logs
+    are inserted. Failed batches are retried after `retry_delay` seconds, doubled up to `max_retry_delay`.
+    Logs inserted before a failure or a crash are inserted again and ignored as duplicates of their _id.
+    `on_drained(group name)` is called in the reactor thread after logs of the group are inserted.
+    """
+    def __init__(self, spool, executor, insert_collection, batch_size=1000, interval=0.1, retry_delay=1.0,
+                 max_retry_delay=30.0, on_drained=None, reactor=None):
+        self.spool = spool
+        self.executor = executor
+        self.insert_collection = insert_collection
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.on_drained = on_drained
+        self.reactor = reactor or default_reactor
+        self.draining = False
+        self.failures = 0
+        self.retry_at = 0.0
+        self.loop = LoopingCall(self.drain)
+        self.loop.clock = self.reactor
+        self.interval = interval
+
+    def start(self):
+        self.loop.start(self.interval, now=True)
+
+    def stop(self):
+        if self.loop.running:
+            self.loop.stop()
+
+    def drain(self):
+        if self.draining or self.spool.size == 0 or self.reactor.seconds() < self.retry_at:
+            return
+        try:
+            d = self.executor.submit(self._drain_batch)
+        except ExecutorOverloaded:
+            return      # the database is busy or unavailable, tried again in the next interval
+        self.draining = True
+        d.addCallbacks(self._drained, self._failed)
+
+    def _drain_batch(self):
+        # runs in a worker thread of the executor
+        records, position = self.spool.read(self.batch_size)
+        logs_of_groups = defaultdict(list)
+        for group_name, logs, _ in records:
+            logs_of_groups[group_name].extend(logs)
+        for group_name, logs in logs_of_groups.items():
+            self._insert(group_name, logs)
+        next_records, _ = self.spool.read(1, position)
+        self.spool.commit(position, next_records[0][2] if next_records else None)
+        return list(logs_of_groups)
+
+    def _insert(self, group_name, logs):
+        # runs in a worker thread of the executor
+        try:
+            self.insert_collection(group_name).insert_many(logs, ordered=False)
+        except BulkWriteError as e:
+            errors = [error for error in e.details['writeErrors'] if error.get('code') != _duplicate_key_error]
+            if errors:
+                # retrying does not help invalid logs
+                log.msg(f'simplog > dropped {len(errors)} logs of {group_name} from the spool: {errors[0]}')
+
+    def _drained(self, group_names):
+        self.draining = False
+        self.failures = 0
+        if self.on_drained is not None:
+            for group_name in group_names:
+                self.on_drained(group_name)
+        if self.spool.size > 0:
+            self.reactor.callLater(0, self.drain)
+
+    def _failed(self, failure):
+        self.draining = False
+        self.failures += 1
+        delay = min(self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay)
+        self.retry_at = self.reactor.seconds() + delay
+        log.msg(f'simplog > failed to insert logs of the spool, retry in {delay}s: {failure.value!r}')
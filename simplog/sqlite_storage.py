@@ -0,0 +1,490 @@
+import calendar
+import datetime
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId, json_util
+from bson.json_util import DatetimeRepresentation, JSONMode, JSONOptions
+from pymongo.errors import BulkWriteError
+from pymongo.results import InsertManyResult
+
+from simplog.storage import FEATURE_TEXT_SEARCH, STORAGE_SQLITE, StorageEngine, UnsupportedFeature
+
+_table_prefix = 'group:'
+_id_field = '_id'
+_duplicate_key_error = 11000
+# dates are {"$date": milliseconds} and ObjectIds are {"$oid": hex}, which are compared in SQL by the values in them
+_json_options = JSONOptions(
+    json_mode=JSONMode.LEGACY, datetime_representation=DatetimeRepresentation.LEGACY, tz_aware=False,
+)
+_comparisons = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+class SQLiteEngine(StorageEngine):
+    """Logs in a SQLite file in WAL mode, without a database server(e.g. for edge nodes and benchmarks).
+
+    A group is a table of JSON documents, and the fields of indexes are indexed by expression indexes.
+    Values are compared only with the values of the same type like mongodb(e.g. "1984" does not match 1984),
+    but fields of arrays do not match their elements. Aggregations, text search, retention and change streams
+    are not supported.
+    Connections are shared by the worker threads of the executor, at most `max_idle_connections` are kept open.
+    """
+    name = STORAGE_SQLITE
+    features = frozenset()
+
+    def __init__(self, path, max_idle_connections=16, busy_timeout=30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.idle_connections = queue.LifoQueue(maxsize=max_idle_connections)
+        self.write_lock = threading.Lock()      # one writer at a time, readers are not blocked in WAL mode
+        super().__init__(SQLiteDatabase(self))
+        with self.connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS "index:" (collection TEXT, name TEXT, keys TEXT, is_unique INTEGER, '
+                'PRIMARY KEY (collection, name))'
+            )
+
+    def acquire(self):
+        try:
+            return self.idle_connections.get_nowait()
+        except queue.Empty:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA synchronous=NORMAL')
+            return connection
+
+    def release(self, connection):
+        try:
+            self.idle_connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def connection(self):
+        return _Connection(self)
+
+    def close(self):
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _Connection:
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+
+    def __enter__(self):
+        self.connection = self.engine.acquire()
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.connection.in_transaction:
+            self.connection.rollback()
+        self.engine.release(self.connection)
+
+
+class SQLiteDatabase:
+    def __init__(self, engine):
+        self.engine = engine
+        self.collections = {}
+
+    def __getitem__(self, name):
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections.setdefault(name, SQLiteCollection(self.engine, name))
+        return collection
+
+    def get_collection(self, name):
+        return self[name]
+
+    def list_collection_names(self, filter=None):
+        if filter is not None and (set(filter) != {'name'} or not isinstance(filter['name'], str)):
+            raise UnsupportedFeature(f'filter of collection names is not supported by the sqlite storage: {filter}')
+        with self.engine.connection() as connection:
+            names = [
+                name[len(_table_prefix):] for name, in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND substr(name, 1, ?) = ? ORDER BY name",
+                    (len(_table_prefix), _table_prefix),
+                )
+            ]
+        return [name for name in names if filter is None or name == filter['name']]
+
+    def drop_collection(self, name):
+        self[name].drop()
+
+
+class SQLiteCollection:
+    def __init__(self, engine, name):
+        self.engine = engine
+        self.name = name
+        self.table = _quote(_table_prefix + name)
+        self.created = False
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        rows = []
+        for document in documents:
+            if _id_field not in document:
+                document[_id_field] = ObjectId()
+            rows.append((_key_value(document[_id_field]), json_util.dumps(document, json_options=_json_options)))
+        errors = []
+        with self.engine.write_lock, self.engine.connection() as connection:
+            self._create_table(connection)
+            connection.execute('BEGIN')
+            try:
+                connection.executemany(f'INSERT INTO {self.table} (id, doc) VALUES (?, ?)', rows)
+            except sqlite3.IntegrityError:
+                # inserted one by one to find the duplicates
+                connection.rollback()
+                connection.execute('BEGIN')
+                for i, row in enumerate(rows):
+                    try:
+                        connection.execute(f'INSERT INTO {self.table} (id, doc) VALUES (?, ?)', row)
+                    except sqlite3.IntegrityError as e:
+                        errors.append({
+                            'index': i, 'code': _duplicate_key_error, 'errmsg': f'E11000 duplicate key error: {e}',
+                            'op': documents[i],
+                        })
+                        if ordered:
+                            break
+            connection.commit()
+        if errors:
+            # ordered inserts stop at the first error
+            inserted = errors[0]['index'] if ordered else len(documents) - len(errors)
+            raise BulkWriteError({
+                'writeErrors': errors, 'writeConcernErrors': [], 'nInserted': inserted, 'nUpserted': 0,
+                'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': [],
+            })
+        return InsertManyResult([document[_id_field] for document in documents], True)
+
+    def find(self, filter=None, projection=None):
+        return SQLiteCursor(self, filter or {}, projection)
+
+    def count_documents(self, filter):
+        where, params = _where(filter)
+        with self.engine.connection() as connection:
+            if not self._exists(connection):
+                return 0
+            return connection.execute(f'SELECT count(*) FROM {self.table} WHERE {where}', params).fetchone()[0]
+
+    def create_index(self, keys, name=None, unique=False):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        for _, direction in keys:
+            if direction not in (1, -1):
+                raise UnsupportedFeature(f'{FEATURE_TEXT_SEARCH} is not supported by the sqlite storage')
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        columns = ', '.join(f'{_key(field)} {"DESC" if direction == -1 else "ASC"}' for field, direction in keys)
+        with self.engine.write_lock, self.engine.connection() as connection:
+            self._create_table(connection)
+            connection.execute(
+                f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {self._index(name)} '
+                f'ON {self.table} ({columns})'
+            )
+            connection.execute(
+                'INSERT OR REPLACE INTO "index:" (collection, name, keys, is_unique) VALUES (?, ?, ?, ?)',
+                (self.name, name, json_util.dumps(keys), int(unique)),
+            )
+        return name
+
+    def drop_index(self, name):
+        with self.engine.write_lock, self.engine.connection() as connection:
+            connection.execute(f'DROP INDEX IF EXISTS {self._index(name)}')
+            connection.execute('DELETE FROM "index:" WHERE collection = ? AND name = ?', (self.name, name))
+
+    def index_information(self):
+        index_information = OrderedDict([('_id_', {'key': [(_id_field, 1)]})])
+        with self.engine.connection() as connection:
+            for name, keys, is_unique in connection.execute(
+                    'SELECT name, keys, is_unique FROM "index:" WHERE collection = ? ORDER BY rowid', (self.name,)):
+                info = {'key': [tuple(key) for key in json_util.loads(keys)]}
+                if is_unique:
+                    info['unique'] = True
+                index_information[name] = info
+        return index_information
+
+    def drop(self):
+        with self.engine.write_lock, self.engine.connection() as connection:
+            connection.execute(f'DROP TABLE IF EXISTS {self.table}')
+            connection.execute('DELETE FROM "index:" WHERE collection = ?', (self.name,))
+        self.created = False
+
+    def _create_table(self, connection):
+        if not self.created:
+            # id is the value of _id(without a type affinity, so 1 and "1" are different)
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} '
+                '(seq INTEGER PRIMARY KEY, id UNIQUE NOT NULL, doc TEXT NOT NULL)'
+            )
+            self.created = True
+
+    def _exists(self, connection):
+        return self.created or connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (_table_prefix + self.name,),
+        ).fetchone() is not None
+
+    def _index(self, name):
+        return _quote(f'{_table_prefix}{self.name}:{name}')
+
+
+class SQLiteCursor:
+    """Cursor of a find query, which reads the rows in batches by a connection of its own until closed."""
+    def __init__(self, collection, filter, projection):
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self.sort_keys = None
+        self.limit_count = 0
+        self.skip_count = 0
+        self.rows_per_batch = 100
+        self.connection = None
+        self.sql_cursor = None
+        self.rows = []
+        self.closed = False
+
+    def sort(self, key_or_list, direction=None):
+        self.sort_keys = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def limit(self, limit):
+        self.limit_count = limit
+        return self
+
+    def skip(self, skip):
+        self.skip_count = skip
+        return self
+
+    def batch_size(self, batch_size):
+        self.rows_per_batch = batch_size or 100
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.rows:
+            self._fetch()
+        if not self.rows:
+            raise StopIteration
+        return _project(json_util.loads(self.rows.pop(), json_options=_json_options), self.projection)
+
+    next = __next__
+
+    def close(self):
+        self.closed = True
+        if self.connection is not None:
+            if self.sql_cursor is not None:
+                self.sql_cursor.close()
+            self.collection.engine.release(self.connection)
+            self.connection = None
+
+    def _fetch(self):
+        if self.closed:
+            return
+        if self.connection is None:
+            self._execute()
+            if self.closed:
+                return
+        self.rows = [doc for doc, in reversed(self.sql_cursor.fetchmany(self.rows_per_batch))]
+        if not self.rows:
+            self.close()
+
+    def sql(self):
+        """Returns the SQL query and its parameters."""
+        where, params = _where(self.filter)
+        sql = f'SELECT doc FROM {self.collection.table} WHERE {where}'
+        if self.sort_keys:
+            # without a sort, rows are read in the inserted order or the order of an index, like mongodb
+            sql += ' ORDER BY ' + ', '.join(
+                f'{_key(field)} {"DESC" if direction == -1 else "ASC"}' for field, direction in self.sort_keys
+            )
+        if self.limit_count or self.skip_count:
+            sql += ' LIMIT ? OFFSET ?'
+            params = params + [self.limit_count or -1, self.skip_count]
+        return sql, params
+
+    def _execute(self):
+        sql, params = self.sql()
+        self.connection = self.collection.engine.acquire()
+        if not self.collection._exists(self.connection):
+            self.close()
+            return
+        self.sql_cursor = self.connection.execute(sql, params)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _path(field):
+    path = '$' + ''.join('."' + part.replace('"', '\\"') + '"' for part in field.split('.'))
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _subpath(field, key):
+    return _path(f'{field}.{key}')
+
+
+def _key(field):
+    """SQL expression of the value of a field to compare and sort, and to index."""
+    if field == _id_field:
+        return 'id'
+    return (f'coalesce(json_extract(doc, {_subpath(field, "$date")}), json_extract(doc, {_subpath(field, "$oid")}), '
+            f'json_extract(doc, {_path(field)}))')
+
+
+def _key_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    elif isinstance(value, datetime.datetime):
+        return _millis(value)
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, (int, float, str)):
+        return value
+    return json_util.dumps(value, json_options=_json_options)
+
+
+def _millis(value):
+    if value.utcoffset() is not None:
+        value = value - value.utcoffset()
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def _type_guard(field, value):
+    """SQL condition that a field has a value of the same type as `value`."""
+    if field == _id_field:
+        if isinstance(value, (ObjectId, str)):
+            return "typeof(id) = 'text'"
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            return "typeof(id) IN ('integer', 'real')"
+    elif isinstance(value, bool):
+        return f"json_type(doc, {_path(field)}) IN ('true', 'false')"
+    elif isinstance(value, (int, float)):
+        return f"json_type(doc, {_path(field)}) IN ('integer', 'real')"
+    elif isinstance(value, str):
+        return f"json_type(doc, {_path(field)}) = 'text'"
+    elif isinstance(value, datetime.datetime):
+        return f"json_type(doc, {_subpath(field, '$date')}) = 'integer'"
+    elif isinstance(value, ObjectId):
+        return f"json_type(doc, {_subpath(field, '$oid')}) = 'text'"
+    raise UnsupportedFeature(f'{type(value).__name__} values of {field} are not supported by the sqlite storage')
+
+
+def _type_condition(field, alias):
+    """SQL condition of `$type` by an alias of the types of JSON documents, e.g. "number"."""
+    json_type = f'json_type(doc, {_path(field)})'
+    if alias == 'null':
+        return f"{json_type} = 'null'"
+    elif alias == 'number':
+        return f"{json_type} IN ('integer', 'real')"
+    elif alias == 'string':
+        return f"{json_type} = 'text'"
+    elif alias == 'bool':
+        return f"{json_type} IN ('true', 'false')"
+    elif alias == 'array':
+        return f"{json_type} = 'array'"
+    elif alias == 'date':
+        return f"json_type(doc, {_subpath(field, '$date')}) = 'integer'"
+    elif alias == 'objectId':
+        return f"json_type(doc, {_subpath(field, '$oid')}) = 'text'"
+    elif alias == 'binData':
+        return f"json_type(doc, {_subpath(field, '$binary')}) IS NOT NULL"
+    elif alias == 'object':
+        return (f"({json_type} = 'object' AND " + ' AND '.join(
+            f'json_type(doc, {_subpath(field, key)}) IS NULL' for key in ('$date', '$oid', '$binary')
+        ) + ')')
+    raise UnsupportedFeature(f'$type {alias} is not supported by the sqlite storage')
+
+
+def _compare(field, operator, value):
+    if value is None and operator in ('$eq', '$ne'):
+        missing = '0' if field == _id_field else \
+            f"(json_type(doc, {_path(field)}) IS NULL OR json_type(doc, {_path(field)}) = 'null')"
+        return (missing if operator == '$eq' else f'NOT {missing}'), []
+    if operator == '$eq':
+        return f'({_type_guard(field, value)} AND {_key(field)} = ?)', [_key_value(value)]
+    elif operator == '$ne':
+        sql, params = _compare(field, '$eq', value)
+        return f'NOT {sql}', params
+    return f'({_type_guard(field, value)} AND {_key(field)} {_comparisons[operator]} ?)', [_key_value(value)]
+
+
+def _field_condition(field, condition):
+    if not isinstance(condition, dict) or not condition or not all(key.startswith('$') for key in condition):
+        return _compare(field, '$eq', condition)
+    clauses, params = [], []
+    for operator, value in condition.items():
+        if operator in ('$eq', '$ne') or operator in _comparisons:
+            sql, operator_params = _compare(field, operator, value)
+        elif operator in ('$in', '$nin'):
+            in_clauses = [_compare(field, '$eq', candidate) for candidate in value]
+            sql = '(' + (' OR '.join(clause for clause, _ in in_clauses) or '0') + ')'
+            operator_params = [param for _, clause_params in in_clauses for param in clause_params]
+            if operator == '$nin':
+                sql = f'NOT {sql}'
+        elif operator == '$exists':
+            exists = '1' if field == _id_field else f'json_type(doc, {_path(field)}) IS NOT NULL'
+            sql, operator_params = (exists if value else f'NOT {exists}'), []
+        elif operator == '$not':
+            sql, operator_params = _field_condition(field, value)
+            sql = f'NOT {sql}'
+        elif operator == '$type':
+            sql, operator_params = _type_condition(field, value), []
+        else:
+            raise UnsupportedFeature(f'{operator} is not supported by the sqlite storage')
+        clauses.append(sql)
+        params.extend(operator_params)
+    return '(' + ' AND '.join(clauses) + ')', params
+
+
+def _where(filter):
+    """Returns the SQL condition and its parameters of a find filter."""
+    clauses, params = [], []
+    for key, condition in filter.items():
+        if key in ('$and', '$or', '$nor'):
+            sub_clauses = [_where(sub_filter) for sub_filter in condition]
+            joiner = ' AND ' if key == '$and' else ' OR '
+            sql = '(' + joiner.join(clause for clause, _ in sub_clauses) + ')' if sub_clauses else '1'
+            if key == '$nor':
+                sql = f'NOT {sql}'
+            clauses.append(sql)
+            params.extend(param for _, clause_params in sub_clauses for param in clause_params)
+        elif key == '$text':
+            raise UnsupportedFeature(f'{FEATURE_TEXT_SEARCH} is not supported by the sqlite storage')
+        elif key.startswith('$'):
+            raise UnsupportedFeature(f'{key} is not supported by the sqlite storage')
+        else:
+            sql, field_params = _field_condition(key, condition)
+            clauses.append(sql)
+            params.extend(field_params)
+    return ' AND '.join(clauses) or '1', params
+
+
+def _project(document, projection):
+    if not projection:
+        return document
+    if not any(projection.values()):
+        return {key: value for key, value in document.items() if projection.get(key, 1)}
+    nested = {}
+    for field, included in projection.items():
+        if included and field != _id_field:
+            head, _, rest = field.partition('.')
+            nested.setdefault(head, []).append(rest)
+    projected = {}
+    for key, value in document.items():
+        if key == _id_field:
+            if projection.get(_id_field, 1):
+                projected[key] = value
+        elif key in nested:
+            if '' in nested[key]:
+                projected[key] = value
+            elif isinstance(value, dict):
+                projected[key] = _project(value, dict({rest: 1 for rest in nested[key]}, **{_id_field: 0}))
+    return projected
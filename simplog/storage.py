@@ -0,0 +1,65 @@
+STORAGE_MONGO = 'mongo'
+STORAGE_SQLITE = 'sqlite'
+
+# optional features of storage engines, beyond the operations of StorageEngine
+FEATURE_AGGREGATE = 'aggregate'             # aggregations(collection.aggregate)
+FEATURE_TEXT_SEARCH = 'text_search'         # text indexes and $search
+FEATURE_RETENTION = 'retention'             # ttl, capped and partitioned groups
+FEATURE_CHANGE_STREAM = 'change_stream'     # tails of the logs inserted by other processes
+
+
+class UnsupportedFeature(NotImplementedError):
+    pass
+
+
+class StorageEngine:
+    """Storage of the logs of groups.
+
+    `log_db` is a database like pymongo Database, of which collections are the groups.
+    Every engine supports the following part of pymongo, which is checked by the conformance tests(test_storage):
+    - `log_db[group_name]`: a collection with `insert_many(documents, ordered=True)`(BulkWriteError of code 11000
+      for duplicate keys), `find(filter, projection)`, `count_documents(filter)`,
+      `create_index(keys, name, unique)`, `drop_index(name)` and `index_information()`
+    - cursors of `find` with `sort(key_or_list)`, `limit(n)`, `batch_size(n)`, `close()` and iteration
+    - filters of $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $not, $and, $or and $nor
+    - `log_db.list_collection_names()` and `log_db.drop_collection(name)`
+    The other features(FEATURE_*) are listed in `features`.
+    """
+    name = None
+    features = frozenset()
+
+    def __init__(self, log_db):
+        self.log_db = log_db
+
+    @property
+    def logs(self):
+        # an engine is used in place of MongoClient, whose `logs` is the database of the logs
+        return self.log_db
+
+    def supports(self, feature):
+        return feature in self.features
+
+    def require(self, feature):
+        if not self.supports(feature):
+            raise UnsupportedFeature(f'{feature} is not supported by the {self.name} storage')
+
+    def close(self):
+        pass
+
+
+class MongoEngine(StorageEngine):
+    """Logs in the `logs` database of mongodb(MongoClient, or mongomock in tests)."""
+    name = STORAGE_MONGO
+    features = frozenset([FEATURE_AGGREGATE, FEATURE_TEXT_SEARCH, FEATURE_RETENTION, FEATURE_CHANGE_STREAM])
+
+    def __init__(self, client):
+        super().__init__(client.logs)
+        self.client = client
+
+    def close(self):
+        self.client.close()
+
+
+def get_storage(db_connection):
+    """Returns the StorageEngine of a MongoClient or an engine."""
+    return db_connection if isinstance(db_connection, StorageEngine) else MongoEngine(db_connection)
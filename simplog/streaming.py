@@ -0,0 +1,157 @@
+import itertools
+import json
+import time
+
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+from zope.interface import implementer
+
+from simplog.metrics import PHASE_DB, PHASE_SERIALIZE, PHASE_WRITE
+
+
+@implementer(IPushProducer)
+class CursorProducer:
+    """Streams the documents of a cursor as a JSON object: {"logs": [...]}
+
+    The cursor is read in batches in the executor, one batch at a time.
+    Each batch is encoded in the worker thread and written as one chunk.
+    The next batch is not fetched while the consumer(transport) is paused, so the memory usage
+    is bounded by the batch size regardless of the number of matched documents.
+
+    `trailer(last_doc, count)` returns the other items of the object(e.g. the next page token),
+    which are written after the documents.
+    `on_complete(body)` is called with the whole response body if it is not larger than `capture_limit` bytes.
+    The time of reading, encoding and writing batches and the number of documents are added to `timer`(RequestTimer).
+    Subclasses write other formats by overriding `encode`, `separator` and `suffix`.
+    """
+    separator = b', '
+
+    def __init__(self, request, executor, cursor, serializer, batch_size=500, key='logs', trailer=None,
+                 on_complete=None, capture_limit=0, timer=None):
+        self.request = request
+        self.executor = executor
+        self.cursor = cursor
+        self.serializer = serializer
+        self.batch_size = batch_size
+        self.prefix = json.dumps({key: []})[:-2].encode('utf-8')     # '{"logs": ['
+        self.trailer = trailer
+        self.on_complete = on_complete
+        self.capture_limit = capture_limit
+        self.timer = timer
+        self.captured = [] if on_complete is not None else None
+        self.captured_size = 0
+        self.last_doc = None
+        self.count = 0
+        self.started = False
+        self.paused = False
+        self.fetching = False
+        self.stopped = False
+
+    def start(self):
+        # the first batch is admitted by the executor limits, ExecutorOverloaded is raised when it is full
+        d = self.executor.submit(self._read_batch)
+        self.fetching = True
+        self.request.registerProducer(self, True)
+        self.request.notifyFinish().addErrback(lambda _: self.stopProducing())
+        d.addCallbacks(self._write_batch, self._fail)
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if not self.fetching and not self.stopped:
+            self._fetch_next_batch()
+
+    def stopProducing(self):
+        if not self.stopped:
+            self.stopped = True
+            if not self.fetching:
+                self.executor.submit_admitted(self.cursor.close)
+
+    def _fetch_next_batch(self):
+        self.fetching = True
+        d = self.executor.submit_admitted(self._read_batch)
+        d.addCallbacks(self._write_batch, self._fail)
+
+    def _read_batch(self):
+        # runs in a worker thread of the executor
+        started = time.perf_counter()
+        docs = list(itertools.islice(self.cursor, self.batch_size))
+        if docs:
+            self.last_doc = docs[-1]
+            self.count += len(docs)
+        fetched = time.perf_counter()
+        chunk = self.encode(docs)
+        if self.timer is not None:
+            self.timer.add(PHASE_DB, fetched - started)
+            self.timer.add(PHASE_SERIALIZE, time.perf_counter() - fetched)
+        return chunk, len(docs) < self.batch_size
+
+    def _write_batch(self, result):
+        self.fetching = False
+        if self.stopped:
+            self.executor.submit_admitted(self.cursor.close)
+            return
+        chunk, exhausted = result
+        if not self.started:
+            self.started = True
+            if self.prefix:
+                self._write(self.prefix)
+        elif chunk and self.separator:
+            self._write(self.separator)
+        if chunk:
+            self._write(chunk)
+        if exhausted:
+            self._finish()
+        elif not self.paused:
+            self._fetch_next_batch()
+
+    def _finish(self):
+        self.stopped = True
+        self.request.unregisterProducer()
+        self._write(self.suffix())
+        if self.timer is not None:
+            self.timer.returned = self.count
+        if self.captured is not None:
+            self.on_complete(b''.join(self.captured))
+        self.request.finish()
+        self.executor.submit_admitted(self.cursor.close)
+
+    def _write(self, data):
+        if self.timer is not None:
+            with self.timer.phase(PHASE_WRITE):
+                self.request.write(data)
+        else:
+            self.request.write(data)
+        if self.captured is not None:
+            self.captured_size += len(data)
+            if self.captured_size <= self.capture_limit:
+                self.captured.append(data)
+            else:
+                self.captured = None    # too large to keep
+
+    def encode(self, docs):
+        # runs in a worker thread of the executor
+        return b', '.join(self.serializer.dumps(doc) for doc in docs)
+
+    def suffix(self):
+        extra = self.trailer(self.last_doc, self.count) if self.trailer is not None else None
+        if not extra:
+            return b']}'
+        return b'], ' + self.serializer.dumps(extra)[1:]
+
+    def _fail(self, failure):
+        self.fetching = False
+        log.err(failure, 'simplog > streaming response failed')
+        if self.stopped:
+            return
+        self.stopped = True
+        self.request.unregisterProducer()
+        if not self.started:
+            self.request.setResponseCode(500)
+            self.request.write(json.dumps({'success': False, 'error': repr(failure.value)}).encode('utf-8'))
+            self.request.finish()
+        else:
+            # the status line is already sent, so the truncated response is the only way to notify the error
+            self.request.loseConnection()
@@ -0,0 +1,217 @@
+import threading
+from collections import defaultdict
+
+from pymongo.errors import PyMongoError
+from twisted.internet import reactor as default_reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+from zope.interface import implementer
+
+CONTENT_TYPE = 'text/event-stream; charset=utf-8'
+
+SOURCE_INGEST = 'ingest'
+SOURCE_CHANGE_STREAM = 'changestream'
+
+_heartbeat = b': heartbeat\n\n'
+_lagged = b'event: lagged\ndata: {}\n\n'
+_retry = b'retry: 3000\n\n'
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+@implementer(IPushProducer)
+class Subscription:
+    """A tail request which receives the events of matched logs.
+
+    Events are buffered while the transport is paused(a slow client), and the subscription is closed
+    with a `lagged` event when more than `max_pending` events are buffered.
+    """
+    def __init__(self, hub, request, group_name, matches, max_pending):
+        self.hub = hub
+        self.request = request
+        self.group_name = group_name
+        self.matches = matches
+        self.max_pending = max_pending
+        self.pending = []
+        self.paused = False
+        self.closed = False
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        pending, self.pending = self.pending, []
+        for data in pending:
+            self.request.write(data)
+
+    def stopProducing(self):
+        self.hub.unsubscribe(self)
+
+    def send(self, data):
+        if self.closed:
+            return
+        if not self.paused:
+            self.request.write(data)
+        elif len(self.pending) < self.max_pending:
+            self.pending.append(data)
+        else:
+            self.close(_lagged)
+
+    def close(self, data=None):
+        if self.closed:
+            return
+        self.hub.unsubscribe(self)
+        self.request.unregisterProducer()
+        if data is not None:
+            self.request.write(data)
+        self.request.finish()
+
+
+class TailHub:
+    """Pushes newly inserted logs to the subscribers of their group as Server-Sent Events.
+
+    Subscriptions cost no timer or database call while they are idle: one heartbeat call writes
+    a comment to all subscribers every `heartbeat_interval` seconds to keep the connections open.
+    With SOURCE_INGEST, logs are published by the POST requests of this process, with SOURCE_CHANGE_STREAM,
+    by ChangeStreamSource(inserts of all processes, requires a replica set).
+    """
+    def __init__(self, serializer, source=SOURCE_INGEST, max_subscribers=10000, max_pending=1000,
+                 heartbeat_interval=15.0, reactor=None):
+        self.serializer = serializer
+        self.source = source
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.reactor = reactor or default_reactor
+        self.subscriptions = defaultdict(set)   # group -> subscriptions
+        self.count = 0
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat = LoopingCall(self.broadcast, _heartbeat)
+        self.heartbeat.clock = self.reactor
+
+    def start(self):
+        self.heartbeat.start(self.heartbeat_interval, now=False)
+
+    def stop(self):
+        if self.heartbeat.running:
+            self.heartbeat.stop()
+        for subscriptions in list(self.subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+
+    def subscribe(self, request, group_name, matches):
+        """Subscribes a request to the logs of a group for which `matches(log_object)`(QueryPlan.matches) is true.
+
+        The headers of the event stream are set before the first write sends them.
+        """
+        if self.count >= self.max_subscribers:
+            raise TooManySubscribers(f'too many subscribers: {self.count}')
+        request.setHeader('Content-Type', CONTENT_TYPE)
+        request.setHeader('Cache-Control', 'no-cache')
+        request.setHeader('X-Accel-Buffering', 'no')    # not buffered by proxies(nginx)
+        subscription = Subscription(self, request, group_name, matches, self.max_pending)
+        self.subscriptions[group_name].add(subscription)
+        self.count += 1
+        request.registerProducer(subscription, True)
+        request.notifyFinish().addBoth(lambda _: self.unsubscribe(subscription))
+        request.write(_retry)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription.closed:
+            return
+        subscription.closed = True
+        self.count -= 1
+        subscriptions = self.subscriptions.get(subscription.group_name)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.group_name]
+
+    def has_subscribers(self, group_name):
+        return group_name in self.subscriptions
+
+    def inserted(self, group_name, logs):
+        """Publishes the logs inserted by a POST request, if the logs are published by the ingest path."""
+        if self.source == SOURCE_INGEST and self.has_subscribers(group_name):
+            self.publish(group_name, logs)
+
+    def inserted_in_thread(self, group_name, logs):
+        # called in a worker thread of the executor
+        if self.source == SOURCE_INGEST and self.has_subscribers(group_name):
+            self.reactor.callFromThread(self.publish, group_name, logs)
+
+    def publish(self, group_name, logs):
+        subscriptions = self.subscriptions.get(group_name)
+        if not subscriptions:
+            return
+        for log_object in logs:
+            event = None
+            for subscription in list(subscriptions):
+                if not subscription.matches(log_object):
+                    continue
+                if event is None:   # encoded once for all subscribers
+                    event = self._event(log_object)
+                subscription.send(event)
+
+    def broadcast(self, data):
+        for subscriptions in list(self.subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.send(data)
+
+    def _event(self, log_object):
+        return b'event: log\nid: %s\ndata: %s\n\n' % (
+            str(log_object.get('_id', '')).encode('utf-8'), self.serializer.dumps(log_object),
+        )
+
+
+class ChangeStreamSource:
+    """Publishes the logs inserted in the database by any process(e.g. other workers) from a change stream.
+
+    The change stream is read in its own thread, and the inserts read at once are published together.
+    `group_of(collection_name)` returns the group of a collection(e.g. of a partition).
+    """
+    max_batch = 1000
+    retry_delay = 1.0
+
+    def __init__(self, log_db, hub, group_of=None, reactor=None):
+        self.log_db = log_db
+        self.hub = hub
+        self.group_of = group_of or (lambda collection_name: collection_name)
+        self.reactor = reactor or default_reactor
+        self.stopping = threading.Event()
+        self.thread = None
+        self.resume_token = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='simplog-tail', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                self._watch()
+            except PyMongoError as e:
+                log.msg(f'simplog > change stream failed, retry in {self.retry_delay}s: {e!r}')
+                self.stopping.wait(self.retry_delay)
+
+    def _watch(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.log_db.watch(pipeline, resume_after=self.resume_token, max_await_time_ms=1000) as stream:
+            while not self.stopping.is_set():
+                inserted = defaultdict(list)
+                for _ in range(self.max_batch):
+                    change = stream.try_next()
+                    if change is None:
+                        break
+                    self.resume_token = stream.resume_token
+                    inserted[self.group_of(change['ns']['coll'])].append(change['fullDocument'])
+                for group_name, logs in inserted.items():
+                    if self.hub.has_subscribers(group_name):
+                        self.reactor.callFromThread(self.hub.publish, group_name, logs)
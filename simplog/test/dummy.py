@@ -1,19 +1,23 @@
 # Reference: Testing Twisted Web Resources, https://bit.ly/2JvuMhA
 
+import io
 import json
+from urllib.parse import urlencode
 
 from twisted.internet.defer import succeed
-from twisted.web.server import Site
+from twisted.internet.address import IPv4Address
+from twisted.internet.error import ConnectionDone
+from twisted.internet.testing import StringTransport
+from twisted.web.server import Site, NOT_DONE_YET
 from twisted.web.test.test_web import DummyRequest
 
 
 class SimplogDummyRequest(DummyRequest):
-    class Content:
+    class Content(io.BytesIO):
         def __init__(self, content_data):
-            self.content_data = content_data
-
-        def getvalue(self):
-            return json.dumps(self.content_data).encode('utf-8')
+            if not isinstance(content_data, bytes):
+                content_data = json.dumps(content_data).encode('utf-8')
+            super().__init__(content_data)
 
     def __init__(self, method, url, args=None, headers=None):
         if isinstance(url, bytes):
@@ -21,7 +25,7 @@ class SimplogDummyRequest(DummyRequest):
         segments = [segment.encode('utf-8') for segment in url.split('/')]
         super().__init__(segments)
 
-        self.method = method
+        self.method = method.encode('ascii')
 
         headers = headers or {}
         args = args or {}
@@ -29,7 +33,7 @@ class SimplogDummyRequest(DummyRequest):
             if isinstance(name, str):
                 name = name.encode('utf-8')
             values = [v.encode('utf-8') if isinstance(v, str) else v for v in values]
-            self.setHeader(name, values)
+            self.requestHeaders.setRawHeaders(name, values)
         for arg_key, arg_value in args.items():
             if isinstance(arg_key, str):
                 arg_key = arg_key.encode('utf-8')
@@ -37,14 +41,44 @@ class SimplogDummyRequest(DummyRequest):
                 arg_value = arg_value.encode('utf-8')
             self.addArg(arg_key, arg_value)
 
+        query_string = urlencode({k: v for k, v in args.items() if k != 'data'}).encode('ascii')
+        self.uri = b'/' + url.encode('utf-8') + (b'?' + query_string if query_string else b'')
         self.content = self.__class__.Content(content_data=args.get('data'))
+        self.producer = None
+        self.connection_lost = False
+
+    def registerProducer(self, producer, streaming):
+        if streaming:
+            self.producer = producer
+        else:
+            super().registerProducer(producer, streaming)
+
+    def unregisterProducer(self):
+        self.producer = None
+        super().unregisterProducer()
+
+    def loseConnection(self):
+        self.connection_lost = True
+        self.processingFailed(ConnectionDone())
+
+    @property
+    def code(self):
+        return self.responseCode or 200
+
+    @property
+    def sentLength(self):
+        return sum(len(data) for data in self.written)
 
     def value(self):
         return ''.join(elem.decode('utf-8') for elem in self.written)
 
 
 def _resolve_result(request, result):
-    if isinstance(result, bytes):
+    if result is NOT_DONE_YET:
+        if request.finished:
+            return succeed(request)
+        return request.notifyFinish().addCallback(lambda _: request)
+    elif isinstance(result, bytes):
         request.write(result)
         request.finish()
         return succeed(request)
@@ -63,8 +97,46 @@ class DummySite(Site):
     def post(self, url, args=None, headers=None):
         return self._request("POST", url, args, headers)
 
+    def delete(self, url, args=None, headers=None):
+        return self._request("DELETE", url, args, headers)
+
     def _request(self, method, url, args, headers):
         request = SimplogDummyRequest(method, url, args, headers)
         resource = self.getResourceFor(request)
         result = resource.render(request)
         return _resolve_result(request, result)
+
+
+def serve_http(site, method, url, headers=None, body=b''):
+    """Sends an HTTP/1.0 request through the HTTP channel and the request factory of `site`, unlike DummySite.
+
+    Returns the transport which receives the response, and a Deferred fired when the request is finished.
+    """
+    channel = site.buildProtocol(None)
+    channel.timeOut = None
+    finished = []
+    request_factory = channel.requestFactory
+
+    def create_request(*args, **kwargs):
+        request = request_factory(*args, **kwargs)
+        finished.append(request.notifyFinish())
+        return request
+    channel.requestFactory = create_request
+    transport = StringTransport(peerAddress=IPv4Address('TCP', '127.0.0.1', 50000))
+    channel.makeConnection(transport)
+    lines = [f'{method} /{url} HTTP/1.0'.encode('ascii'), b'Content-Length: %d' % len(body)]
+    for name, value in (headers or {}).items():
+        lines.append(f'{name}: {value}'.encode('ascii'))
+    channel.dataReceived(b'\r\n'.join(lines) + b'\r\n\r\n' + body)
+    return transport, finished[0].addCallback(lambda _: transport)
+
+
+def parse_response(data):
+    """Returns the status code, the headers({lower case name: value}) and the body of a raw HTTP response."""
+    head, _, body = data.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('ascii').split('\r\n')
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return int(status_line.split(' ')[1]), headers, body
@@ -0,0 +1,115 @@
+from twisted.trial import unittest
+
+from simplog.admission import AdmissionControl, InvalidQuota, Quota, QuotaExceeded
+from simplog.executor import ExecutorOverloaded
+from simplog.paging import PageOptions
+
+
+class DummyExecutor:
+    capacity = 10
+    pending = 0
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.executor = DummyExecutor()
+        self.admission = AdmissionControl(
+            group_quotas={
+                'noisy': Quota.from_dict({'requests': 2, 'docs': 100}), '*': Quota.from_dict({'bytes': 1000}),
+            },
+            client_quotas={'10.0.0.1': Quota.from_dict({'requests': 1, 'burst': 3})},
+            executor=self.executor, read_share=0.8, max_result_logs=500, clock=lambda: self.now,
+        )
+
+    def test_admit_Test_requests_quota(self):
+        # Given
+        self.admission.admit('noisy', '10.0.0.2')
+        self.admission.admit('noisy', '10.0.0.2')
+
+        # When
+        with self.assertRaises(QuotaExceeded) as raised:
+            self.admission.admit('noisy', '10.0.0.2')
+        self.now += 0.5
+        self.admission.admit('noisy', '10.0.0.2')
+
+        # Then
+        self.assertEqual(raised.exception.retry_after, 1, 'Retry-After should be the seconds to the next token')
+        self.admission.admit('web', '10.0.0.2')     # the other groups are not limited by the requests
+
+    def test_admit_groups_Test_requests_quota(self):
+        # Given
+        self.admission.admit('noisy', '10.0.0.2')
+        self.admission.admit_groups(['web', 'noisy'])
+
+        # When
+        with self.assertRaises(QuotaExceeded):
+            self.admission.admit_groups(['web', 'noisy'])
+
+        # Then
+        self.admission.admit_groups(['web'])
+        with self.assertRaises(QuotaExceeded, msg='a request over the quota of any group should be rejected'):
+            self.admission.admit('noisy', '10.0.0.2')
+
+    def test_admit_Test_client_quota_Cond_burst(self):
+        # Given
+        for _ in range(3):
+            self.admission.admit('web', '10.0.0.1')
+
+        # When
+        # Then
+        with self.assertRaises(QuotaExceeded):
+            self.admission.admit('audit', '10.0.0.1')
+        self.admission.admit('audit', '10.0.0.2')
+
+    def test_charge_docs_Test_admit(self):
+        # Given
+        self.admission.admit('noisy', None, write=True)
+
+        # When
+        self.admission.charge_docs('noisy', None, 300)
+
+        # Then
+        with self.assertRaises(QuotaExceeded) as raised:
+            self.admission.admit('noisy', None, write=True)
+        self.assertEqual(raised.exception.retry_after, 2, 'the debt of docs should delay the next request')
+        self.now += 2
+        self.admission.admit('noisy', None, write=True)
+
+    def test_admit_Test_bytes_quota(self):
+        # Given
+        self.admission.admit('web', None, write=True, size=5000)    # a body larger than the burst is admitted once
+
+        # When
+        # Then
+        with self.assertRaises(QuotaExceeded):
+            self.admission.admit('web', None, write=True, size=10)
+
+    def test_admit_Test_read_share(self):
+        # Given
+        self.executor.pending = 8
+
+        # When
+        # Then
+        with self.assertRaises(ExecutorOverloaded):
+            self.admission.admit('web', None)
+        self.admission.admit('web', None, write=True)
+
+    def test_limit_page_Test_limit(self):
+        # Given
+        pages = [PageOptions(), PageOptions(limit=1000), PageOptions(limit=10)]
+
+        # When
+        for page in pages:
+            self.admission.limit_page(page)
+
+        # Then
+        self.assertEqual([page.limit for page in pages], [500, 500, 10])
+
+    def test_from_dict_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_quota in [[], {'requests': 0}, {'docs': '10'}, {'rps': 1}, {'bytes': True}]:
+            with self.assertRaises(InvalidQuota, msg=f'{invalid_quota} should be rejected'):
+                Quota.from_dict(invalid_quota)
@@ -1,11 +1,28 @@
+import datetime
+import gzip
 import json
+import os
+import shutil
+import tempfile
+import threading
 
 import mongomock
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.internet.task import Clock
 from twisted.trial import unittest
 
+from simplog.admission import AdmissionControl, LimitedRequest, Quota
 from simplog.apiserver import SimplogHome
-from simplog.test.dummy import DummySite
+from simplog.buffer import WriteBuffers
+from simplog.cache import ResponseCache
+from simplog.compression import CompressingSite, ResponseCompression
+from simplog.executor import BoundedExecutor
+from simplog.indexes import IndexManager, IndexSpec
+from simplog.retention import RetentionManager, RetentionPolicy
+from simplog.schema import GroupSchema, IngestSchemas
+from simplog.spool import Spool, SpoolDrainer
+from simplog.sqlite_storage import SQLiteEngine
+from simplog.test.dummy import DummySite, parse_response, serve_http
 
 
 class SimplogTestCase(unittest.TestCase):
@@ -24,7 +41,13 @@ class SimplogTestCase(unittest.TestCase):
             # the ObjectId is converted to str to be compared with _id field(str) in the written data
             log_object['_id'] = str(movie_group_collection.insert_one(log_object).inserted_id)
 
-        self.web = DummySite(SimplogHome(connection))
+        self.executor = BoundedExecutor(max_workers=2, max_queue=2)
+        self.executor.start()
+        self.index_manager = IndexManager(self.log_db, self.executor)
+        self.web = DummySite(SimplogHome(connection, self.executor, index_manager=self.index_manager))
+
+    def tearDown(self):
+        self.executor.stop()
 
     def get_logs(self, collection_name):
         return [
@@ -64,7 +87,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -81,7 +104,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'text': '[I:J]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -98,7 +121,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'text': '[:W]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -116,7 +139,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'text': '[M:]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -133,7 +156,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'year:int': '1984'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -149,7 +172,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'year:int': '[1980:2008]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -166,7 +189,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'year:int': '[:1984]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -183,7 +206,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'year:int': '[1980:]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -201,7 +224,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'stars:float': '[3.5:4.0]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -218,7 +241,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'stars:float': '[:4.3]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -236,7 +259,7 @@ class SimplogTestCase(unittest.TestCase):
         # Given
         # When
         response = yield self.web.get(b'groups/movie', args={'stars:float': '[4.0:]'})
-        result = json.loads(response.written[0].decode('utf-8'))
+        result = json.loads(response.value())
 
         # Then
         expected_result = [
@@ -295,7 +318,7 @@ class SimplogTestCase(unittest.TestCase):
         response = yield self.web.post(b'groups/movie', args={'data': new_logs})
 
         # Then
-        response_data = response.written[0].decode('utf-8')
+        response_data = response.value()
         result = json.loads(response_data)
         self.assertTrue(result['success'], 'POST /groups/movie should return success')
         self.assertEqual(len(result['id']), 2, 'POST /groups/movie should return 2 ids')
@@ -311,7 +334,7 @@ class SimplogTestCase(unittest.TestCase):
 
         # When
         response = yield self.web.post(b'groups/movie', args={'data': new_logs})
-        response_data = response.written[0].decode('utf-8')
+        response_data = response.value()
         result = json.loads(response_data)
         for i, inserted_id in enumerate(result['id']):
             new_logs[i]['_id'] = inserted_id
@@ -333,7 +356,7 @@ class SimplogTestCase(unittest.TestCase):
 
         # When
         response = yield self.web.post(b'groups/game', args={'data': new_logs})
-        response_data = response.written[0].decode('utf-8')
+        response_data = response.value()
         result = json.loads(response_data)
         for i, inserted_id in enumerate(result['id']):
             new_logs[i]['_id'] = inserted_id
@@ -347,3 +370,838 @@ class SimplogTestCase(unittest.TestCase):
             self.get_logs('movie'), self.movie_log_objects,
             'POST /groups/game should not change data in movie collection',
         )
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_code_Cond_executor_overloaded(self):
+        # Given
+        release = threading.Event()
+        blocked = [self.executor.submit(release.wait) for _ in range(self.executor.capacity)]
+
+        # When
+        response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        release.set()
+        yield DeferredList(blocked)
+
+        # Then
+        self.assertEqual(
+            response.responseCode, 503,
+            f'GET /groups/movie should return 503 when the executor is full: result={response.responseCode}'
+        )
+        self.assertEqual(response.responseHeaders.getRawHeaders('Retry-After'), ['1'])
+        self.assertFalse(json.loads(response.value())['success'])
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_streamed_in_batches(self):
+        # Given
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, stream_batch_size=1))
+
+        # When
+        response = yield self.web.get(b'groups/movie', args={'year:int': '[1980:]'})
+        result = json.loads(response.value())
+
+        # Then
+        expected_result = [
+            self.movie_log_objects[0],
+            self.movie_log_objects[2],
+            self.movie_log_objects[3],
+        ]
+        self.assertListEqual(result['logs'], expected_result)
+        self.assertGreater(len(response.written), len(expected_result), 'logs should be written in chunks')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_limit(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie', args={'$limit': '3'})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertListEqual(
+            result['logs'], self.movie_log_objects[:3],
+            'GET /groups/movie?$limit=3 should return the first 3 logs'
+        )
+        self.assertIsNotNone(result['next'], 'GET /groups/movie?$limit=3 should return the next page token')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_pages_sorted(self):
+        # Given
+        logs = []
+        args = {'$limit': '3', '$sort': '-stars'}
+
+        # When
+        while True:
+            response = yield self.web.get(b'groups/movie', args=args)
+            result = json.loads(response.value())
+            logs.extend(result['logs'])
+            if result['next'] is None:
+                break
+            args['$after'] = result['next']
+
+        # Then
+        expected_result = [
+            self.movie_log_objects[2],
+            self.movie_log_objects[3],
+            self.movie_log_objects[1],
+            self.movie_log_objects[0],
+        ]
+        self.assertListEqual(
+            logs, expected_result,
+            'GET /groups/movie?$limit=3&$sort=-stars should return all logs page by page in stars descending order'
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_fields(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie', args={'title': 'StarWars', '$fields': 'year,subtitle'})
+        result = json.loads(response.value())
+
+        # Then
+        expected_result = [
+            {k: v for k, v in self.movie_log_objects[i].items() if k in ('_id', 'year', 'subtitle')}
+            for i in (1, 3)
+        ]
+        self.assertListEqual(
+            result['logs'], expected_result,
+            'GET /groups/movie?title=StarWars&$fields=year,subtitle should return only _id, year and subtitle'
+        )
+        self.assertNotIn('next', result, 'GET without $limit should not return the next page token')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_code_Cond_invalid_arguments(self):
+        # Given
+        # When
+        invalid_limit_response = yield self.web.get(b'groups/movie', args={'$limit': 'many'})
+        invalid_after_response = yield self.web.get(b'groups/movie', args={'$after': 'not-a-token'})
+        invalid_int_response = yield self.web.get(b'groups/movie', args={'year:int': 'recent'})
+
+        # Then
+        self.assertEqual(invalid_limit_response.responseCode, 400, '$limit should be integer')
+        self.assertEqual(invalid_after_response.responseCode, 400, '$after should be a token in a response')
+        self.assertEqual(invalid_int_response.responseCode, 400, 'year:int should be integer')
+
+    @inlineCallbacks
+    def test_GET_log_group_indexes_Test_response_data(self):
+        # Given
+        yield self.index_manager.create('movie', IndexSpec.from_dict({'keys': ['title', '-year']}))
+
+        # When
+        response = yield self.web.get(b'groups/movie/indexes')
+        result = json.loads(response.value())
+
+        # Then
+        self.assertIn(
+            dict(name='title_1_year_-1', keys=['title', '-year'], unique=False, status='ready'), result['indexes'],
+            'GET /groups/movie/indexes should return the created index'
+        )
+
+    @inlineCallbacks
+    def test_POST_log_group_indexes_Test_response_data(self):
+        # Given
+        # When
+        response = yield self.web.post(b'groups/movie/indexes', args={'data': {'keys': ['year'], 'unique': True}})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertEqual(response.responseCode, 202, 'POST /groups/movie/indexes should return 202 Accepted')
+        self.assertEqual(result['index'], dict(name='year_1', keys=['year'], unique=True, status='building'))
+
+    @inlineCallbacks
+    def test_POST_log_group_indexes_Test_response_code_Cond_invalid_spec(self):
+        # Given
+        # When
+        response = yield self.web.post(b'groups/movie/indexes', args={'data': {'keys': 'year'}})
+
+        # Then
+        self.assertEqual(response.responseCode, 400, 'POST /groups/movie/indexes should reject invalid keys')
+
+    @inlineCallbacks
+    def test_DELETE_log_group_indexes_Test_db_indexes(self):
+        # Given
+        yield self.index_manager.create('movie', IndexSpec.from_dict({'keys': ['year']}))
+
+        # When
+        response = yield self.web.delete(b'groups/movie/indexes/year_1')
+
+        # Then
+        self.assertTrue(json.loads(response.value())['success'])
+        self.assertNotIn('year_1', self.log_db.movie.index_information(), 'the index should be dropped')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_auto_index(self):
+        # Given
+        self.index_manager.auto_index_threshold = 2
+
+        # When
+        yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        yield self.web.get(b'groups/movie', args={'title': 'DarkKnight', '$sort': 'year'})
+        response = yield self.web.get(b'groups/movie/indexes')
+        result = json.loads(response.value())
+
+        # Then
+        self.assertIn('title_1', self.index_manager.builds['movie'], 'title should be indexed after 2 queries')
+        self.assertNotIn('year_1', self.index_manager.builds['movie'], 'year should not be indexed after 1 query')
+        self.assertEqual(result['field_usage'], {'title': 2, 'year': 1})
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_db_data_Cond_ndjson(self):
+        # Given
+        new_logs = [
+            dict(title='Frozen', message="Let It Go"),
+            dict(title='JurassicPark', message="Life finds a Way", director="Steven Spielberg"),
+        ]
+        body = ''.join(json.dumps(log) + '\n' for log in new_logs).encode('utf-8')
+
+        # When
+        response = yield self.web.post(
+            b'groups/movie', args={'data': body}, headers={'Content-Type': ['application/x-ndjson']},
+        )
+        result = json.loads(response.value())
+
+        # Then
+        self.assertEqual(result, dict(success=True, inserted=2, error_count=0, errors=[]))
+        self.assertListEqual(
+            [{k: v for k, v in log.items() if k != '_id'} for log in self.get_logs('movie')[-2:]], new_logs,
+            'POST /groups/movie with NDJSON should store each line as a log',
+        )
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_data_Cond_gzip_ndjson_with_invalid_lines(self):
+        # Given
+        body = gzip.compress(b'{"title": "Frozen"}\n{"title": \n\n[1, 2]\n{"title": "Up"}\n')
+
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': body}, headers={
+            'Content-Type': ['application/x-ndjson'],
+            'Content-Encoding': ['gzip'],
+        })
+        result = json.loads(response.value())
+
+        # Then
+        self.assertFalse(result['success'], 'POST /groups/movie with invalid lines should not succeed')
+        self.assertEqual(result['inserted'], 2, 'valid lines should be inserted')
+        self.assertEqual([error['line'] for error in result['errors']], [2, 4], 'invalid lines should be reported')
+        self.assertEqual(self.log_db.movie.count_documents({'title': {'$in': ['Frozen', 'Up']}}), 2)
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_db_data_Cond_gzip(self):
+        # Given
+        body = gzip.compress(json.dumps([dict(title='Frozen'), dict(title='Up')]).encode('utf-8'))
+
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': body}, headers={'Content-Encoding': ['gzip']})
+        broken = yield self.web.post(b'groups/movie', args={'data': body[:-8]}, headers={'Content-Encoding': ['gzip']})
+
+        # Then
+        self.assertTrue(json.loads(response.value())['success'], 'POST with a gzip body should succeed')
+        self.assertEqual(self.log_db.movie.count_documents({'title': {'$in': ['Frozen', 'Up']}}), 2)
+        self.assertEqual(broken.responseCode, 400, 'a broken gzip body should be rejected')
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_code_Cond_unsupported_encoding(self):
+        # Given
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': b'{}\n'}, headers={
+            'Content-Type': ['application/x-ndjson'],
+            'Content-Encoding': ['compress'],
+        })
+
+        # Then
+        self.assertEqual(response.responseCode, 415, 'unsupported Content-Encoding should be rejected')
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_db_data_Cond_write_buffer(self):
+        # Given
+        clock = Clock()
+        write_buffers = WriteBuffers(self.log_db, self.executor, max_size=3, reactor=clock)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, write_buffers=write_buffers))
+        new_logs = [
+            dict(title='Frozen', message="Let It Go"),
+            dict(title='JurassicPark', message="Life finds a Way", director="Steven Spielberg"),
+        ]
+
+        # When
+        first = self.web.post(b'groups/movie', args={'data': new_logs[:1]})
+        second = self.web.post(b'groups/movie', args={'data': new_logs[1:]})
+        self.assertFalse(first.called, 'POST should wait for the buffered logs to be written')
+        clock.advance(write_buffers.max_delay)
+        responses = yield DeferredList([first, second])
+
+        # Then
+        log_ids = []
+        for _, response in responses:
+            result = json.loads(response.value())
+            self.assertTrue(result['success'])
+            log_ids.extend(result['id'])
+        for log_id, new_log in zip(log_ids, new_logs):
+            new_log['_id'] = log_id
+        self.assertListEqual(self.get_logs('movie'), self.movie_log_objects + new_logs)
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_data_Cond_write_buffer_ack_buffered(self):
+        # Given
+        clock = Clock()
+        write_buffers = WriteBuffers(self.log_db, self.executor, ack='buffered', reactor=clock)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, write_buffers=write_buffers))
+
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': [dict(title='Frozen')]})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertTrue(result['success'], 'POST should return before the logs are written')
+        self.assertEqual(self.log_db.movie.count_documents({'title': 'Frozen'}), 0)
+        yield write_buffers.close()
+        self.assertEqual(self.get_logs('movie')[-1], dict(_id=result['id'][0], title='Frozen'))
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_db_data_Cond_spool(self):
+        # Given
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        spool = Spool(directory)
+        spool.open()
+        self.addCleanup(spool.close)
+        drainer = SpoolDrainer(spool, self.executor, self.log_db.get_collection, reactor=Clock())
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, spool=spool))
+
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': [dict(title='Frozen')]})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertTrue(result['success'], 'POST should return after the logs are spooled')
+        self.assertEqual(self.log_db.movie.count_documents({'title': 'Frozen'}), 0)
+        drainer.drain()
+        while drainer.draining:
+            yield self.executor.submit_admitted(lambda: None)
+        self.assertEqual(self.get_logs('movie')[-1], dict(_id=result['id'][0], title='Frozen'))
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_data_Cond_invalid_logs(self):
+        # Given
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': {'title': 'Frozen'}})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertFalse(result['success'], 'POST /groups/movie should reject logs which are not a list')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_cached(self):
+        # Given
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, cache=ResponseCache()))
+        first_response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        self.log_db.movie.insert_one(dict(title='StarWars', subtitle='Return of the Jedi'))
+
+        # When
+        response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+
+        # Then
+        self.assertEqual(response.value(), first_response.value(), 'second GET should return the cached response')
+        self.assertEqual(
+            response.responseHeaders.getRawHeaders('ETag'), first_response.responseHeaders.getRawHeaders('ETag'),
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_code_Cond_if_none_match(self):
+        # Given
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, cache=ResponseCache()))
+        first_response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        etag = first_response.responseHeaders.getRawHeaders('ETag')[0]
+
+        # When
+        response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'}, headers={'If-None-Match': [etag]})
+
+        # Then
+        self.assertEqual(response.responseCode, 304, 'GET with the etag of the cached response should return 304')
+        self.assertEqual(response.value(), '')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_code_Cond_if_none_match_Str_site(self):
+        # Given
+        site = CompressingSite(
+            SimplogHome(self.log_db.client, self.executor, cache=ResponseCache()),
+            compression=ResponseCompression(['gzip']), requestFactory=LimitedRequest,
+        )
+        _, first_finished = serve_http(site, 'GET', 'groups/movie?title=StarWars')
+        _, first_headers, _ = parse_response((yield first_finished).value())
+
+        # When
+        _, finished = serve_http(site, 'GET', 'groups/movie?title=StarWars', headers={
+            'If-None-Match': first_headers['etag'], 'Accept-Encoding': 'gzip',
+        })
+        code, _, body = parse_response((yield finished).value())
+
+        # Then
+        self.assertEqual(code, 304, 'the headers of an empty response should be sent')
+        self.assertEqual(body, b'')
+
+    @inlineCallbacks
+    def test_HEAD_metrics_Test_response_code_Str_site(self):
+        # Given
+        site = CompressingSite(self.web.resource, compression=None, requestFactory=LimitedRequest)
+
+        # When
+        _, finished = serve_http(site, 'HEAD', 'metrics')
+        code, headers, body = parse_response((yield finished).value())
+
+        # Then
+        self.assertEqual(code, 200)
+        self.assertIn('content-type', headers)
+        self.assertEqual(body, b'')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_cache_invalidated_by_POST(self):
+        # Given
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, cache=ResponseCache()))
+        first_response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        etag = first_response.responseHeaders.getRawHeaders('ETag')[0]
+        new_log = dict(title='StarWars', subtitle='Return of the Jedi')
+
+        # When
+        post_response = yield self.web.post(b'groups/movie', args={'data': [new_log]})
+        new_log['_id'] = json.loads(post_response.value())['id'][0]
+        response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'}, headers={'If-None-Match': [etag]})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertIn(response.responseCode, [200, None], 'GET after POST should not return 304')
+        self.assertListEqual(result['logs'], [self.movie_log_objects[1], self.movie_log_objects[3], new_log])
+        self.assertNotEqual(response.responseHeaders.getRawHeaders('ETag')[0], etag)
+
+    @inlineCallbacks
+    def test_GET_log_group_count_Test_response_data(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie/count', args={'title': 'StarWars'})
+
+        # Then
+        self.assertEqual(json.loads(response.value()), {'count': 2}, 'GET /groups/movie/count?title=StarWars')
+
+    @inlineCallbacks
+    def test_GET_log_group_groupby_Test_response_data(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie/groupby/title', args={'$limit': '2'})
+
+        # Then
+        expected_result = {
+            'field': 'title',
+            'groups': [{'value': 'StarWars', 'count': 2}, {'value': 'DarkKnight', 'count': 1}],
+        }
+        self.assertEqual(
+            json.loads(response.value()), expected_result,
+            'GET /groups/movie/groupby/title?$limit=2 should return 2 titles with the most logs'
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_stats_Test_response_data(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie/stats/stars', args={'year:int': '[1980:]'})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['min'], 3.9)
+        self.assertEqual(result['max'], 4.3)
+        self.assertAlmostEqual(result['avg'], (3.9 + 4.3 + 4.0) / 3)
+        self.assertAlmostEqual(result['sum'], 3.9 + 4.3 + 4.0)
+
+    @inlineCallbacks
+    def test_GET_log_group_histogram_Test_response_data(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie/histogram/year', args={'$interval': '10'})
+        result = json.loads(response.value())
+
+        # Then
+        self.assertEqual(
+            result['buckets'],
+            [{'start': 1970, 'count': 1}, {'start': 1980, 'count': 2}, {'start': 2000, 'count': 1}],
+            'GET /groups/movie/histogram/year?$interval=10 should return the number of logs in each decade'
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_histogram_Test_response_data_Cond_date(self):
+        # Given
+        base = datetime.datetime(2020, 4, 10, 12, 0)
+        self.log_db.server.insert_many([
+            dict(level='ERROR', created=base + datetime.timedelta(minutes=minutes)) for minutes in (1, 20, 59, 61)
+        ])
+
+        # When
+        response = yield self.web.get(
+            b'groups/server/histogram/created:date', args={'$interval': '3600', 'level': 'ERROR'},
+        )
+        result = json.loads(response.value())
+
+        # Then
+        self.assertEqual(
+            result['buckets'],
+            [{'start': '2020-04-10T12:00:00', 'count': 3}, {'start': '2020-04-10T13:00:00', 'count': 1}],
+            'GET /groups/server/histogram/created:date?$interval=3600 should return the number of logs in each hour'
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_schema(self):
+        # Given
+        schemas = IngestSchemas({
+            'server': GroupSchema.from_dict({'fields': {'created': 'date', 'code': 'int'}, 'ingested': True}),
+        })
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, schemas=schemas))
+        yield self.web.post(b'groups/server', args={'data': [
+            dict(code='500', created='2020-04-10T12:30:00'),
+            dict(code=404, created='2020-04-10T22:00:00+09:00'),
+            dict(code='503', created=1586534400),
+        ]})
+
+        # When
+        response = yield self.web.get(b'groups/server', args={'created': '[2020-04-10T12:00:00:2020-04-10T16:00:00]'})
+        error_response = yield self.web.get(b'groups/server', args={'code': '[500:]', '$sort': 'created'})
+        histogram_response = yield self.web.get(b'groups/server/histogram/created', args={'$interval': '3600'})
+
+        # Then
+        stored = list(self.log_db.server.find({}, {'_id': False}))
+        self.assertEqual([(log['code'], log['created']) for log in stored], [
+            (500, datetime.datetime(2020, 4, 10, 12, 30)),
+            (404, datetime.datetime(2020, 4, 10, 13, 0)),
+            (503, datetime.datetime(2020, 4, 10, 16, 0)),
+        ], 'declared fields should be stored as int and UTC dates')
+        self.assertTrue(all(isinstance(log['_ingested'], datetime.datetime) for log in stored))
+        self.assertEqual([log['code'] for log in json.loads(response.value())['logs']], [500, 404])
+        self.assertEqual([log['code'] for log in json.loads(error_response.value())['logs']], [500, 503])
+        self.assertEqual(
+            [bucket['start'] for bucket in json.loads(histogram_response.value())['buckets']],
+            ['2020-04-10T12:00:00', '2020-04-10T13:00:00', '2020-04-10T16:00:00'],
+        )
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_data_Cond_schema_invalid_values(self):
+        # Given
+        schemas = IngestSchemas({'server': GroupSchema.from_dict({'fields': {'code': 'int'}})})
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, schemas=schemas))
+        body = b'{"code": "500"}\n{"code": "unknown"}\n{"code": 200}\n'
+
+        # When
+        response = yield self.web.post(b'groups/server', args={'data': [dict(code=200), dict(code='unknown')]})
+        ndjson_response = yield self.web.post(
+            b'groups/server', args={'data': body}, headers={'Content-Type': ['application/x-ndjson']},
+        )
+
+        # Then
+        self.assertFalse(json.loads(response.value())['success'], 'logs with an invalid value should be rejected')
+        result = json.loads(ndjson_response.value())
+        self.assertEqual((result['inserted'], [error['line'] for error in result['errors']]), (2, [2]))
+        self.assertEqual([log['code'] for log in self.log_db.server.find()], [500, 200])
+
+    @inlineCallbacks
+    def test_GET_log_groups_Test_response_data(self):
+        # Given
+        base = datetime.datetime(2020, 4, 10, 12, 0)
+        for group_name, minutes in [('api-eu', (1, 4, 6)), ('api-us', (2, 5)), ('web', (3, 7))]:
+            self.log_db[group_name].insert_many([
+                dict(request_id='r1', created=base + datetime.timedelta(minutes=m), minute=m) for m in minutes
+            ])
+            self.log_db[group_name].insert_one(dict(request_id='r2', created=base))
+
+        # When
+        response = yield self.web.get(b'groups', args={
+            '$groups': 'web,api-*', 'request_id': 'r1', '$sort': '-created', '$limit': '4',
+        })
+        result = json.loads(response.value())
+        next_response = yield self.web.get(b'groups', args={
+            '$groups': 'web,api-*', 'request_id': 'r1', '$sort': '-created', '$limit': '4', '$after': result['next'],
+        })
+        no_groups_response = yield self.web.get(b'groups', args={'request_id': 'r1'})
+
+        # Then
+        self.assertEqual(
+            [(log['_group'], log['minute']) for log in result['logs']],
+            [('web', 7), ('api-eu', 6), ('api-us', 5), ('api-eu', 4)],
+            'GET /groups?$groups=web,api-* should return the logs of the groups merged in the sort order',
+        )
+        self.assertEqual([log['minute'] for log in json.loads(next_response.value())['logs']], [3, 2, 1])
+        self.assertEqual(no_groups_response.responseCode, 400, '$groups should be required')
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_code_Cond_admission(self):
+        # Given
+        admission = AdmissionControl(
+            group_quotas={'movie': Quota.from_dict({'requests': 1, 'docs': 2})}, max_body_bytes=1000, clock=lambda: 0,
+        )
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, admission=admission))
+
+        # When
+        large_response = yield self.web.post(b'groups/movie', args={'data': [dict(text='x' * 1000)]})
+        response = yield self.web.post(b'groups/movie', args={'data': [dict(title='Up'), dict(title='Cars')]})
+        limited_response = yield self.web.post(b'groups/movie', args={'data': [dict(title='Frozen')]})
+
+        # Then
+        self.assertEqual(large_response.responseCode, 413, 'a body larger than max_body_bytes should be rejected')
+        self.assertTrue(json.loads(response.value())['success'])
+        self.assertEqual(limited_response.responseCode, 429, 'a request beyond the quota should be rejected')
+        self.assertEqual(limited_response.responseHeaders.getRawHeaders('Retry-After'), ['1'])
+        self.assertEqual(len(self.get_logs('movie')), len(self.movie_log_objects) + 2)
+
+    @inlineCallbacks
+    def test_GET_log_groups_Test_response_code_Cond_admission(self):
+        # Given
+        admission = AdmissionControl(group_quotas={'movie': Quota.from_dict({'requests': 1})}, clock=lambda: 0)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, admission=admission))
+        self.log_db.server.insert_one(dict(code=200))
+
+        # When
+        response = yield self.web.get(b'groups', args={'$groups': 'movie,serv*'})
+        limited_response = yield self.web.get(b'groups', args={'$groups': 'serv*,movie'})
+        other_response = yield self.web.get(b'groups', args={'$groups': 'serv*'})
+        limited_tail_response = yield self.web.get(b'groups/movie/tail')
+
+        # Then
+        self.assertEqual(len(json.loads(response.value())['logs']), len(self.movie_log_objects) + 1)
+        self.assertEqual(limited_response.responseCode, 429, 'the quota of each group should limit GET /groups')
+        self.assertEqual(limited_response.responseHeaders.getRawHeaders('Retry-After'), ['1'])
+        self.assertEqual(json.loads(other_response.value())['logs'][0]['code'], 200)
+        self.assertEqual(limited_tail_response.responseCode, 429, 'subscriptions should be limited by the quota')
+        self.assertNotIn('movie', self.web.resource.tail.subscriptions)
+
+    @inlineCallbacks
+    def test_POST_log_group_Test_response_code_Cond_admission_compressed(self):
+        # Given
+        admission = AdmissionControl(max_body_bytes=10000)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, admission=admission))
+        body = gzip.compress(json.dumps([dict(text=' ' * 10 ** 6)]).encode('utf-8'))
+
+        # When
+        response = yield self.web.post(b'groups/movie', args={'data': body}, headers={'Content-Encoding': ['gzip']})
+
+        # Then
+        self.assertLess(len(body), 10000)
+        self.assertEqual(response.responseCode, 413, 'a body decompressed beyond max_body_bytes should be rejected')
+        self.assertEqual(len(self.get_logs('movie')), len(self.movie_log_objects))
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_code_Cond_admission_cached(self):
+        # Given
+        admission = AdmissionControl(group_quotas={'movie': Quota.from_dict({'requests': 2})}, clock=lambda: 0)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, cache=ResponseCache(), admission=admission))
+        first_response = yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        yield self.web.get(b'groups/movie/count', args={'title': 'StarWars'})
+        etag = first_response.responseHeaders.getRawHeaders('ETag')[0]
+
+        # When
+        cached_responses = []
+        for _ in range(3):
+            cached_responses.append((yield self.web.get(b'groups/movie', args={'title': 'StarWars'})))
+            cached_responses.append((yield self.web.get(b'groups/movie/count', args={'title': 'StarWars'})))
+        not_modified_response = yield self.web.get(
+            b'groups/movie', args={'title': 'StarWars'}, headers={'If-None-Match': [etag]},
+        )
+        limited_response = yield self.web.get(b'groups/movie', args={'title': 'Up'})
+
+        # Then
+        self.assertEqual(
+            [response.responseCode for response in cached_responses], [None] * 6,
+            'cached responses should not be limited by the quotas',
+        )
+        self.assertEqual(not_modified_response.responseCode, 304)
+        self.assertEqual(limited_response.responseCode, 429)
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_max_result_logs(self):
+        # Given
+        admission = AdmissionControl(max_result_logs=3)
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, admission=admission))
+
+        # When
+        response = yield self.web.get(b'groups/movie')
+        result = json.loads(response.value())
+        next_response = yield self.web.get(b'groups/movie', args={'$after': result['next']})
+
+        # Then
+        self.assertEqual(len(result['logs']), 3, 'logs should be limited to max_result_logs')
+        self.assertEqual(len(json.loads(next_response.value())['logs']), 1, 'the rest should be in the next page')
+
+    @inlineCallbacks
+    def test_GET_log_group_aggregation_Test_response_code_Cond_invalid_arguments(self):
+        # Given
+        # When
+        no_interval_response = yield self.web.get(b'groups/movie/histogram/year')
+        short_response = yield self.web.get(b'groups/movie/histogram/released:date', args={'$interval': '1e-4'})
+        count_field_response = yield self.web.get(b'groups/movie/count/title')
+        no_field_response = yield self.web.get(b'groups/movie/stats')
+        unknown_argument_response = yield self.web.get(b'groups/movie/count', args={'$sort': 'year'})
+
+        # Then
+        self.assertEqual(no_interval_response.responseCode, 400, 'histogram should require $interval')
+        self.assertEqual(short_response.responseCode, 400, 'dates should be in intervals of at least 1ms')
+        self.assertEqual(count_field_response.responseCode, 400, 'count should not take a field')
+        self.assertEqual(no_field_response.responseCode, 400, 'stats should require a field')
+        self.assertEqual(unknown_argument_response.responseCode, 400, 'count should not take $sort')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_sqlite_storage(self):
+        # Given
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = SQLiteEngine(os.path.join(directory, 'logs.db'))
+        self.addCleanup(storage.close)
+        self.web = DummySite(SimplogHome(storage, self.executor))
+        yield self.web.post(b'groups/movie', args={'data': self.movie_log_objects})
+
+        # When
+        response = yield self.web.get(b'groups/movie', args={'year:int': '[1980:]', '$sort': '-year'})
+        count_response = yield self.web.get(b'groups/movie/count', args={'year:int': '[1980:]'})
+        aggregation_response = yield self.web.get(b'groups/movie/groupby/title')
+        search_response = yield self.web.get(b'groups/movie', args={'$search': 'Force'})
+
+        # Then
+        self.assertEqual([log['title'] for log in json.loads(response.value())['logs']], [
+            'DarkKnight', 'Terminator', 'StarWars',
+        ])
+        self.assertEqual(json.loads(count_response.value()), {'count': 3}, 'count should use count_documents')
+        self.assertEqual(aggregation_response.responseCode, 501, 'aggregations are not supported by sqlite')
+        self.assertEqual(search_response.responseCode, 501, '$search is not supported by sqlite')
+
+    @inlineCallbacks
+    def test_GET_metrics_Test_response_data(self):
+        # Given
+        yield self.web.get(b'groups/movie', args={'title': 'StarWars'})
+        yield self.web.post(b'groups/movie', args={'data': [dict(title='Frozen'), dict(title='Up')]})
+        yield self.web.get(b'groups/movie', args={'year:int': 'unknown'})
+
+        # When
+        response = yield self.web.get(b'metrics')
+        lines = response.value().splitlines()
+
+        # Then
+        self.assertEqual(
+            response.responseHeaders.getRawHeaders('Content-Type'), ['text/plain; version=0.0.4; charset=utf-8'],
+        )
+        self.assertIn('simplog_requests_total{route="logs",method="GET",group="movie",code="200"} 1', lines)
+        self.assertIn('simplog_requests_total{route="logs",method="POST",group="movie",code="200"} 1', lines)
+        self.assertIn('simplog_requests_total{route="logs",method="GET",group="movie",code="400"} 1', lines)
+        self.assertIn('simplog_documents_returned_total{group="movie"} 2', lines)
+        self.assertIn('simplog_documents_inserted_total{group="movie"} 2', lines)
+        for phase, count in (('parse', 2), ('db', 1), ('serialize', 1), ('write', 1)):
+            labels = f'route="logs",method="GET",group="movie",phase="{phase}"'
+            self.assertIn(
+                f'simplog_request_phase_seconds_count{{{labels}}} {count}', lines,
+                f'GET /metrics should report the {phase} phase of GET requests',
+            )
+
+    def partitioned_site(self):
+        now = [datetime.datetime(2020, 4, 10, 12, 0)]
+        retention = RetentionManager(
+            self.log_db, self.executor, clock=lambda: (now[0] - datetime.datetime(1970, 1, 1)).total_seconds(),
+        )
+        retention.policies['server'] = RetentionPolicy.from_dict({'partition': 'daily', 'retention': 7 * 86400})
+        self.web = DummySite(SimplogHome(self.log_db.client, self.executor, retention=retention))
+        return now
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_partitioned(self):
+        # Given
+        now = self.partitioned_site()
+        for day, values in enumerate([[5, 1], [4, 2], [6, 3]]):
+            now[0] = datetime.datetime(2020, 4, 10 + day, 12, 0)
+            yield self.web.post(b'groups/server', args={'data': [dict(n=n) for n in values]})
+
+        # When
+        first_response = yield self.web.get(b'groups/server', args={'$sort': '-n', '$limit': '3', '$fields': 'n'})
+        first_page = json.loads(first_response.value())
+        next_response = yield self.web.get(
+            b'groups/server', args={'$sort': '-n', '$limit': '3', '$fields': 'n', '$after': first_page['next']},
+        )
+        ranged_response = yield self.web.get(
+            b'groups/server', args={'_ingested:date': '[2020-04-11T00:00:00:2020-04-12T00:00:00]'},
+        )
+        count_response = yield self.web.get(b'groups/server/count', args={'n:int': '[2:5]'})
+
+        # Then
+        self.assertEqual([log['n'] for log in first_page['logs']], [6, 5, 4])
+        self.assertEqual(
+            [log['n'] for log in json.loads(next_response.value())['logs']], [3, 2, 1],
+            'GET /groups/server should return logs of all partitions in the sort order',
+        )
+        self.assertEqual([log['n'] for log in json.loads(ranged_response.value())['logs']], [4, 2])
+        self.assertEqual(json.loads(count_response.value()), {'count': 3})
+
+    @inlineCallbacks
+    def test_GET_log_group_tail_Test_response_data(self):
+        # Given
+        home = self.web.resource
+        self.web.get(b'groups/movie/tail', args={'year:int': '[2000:]'})     # finished when the client closes
+        subscription, = home.tail.subscriptions['movie']
+
+        # When
+        yield self.web.post(b'groups/movie', args={'data': [
+            dict(title='Frozen', year=2013), dict(title='ET', year=1982),
+        ]})
+        yield self.web.post(b'groups/movie', args={'data': b'{"title": "Up", "year": 2009}\n'}, headers={
+            'Content-Type': ['application/x-ndjson'],
+        })
+
+        # Then
+        request = subscription.request
+        self.assertEqual(request.responseHeaders.getRawHeaders('Content-Type'), ['text/event-stream; charset=utf-8'])
+        events = [event for event in request.value().split('\n\n') if event.startswith('event: log')]
+        self.assertEqual(
+            [json.loads(event.split('data: ', 1)[1])['title'] for event in events], ['Frozen', 'Up'],
+            'GET /groups/movie/tail should push the inserted logs matched by the query',
+        )
+
+    @inlineCallbacks
+    def test_GET_log_group_tail_Test_response_data_Str_site_Cond_accept_encoding(self):
+        # Given
+        site = CompressingSite(
+            self.web.resource, compression=ResponseCompression(['gzip'], min_bytes=1024), requestFactory=LimitedRequest,
+        )
+        transport, _ = serve_http(site, 'GET', 'groups/movie/tail', headers={'Accept-Encoding': 'gzip'})
+
+        # When
+        yield self.web.post(b'groups/movie', args={'data': [dict(title='Frozen', year=2013)]})
+
+        # Then
+        code, headers, body = parse_response(transport.value())
+        self.assertEqual(code, 200)
+        self.assertEqual(headers['content-type'], 'text/event-stream; charset=utf-8')
+        self.assertNotIn('content-encoding', headers, 'events should not be compressed')
+        self.assertIn(b'event: log', body, 'events should not wait for more events')
+
+    @inlineCallbacks
+    def test_GET_log_group_Test_response_data_Cond_in_and_negation(self):
+        # Given
+        # When
+        response = yield self.web.get(b'groups/movie', args={'title': '{StarWars,DarkKnight}', 'year:int!': '1977'})
+        cached_response = yield self.web.get(
+            b'groups/movie', args={'title': '{StarWars,DarkKnight}', 'year:int!': '1977'},
+        )
+
+        # Then
+        expected_result = [self.movie_log_objects[2], self.movie_log_objects[3]]
+        self.assertEqual(json.loads(response.value())['logs'], expected_result)
+        self.assertEqual(json.loads(cached_response.value())['logs'], expected_result)
+        self.assertEqual(self.web.resource.queries.hits, 1, 'the plan of a repeated query should be reused')
+
+    @inlineCallbacks
+    def test_GET_log_group_export_Test_response_data(self):
+        # Given
+        try:
+            import pyarrow
+        except ImportError:
+            raise unittest.SkipTest('pyarrow is not installed')
+
+        # When
+        response = yield self.web.get(b'groups/movie/export', args={'title': 'StarWars', '$fields': 'title,year'})
+        invalid_response = yield self.web.get(b'groups/movie/export', args={'$format': 'csv'})
+
+        # Then
+        self.assertEqual(
+            response.responseHeaders.getRawHeaders('Content-Type'), ['application/vnd.apache.arrow.stream'],
+        )
+        table = pyarrow.ipc.open_stream(b''.join(response.written)).read_all()
+        self.assertEqual(sorted(table.schema.names), ['_id', 'title', 'year'])
+        self.assertEqual(table.column('year').to_pylist(), [1977, 1980])
+        self.assertEqual(invalid_response.responseCode, 400)
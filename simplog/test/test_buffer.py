@@ -0,0 +1,92 @@
+import mongomock
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from simplog.buffer import BufferedWriteError, WriteBuffer, WriteBuffers
+from simplog.executor import BoundedExecutor
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.insert_count = 0
+
+    def insert_many(self, logs, ordered=True):
+        self.insert_count += 1
+        return self.collection.insert_many(logs, ordered=ordered)
+
+
+class WriteBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log_db = mongomock.MongoClient().logs
+        self.collection = CountingCollection(self.log_db.movie)
+        self.clock = Clock()
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.executor.start()
+        self.write_buffer = WriteBuffer(self.collection, self.executor, max_size=3, max_delay=0.1, reactor=self.clock)
+
+    def tearDown(self):
+        self.executor.stop()
+
+    @inlineCallbacks
+    def test_add_Test_flush_Cond_max_delay(self):
+        # Given
+        d = self.write_buffer.add([dict(title='Frozen')])
+
+        # When
+        self.assertEqual(self.collection.insert_count, 0, 'logs should be buffered before max_delay')
+        self.clock.advance(0.1)
+        log_ids = yield d
+
+        # Then
+        self.assertEqual(self.collection.insert_count, 1)
+        self.assertEqual([log['_id'] for log in self.log_db.movie.find()], log_ids)
+
+    @inlineCallbacks
+    def test_add_Test_flush_Cond_max_size(self):
+        # Given
+        first = self.write_buffer.add([dict(title='Frozen')])
+
+        # When
+        second = self.write_buffer.add([dict(title='Up'), dict(title='Coco')])
+        first_ids = yield first
+        second_ids = yield second
+
+        # Then
+        self.assertEqual(self.collection.insert_count, 1, 'logs of both requests should be inserted at once')
+        self.assertEqual(len(first_ids), 1)
+        self.assertEqual(len(second_ids), 2)
+        self.assertEqual(self.log_db.movie.count_documents({}), 3)
+        self.assertFalse(self.clock.getDelayedCalls(), 'flush timer should be cancelled')
+
+    @inlineCallbacks
+    def test_add_Test_error_Cond_duplicated_id(self):
+        # Given
+        self.log_db.movie.insert_one(dict(_id=1, title='Frozen'))
+        failing = self.write_buffer.add([dict(_id=1, title='Frozen')])
+        succeeding = self.write_buffer.add([dict(title='Up')])
+
+        # When
+        self.clock.advance(0.1)
+        log_ids = yield succeeding
+
+        # Then
+        self.assertEqual(len(log_ids), 1, 'logs of the other requests should be written')
+        with self.assertRaises(BufferedWriteError):
+            yield failing
+
+    @inlineCallbacks
+    def test_close_Test_flush(self):
+        # Given
+        write_buffers = WriteBuffers(self.log_db, self.executor, max_size=100, reactor=self.clock)
+        write_buffers.get('movie').add([dict(title='Frozen')])
+        write_buffers.get('game').add([dict(title='StarCraft')])
+
+        # When
+        yield write_buffers.close()
+
+        # Then
+        self.assertEqual(self.log_db.movie.count_documents({}), 1, 'buffered logs should be written on close')
+        self.assertEqual(self.log_db.game.count_documents({}), 1, 'buffered logs should be written on close')
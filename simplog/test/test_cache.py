@@ -0,0 +1,77 @@
+from twisted.trial import unittest
+
+from simplog.cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.cache = ResponseCache(max_entries=2, max_bytes=10, max_entry_bytes=6, ttl=5.0, clock=lambda: self.now)
+
+    def store(self, group_name, key, body):
+        return self.cache.store(group_name, key, self.cache.version(group_name), self.cache.new_etag(), body)
+
+    def test_lookup_Test_entry(self):
+        # Given
+        self.store('movie', 'q1', b'{}')
+
+        # When
+        entry = self.cache.lookup('movie', 'q1')
+
+        # Then
+        self.assertEqual(entry.body, b'{}')
+        self.assertIsNone(self.cache.lookup('game', 'q1'), 'entries of other groups should not be returned')
+
+    def test_lookup_Test_entry_Cond_ttl(self):
+        # Given
+        self.store('movie', 'q1', b'{}')
+
+        # When
+        self.now += 5.0
+
+        # Then
+        self.assertIsNone(self.cache.lookup('movie', 'q1'), 'expired entry should not be returned')
+        self.assertEqual(self.cache.size, 0)
+
+    def test_store_Test_eviction_Cond_max_entries(self):
+        # Given
+        self.store('movie', 'q1', b'1')
+        self.store('movie', 'q2', b'2')
+
+        # When
+        self.cache.lookup('movie', 'q1')
+        self.store('movie', 'q3', b'3')
+
+        # Then
+        self.assertIsNone(self.cache.lookup('movie', 'q2'), 'least recently used entry should be evicted')
+        self.assertIsNotNone(self.cache.lookup('movie', 'q1'))
+        self.assertIsNotNone(self.cache.lookup('movie', 'q3'))
+
+    def test_store_Test_eviction_Cond_max_bytes(self):
+        # Given
+        self.store('movie', 'q1', b'12345')
+
+        # When
+        self.store('movie', 'q2', b'123456')
+
+        # Then
+        self.assertIsNone(self.cache.lookup('movie', 'q1'), 'entries over max_bytes should be evicted')
+        self.assertEqual(self.cache.size, 6)
+        self.assertFalse(self.store('movie', 'q3', b'1234567'), 'entry larger than max_entry_bytes is not stored')
+
+    def test_invalidate_Test_lookup(self):
+        # Given
+        self.store('movie', 'q1', b'1')
+        self.store('game', 'q1', b'1')
+        stale_version = self.cache.version('movie')
+
+        # When
+        self.cache.invalidate('movie')
+
+        # Then
+        self.assertIsNone(self.cache.lookup('movie', 'q1'), 'entries of the group should be invalidated')
+        self.assertIsNotNone(self.cache.lookup('game', 'q1'), 'entries of other groups should be kept')
+        self.assertFalse(
+            self.cache.store('movie', 'q1', stale_version, self.cache.new_etag(), b'1'),
+            'response of a query started before the invalidation should not be stored'
+        )
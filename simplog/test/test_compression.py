@@ -0,0 +1,90 @@
+import gzip
+import zlib
+
+from twisted.trial import unittest
+from twisted.web.resource import Resource
+from twisted.web.test.requesthelper import DummyChannel
+
+from simplog.compression import CompressingRequest, CompressingSite, ResponseCompression, negotiate
+
+
+def respond(compression, writes, accept_encoding='gzip', content_type=b'application/json', etag=None):
+    channel = DummyChannel()
+    channel.site = CompressingSite(Resource(), compression=compression)
+    request = CompressingRequest(channel)
+    request.method = b'GET'
+    request.clientproto = b'HTTP/1.0'
+    if accept_encoding is not None:
+        request.requestHeaders.setRawHeaders(b'Accept-Encoding', [accept_encoding.encode('ascii')])
+    request.setHeader(b'Content-Type', content_type)
+    if etag is not None:
+        request.setHeader(b'ETag', etag)
+    sent = []
+    for data in writes:
+        request.write(data)
+        sent.append(channel.transport.written.getvalue())
+    request.finish()
+    head, _, body = channel.transport.written.getvalue().partition(b'\r\n\r\n')
+    return request, body, sent
+
+
+class NegotiateTestCase(unittest.TestCase):
+    def test_negotiate_Test_encoding(self):
+        # Given
+        encodings = ['zstd', 'gzip']
+
+        # When
+        # Then
+        self.assertEqual(negotiate('gzip, deflate, br', encodings), 'gzip')
+        self.assertEqual(negotiate('gzip;q=0.5, zstd', encodings), 'zstd')
+        self.assertEqual(negotiate('gzip, zstd', encodings), 'zstd', 'the server preference should break ties')
+        self.assertEqual(negotiate('zstd;q=0, *', encodings), 'gzip')
+        self.assertIsNone(negotiate('identity', encodings))
+        self.assertIsNone(negotiate(None, encodings))
+
+
+class CompressingRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.compression = ResponseCompression(['gzip'], min_bytes=100)
+
+    def test_write_Test_body_Cond_streamed(self):
+        # Given
+        writes = [b'[', b'{"title": "StarWars"}' * 10, b',', b'{"title": "Up"}' * 10, b']']
+
+        # When
+        request, body, sent = respond(self.compression, writes, etag=b'"1"')
+
+        # Then
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Content-Encoding'), [b'gzip'])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Vary'), [b'Accept-Encoding'])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'ETag'), [b'W/"1"'])
+        self.assertEqual(gzip.decompress(body), b''.join(writes))
+        self.assertEqual(sent[0], b'', 'a body should be held until it is large enough to compress')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertTrue(
+            decompressor.decompress(sent[3].partition(b'\r\n\r\n')[2]).endswith(b'{"title": "Up"}'),
+            'each write should be flushed',
+        )
+
+    def test_write_Test_body_Cond_small(self):
+        # Given
+        # When
+        request, body, _ = respond(self.compression, [b'{"success": true}'])
+
+        # Then
+        self.assertIsNone(request.responseHeaders.getRawHeaders(b'Content-Encoding'))
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'Vary'), [b'Accept-Encoding'])
+        self.assertEqual(body, b'{"success": true}')
+
+    def test_write_Test_body_Cond_not_accepted_or_event_stream(self):
+        # Given
+        data = b'x' * 1000
+
+        # When
+        not_accepted, not_accepted_body, _ = respond(self.compression, [data], accept_encoding=None)
+        events, events_body, _ = respond(self.compression, [data], content_type=b'text/event-stream')
+
+        # Then
+        self.assertEqual(not_accepted_body, data)
+        self.assertEqual(events_body, data)
+        self.assertIsNone(events.responseHeaders.getRawHeaders(b'Content-Encoding'))
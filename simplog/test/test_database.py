@@ -0,0 +1,111 @@
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+from twisted.internet.defer import inlineCallbacks
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+
+from simplog.database import CircuitBreaker, DatabaseConfig, DatabaseUnavailable, InvalidDatabaseConfig
+from simplog.executor import BoundedExecutor
+
+
+class DatabaseConfigTestCase(unittest.TestCase):
+    def test_load_Test_client_options(self):
+        # Given
+        environ = {'SIMPLOG_MONGO_MAX_POOL_SIZE': '20', 'SIMPLOG_MONGO_READ_PREFERENCE': 'secondaryPreferred',
+                   'SIMPLOG_MONGO_RETRY_WRITES': 'false', 'SIMPLOG_MONGO_SOCKET_TIMEOUT': '2.5'}
+
+        # When
+        config = DatabaseConfig.load('mongodb://mongo', environ=environ)
+        client = config.connect(connect=False)
+
+        # Then
+        self.assertEqual(config.uri, 'mongodb://mongo')
+        self.assertEqual(config.client_options(), {
+            'serverSelectionTimeoutMS': 5000, 'connectTimeoutMS': 5000, 'socketTimeoutMS': 2500,
+            'waitQueueTimeoutMS': 5000, 'maxPoolSize': 20, 'readPreference': 'secondaryPreferred',
+            'retryWrites': False,
+        })
+        self.assertEqual(client.read_preference.mongos_mode, 'secondaryPreferred')
+
+    def test_from_dict_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_config in [
+            {'pool_size': 1}, {'max_pool_size': '1x'}, {'max_pool_size': True}, {'socket_timeout': -1},
+            {'read_preference': 'secondaries'}, {'retry_reads': 'yes'},
+        ]:
+            with self.assertRaises(InvalidDatabaseConfig, msg=f'{invalid_config} should be rejected'):
+                DatabaseConfig.from_dict(dict(invalid_config, uri='mongodb://mongo'))
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1, breaker=self.breaker)
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    @inlineCallbacks
+    def call(self, exception=None):
+        def func():
+            if exception is not None:
+                raise exception
+        try:
+            yield self.executor.submit(func)
+        except type(exception):
+            pass
+
+    @inlineCallbacks
+    def test_submit_Test_fail_fast_Cond_connection_errors(self):
+        # Given
+        yield self.call(OperationFailure('duplicate key'))
+        yield self.call(ServerSelectionTimeoutError('no servers'))
+        yield self.call(ServerSelectionTimeoutError('no servers'))
+
+        # When
+        # Then
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(DatabaseUnavailable, msg='calls should fail fast after 2 connection errors'):
+            self.executor.submit(lambda: None)
+
+    @inlineCallbacks
+    def test_submit_Test_closed_Cond_trial_succeeded(self):
+        # Given
+        yield self.call(ServerSelectionTimeoutError('no servers'))
+        yield self.call(ServerSelectionTimeoutError('no servers'))
+        self.now = 10.0
+
+        # When
+        trial = self.executor.submit(lambda: None)
+        with self.assertRaises(DatabaseUnavailable, msg='only one call should be tried while half open'):
+            self.executor.submit(lambda: None)
+        yield trial
+
+        # Then
+        self.assertEqual(self.breaker.state, 'closed')
+        yield self.executor.submit(lambda: None)
+
+    def test_record_Test_state_Cond_other_calls_while_half_open(self):
+        # Given
+        self.breaker.admit()    # admitted before the circuit opens
+        for _ in range(2):
+            self.breaker.record(Failure(ServerSelectionTimeoutError('no servers')))
+        self.now = 10.0
+        trial = self.breaker.admit()
+
+        # When
+        self.breaker.record(None)   # the call admitted before the circuit opened
+        self.breaker.record(None)   # e.g. a follow-up call by submit_admitted
+
+        # Then
+        self.assertEqual(self.breaker.state, 'half_open', 'only the trial call should close the circuit')
+        with self.assertRaises(DatabaseUnavailable, msg='the trial call should be still running'):
+            self.breaker.admit()
+        self.breaker.record(Failure(ServerSelectionTimeoutError('no servers')), trial)
+        self.assertEqual(self.breaker.state, 'open')
+        self.now = 20.0
+        self.breaker.record(None, self.breaker.admit())
+        self.assertEqual(self.breaker.state, 'closed')
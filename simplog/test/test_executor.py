@@ -0,0 +1,53 @@
+import threading
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from simplog.executor import BoundedExecutor, ExecutorOverloaded
+
+
+class BoundedExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    @inlineCallbacks
+    def test_submit_Test_result(self):
+        # Given
+        # When
+        result = yield self.executor.submit(sum, [1, 2, 3])
+
+        # Then
+        self.assertEqual(result, 6, 'submit should return the result of the function')
+        self.assertEqual(self.executor.pending, 0, 'no task should be pending after completion')
+
+    @inlineCallbacks
+    def test_submit_Test_error(self):
+        # Given
+        def fail():
+            raise KeyError('missing')
+
+        # When
+        # Then
+        with self.assertRaises(KeyError):
+            yield self.executor.submit(fail)
+        self.assertEqual(self.executor.pending, 0, 'failed task should not remain pending')
+
+    @inlineCallbacks
+    def test_submit_Test_overloaded(self):
+        # Given
+        release = threading.Event()
+        running = self.executor.submit(release.wait)
+        queued = self.executor.submit(release.wait)
+
+        # When
+        # Then
+        with self.assertRaises(ExecutorOverloaded):
+            self.executor.submit(release.wait)
+        release.set()
+        yield running
+        yield queued
+        self.assertEqual(self.executor.pending, 0)
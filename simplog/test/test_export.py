@@ -0,0 +1,84 @@
+import datetime
+import json
+
+from bson import ObjectId
+from twisted.trial import unittest
+
+from simplog.export import FORMAT_ARROW, FORMAT_PARQUET, ColumnarEncoder, infer_schema, pyarrow
+from simplog.serializer import get_serializer
+
+
+class ColumnarEncoderTestCase(unittest.TestCase):
+    if pyarrow is None:
+        skip = 'pyarrow is not installed'
+
+    def setUp(self):
+        self.docs = [
+            dict(_id=ObjectId('5e9325677efe79d511b112cb'), level='ERROR', took=3, at=datetime.datetime(2020, 4, 10)),
+            dict(_id=ObjectId('5e9325677efe79d511b112cc'), level='INFO', took=2.5, ok=True, data={'user': 'kim'}),
+        ]
+
+    def encode(self, export_format, batches, sample_size=10000):
+        encoder = ColumnarEncoder(export_format, get_serializer(), sample_size=sample_size)
+        return b''.join([encoder.encode(docs) for docs in batches] + [encoder.close()]), encoder
+
+    def test_infer_schema_Test_types(self):
+        # Given
+        # When
+        schema = infer_schema(self.docs + [dict(level=1)])
+
+        # Then
+        self.assertEqual(schema.names, ['_id', 'level', 'took', 'at', 'ok', 'data'])
+        self.assertEqual(
+            [str(field.type) for field in schema],
+            ['string', 'string', 'double', 'timestamp[ms, tz=UTC]', 'bool', 'string'],
+        )
+
+    def test_encode_Test_arrow_stream(self):
+        # Given
+        # When
+        data, _ = self.encode(FORMAT_ARROW, [self.docs, [dict(level='WARN', took='slow', new_field=1)]])
+
+        # Then
+        table = pyarrow.ipc.open_stream(data).read_all()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(
+            table.column('_id').to_pylist(), ['5e9325677efe79d511b112cb', '5e9325677efe79d511b112cc', None],
+        )
+        self.assertEqual(table.column('took').to_pylist(), ['3', '2.5', 'slow'], 'mixed types should be strings')
+        self.assertEqual(json.loads(table.column('data')[1].as_py()), {'user': 'kim'}, 'objects should be JSON')
+        self.assertEqual(table.column('new_field').to_pylist(), [None, None, 1], 'the schema should be of all batches')
+
+    def test_encode_Test_dropped_fields_Cond_sample_size(self):
+        # Given
+        batches = [self.docs[:1], self.docs[1:], [dict(level='WARN', took='slow', new_field=1)]]
+
+        # When
+        data, encoder = self.encode(FORMAT_ARROW, batches, sample_size=2)
+
+        # Then
+        table = pyarrow.ipc.open_stream(data).read_all()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.schema.names, ['_id', 'level', 'took', 'at', 'ok', 'data'])
+        self.assertEqual(table.column('took').to_pylist(), [3.0, 2.5, None], 'values of other types should be null')
+        self.assertEqual(encoder.dropped_fields, {'new_field'}, 'fields after the sampled logs should be reported')
+
+    def test_encode_Test_parquet(self):
+        # Given
+        import pyarrow.parquet
+
+        # When
+        data, _ = self.encode(FORMAT_PARQUET, [self.docs[:1], self.docs[1:]], sample_size=1)
+
+        # Then
+        parquet_file = pyarrow.parquet.ParquetFile(pyarrow.BufferReader(data))
+        self.assertEqual(parquet_file.num_row_groups, 2, 'each batch should be a row group')
+        self.assertEqual(parquet_file.read().column('level').to_pylist(), ['ERROR', 'INFO'])
+
+    def test_encode_Test_empty(self):
+        # Given
+        # When
+        data, _ = self.encode(FORMAT_ARROW, [[]])
+
+        # Then
+        self.assertEqual(pyarrow.ipc.open_stream(data).read_all().num_rows, 0)
@@ -0,0 +1,135 @@
+import json
+
+import mongomock
+from twisted.internet.defer import Deferred
+from twisted.trial import unittest
+
+from simplog.fanout import FanOutProducer, InvalidGroups, parse_groups, resolve_groups
+from simplog.serializer import JSONSerializer
+from simplog.test.dummy import SimplogDummyRequest
+
+
+class ManualExecutor:
+    """Runs the calls when `run_all` is called, in the reverse order of the submission."""
+    def __init__(self):
+        self.calls = []
+        self.running = False
+
+    def submit(self, func, *args):
+        d = Deferred()
+        self.calls.append((d, func, args))
+        return d
+
+    submit_admitted = submit
+
+    def run_all(self):
+        while self.calls:
+            calls, self.calls = self.calls, []
+            for d, func, args in reversed(calls):
+                self.running = True
+                try:
+                    result = func(*args)
+                finally:
+                    self.running = False
+                d.callback(result)
+
+
+class DummyCursor:
+    def __init__(self, docs):
+        self.docs = iter(docs)
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        doc = next(self.docs)
+        self.read += 1
+        return doc
+
+    def close(self):
+        self.closed = True
+
+
+class FanOutProducerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cursors = [
+            ('web', DummyCursor([dict(t=1), dict(t=4), dict(t=5), dict(t=9)])),
+            ('api', DummyCursor([dict(t=2), dict(t=3), dict(t=6), dict(t=7), dict(t=8)])),
+            ('db', DummyCursor([])),
+        ]
+
+    def start_producer(self, request, sort, limit=None, executor=None, serializer=None):
+        executor = executor or ManualExecutor()
+        producer = FanOutProducer(
+            request, executor, self.cursors, serializer or JSONSerializer(), sort, batch_size=2, limit=limit,
+        )
+        producer.start()
+        executor.run_all()
+        return producer
+
+    def test_start_Test_merged_logs(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups')
+
+        # When
+        self.start_producer(request, [('t', 1)])
+
+        # Then
+        logs = json.loads(request.value())['logs']
+        self.assertEqual([log['t'] for log in logs], list(range(1, 10)), 'logs should be merged in the sort order')
+        self.assertEqual([log['_group'] for log in logs[:3]], ['web', 'api', 'api'])
+        self.assertTrue(request.finished)
+        self.assertTrue(all(cursor.closed for _, cursor in self.cursors))
+
+    def test_start_Test_merged_logs_Cond_descending_limit(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups')
+        for _, cursor in self.cursors:
+            cursor.docs = iter(sorted(cursor.docs, key=lambda doc: -doc['t']))
+
+        # When
+        self.start_producer(request, [('t', -1)], limit=3)
+
+        # Then
+        self.assertEqual([log['t'] for log in json.loads(request.value())['logs']], [9, 8, 7])
+        self.assertTrue(all(cursor.closed for _, cursor in self.cursors), 'cursors should be closed at the limit')
+        self.assertLess(self.cursors[1][1].read, 5, 'logs after the limit should not be read')
+
+    def test_start_Test_merged_logs_Cond_encoded_in_executor(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups')
+        executor = ManualExecutor()
+        encoded_in_executor = []
+
+        class RecordingSerializer(JSONSerializer):
+            def dumps(self, obj):
+                encoded_in_executor.append(executor.running)
+                return super().dumps(obj)
+
+        # When
+        self.start_producer(request, [('t', 1)], executor=executor, serializer=RecordingSerializer())
+
+        # Then
+        self.assertEqual(len(json.loads(request.value())['logs']), 9)
+        self.assertEqual(encoded_in_executor, [True] * 9, 'logs should be encoded in the worker threads')
+
+
+class ResolveGroupsTestCase(unittest.TestCase):
+    def test_resolve_groups_Test_groups(self):
+        # Given
+        log_db = mongomock.MongoClient().logs
+        for name in ('api-eu', 'api-us', 'web', 'web.20200410', 'audit'):
+            log_db[name].insert_one({})
+        patterns = parse_groups('web, api-*,missing,web', max_groups=10)
+
+        # When
+        groups = resolve_groups(log_db, patterns, lambda name: name.split('.')[0], max_groups=10)
+
+        # Then
+        self.assertEqual(groups, ['web', 'api-eu', 'api-us', 'missing'])
+        with self.assertRaises(InvalidGroups):
+            resolve_groups(log_db, ['*'], lambda name: name, max_groups=3)
+        with self.assertRaises(InvalidGroups):
+            parse_groups(' , ', max_groups=10)
@@ -0,0 +1,72 @@
+import mongomock
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from simplog.executor import BoundedExecutor
+from simplog.indexes import IndexManager, IndexSpec, InvalidIndexSpec
+
+
+class IndexSpecTestCase(unittest.TestCase):
+    def test_from_dict_Test_keys(self):
+        # Given
+        # When
+        spec = IndexSpec.from_dict({'keys': ['host', '-timestamp']})
+
+        # Then
+        self.assertEqual(spec.keys, [('host', 1), ('timestamp', -1)])
+        self.assertEqual(spec.name, 'host_1_timestamp_-1')
+        self.assertEqual(spec.to_dict(), dict(name='host_1_timestamp_-1', keys=['host', '-timestamp'], unique=False))
+
+    def test_from_dict_Test_text(self):
+        # Given
+        # When
+        spec = IndexSpec.from_dict({'keys': ['host'], 'text': ['text', 'data']})
+        listed_spec = IndexSpec.from_index_information('host_1_text_text_data_text', {
+            'key': [('host', 1), ('_fts', 'text'), ('_ftsx', 1)], 'weights': {'text': 1, 'data': 1},
+        })
+
+        # Then
+        self.assertEqual(spec.keys, [('host', 1), ('text', 'text'), ('data', 'text')])
+        self.assertEqual(spec.to_dict(), dict(
+            name='host_1_text_text_data_text', keys=['host'], unique=False, text=['text', 'data'],
+        ))
+        self.assertEqual(listed_spec.to_dict(), spec.to_dict(), 'text indexes should be listed like declared')
+
+    def test_from_dict_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_spec in [{}, {'keys': []}, {'keys': 'host'}, {'keys': ['-']}, ['host'], {'text': ['']}]:
+            with self.assertRaises(InvalidIndexSpec, msg=f'{invalid_spec} should be rejected'):
+                IndexSpec.from_dict(invalid_spec)
+
+
+class IndexManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log_db = mongomock.MongoClient().logs
+        self.log_db.movie.insert_many([dict(title='StarWars'), dict(title='StarWars')])
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.executor.start()
+        self.index_manager = IndexManager(self.log_db, self.executor)
+
+    def tearDown(self):
+        self.executor.stop()
+
+    @inlineCallbacks
+    def test_status_Test_failed_build(self):
+        # Given
+        spec = IndexSpec.from_dict({'keys': ['title'], 'unique': True})
+        try:
+            yield self.index_manager.create('movie', spec)
+        except Exception:
+            pass
+        self.flushLoggedErrors()
+
+        # When
+        status = yield self.index_manager.status('movie')
+
+        # Then
+        failed = [index for index in status['indexes'] if index['name'] == 'title_1']
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]['status'], 'failed', 'unique index of duplicated values should fail')
+        self.assertIsNotNone(failed[0]['error'])
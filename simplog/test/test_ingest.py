@@ -0,0 +1,132 @@
+import gzip
+import io
+
+import mongomock
+from pymongo.errors import AutoReconnect
+from twisted.trial import unittest
+
+from simplog.ingest import BodyTooLarge, NDJSONIngest, UnsupportedEncoding, open_body, read_stream, zstandard
+
+
+class FailingCollection:
+    """Collection whose `failing_call`-th insert_many fails as the connection is lost."""
+    def __init__(self, collection, failing_call):
+        self.collection = collection
+        self.failing_call = failing_call
+        self.calls = 0
+
+    def insert_many(self, logs, **kwargs):
+        self.calls += 1
+        if self.calls == self.failing_call:
+            raise AutoReconnect('connection closed')
+        return self.collection.insert_many(logs, **kwargs)
+
+
+class NDJSONIngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().logs.movie
+
+    def test_run_Test_db_data(self):
+        # Given
+        body = b''.join(b'{"seq": %d}\n' % i for i in range(10))
+
+        # When
+        result = NDJSONIngest(self.collection, batch_size=3).run(io.BytesIO(body))
+
+        # Then
+        self.assertEqual(result, dict(success=True, inserted=10, error_count=0, errors=[]))
+        self.assertEqual([log['seq'] for log in self.collection.find()], list(range(10)))
+
+    def test_run_Test_errors_Cond_duplicated_ids(self):
+        # Given
+        body = b'{"_id": 1}\n{"_id": 2}\n{"_id": 1}\n{"_id": 3}\n'
+
+        # When
+        result = NDJSONIngest(self.collection, batch_size=2).run(io.BytesIO(body))
+
+        # Then
+        self.assertEqual(result['inserted'], 3)
+        self.assertEqual([error['line'] for error in result['errors']], [3], 'duplicated _id should be reported')
+
+    def test_run_Test_errors_Cond_max_reported_errors(self):
+        # Given
+        body = b'x\n' * 5 + b'{"seq": 1}\n'
+
+        # When
+        result = NDJSONIngest(self.collection, max_reported_errors=2).run(io.BytesIO(body))
+
+        # Then
+        self.assertEqual(result['inserted'], 1)
+        self.assertEqual(result['error_count'], 5)
+        self.assertEqual(len(result['errors']), 2, 'reported errors should be limited')
+
+    def test_run_Test_errors_Cond_db_error(self):
+        # Given
+        body = b''.join(b'{"seq": %d}\n' % i for i in range(10))
+        collection = FailingCollection(self.collection, failing_call=2)
+
+        # When
+        result = NDJSONIngest(collection, batch_size=3).run(io.BytesIO(body))
+
+        # Then
+        self.assertEqual((result['success'], result['inserted']), (False, 3))
+        self.assertEqual([error['line'] for error in result['errors']], [4], 'the failed batch should be reported')
+        self.assertEqual(collection.calls, 2, 'the rest of the logs should not be inserted after the error')
+        self.assertEqual(self.collection.count_documents({}), 3)
+
+    def test_run_Test_error_Cond_db_error_first_batch(self):
+        # Given
+        body = b''.join(b'{"seq": %d}\n' % i for i in range(10))
+
+        # When
+        # Then
+        with self.assertRaises(AutoReconnect):    # nothing is stored, so the request can be sent again
+            NDJSONIngest(FailingCollection(self.collection, failing_call=1), batch_size=3).run(io.BytesIO(body))
+
+    def test_run_Test_errors_Cond_truncated_gzip(self):
+        # Given
+        body = gzip.compress(b''.join(b'{"seq": %d}\n' % i for i in range(1000)))
+
+        # When
+        stream = open_body(io.BytesIO(body[:len(body) // 2]), 'gzip')
+        result = NDJSONIngest(self.collection, batch_size=100).run(stream)
+
+        # Then
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'][-1]['line'], None, 'broken stream should be reported')
+        self.assertEqual(self.collection.count_documents({}), result['inserted'], 'logs before the error are kept')
+
+    def test_open_body_Test_zstd(self):
+        # Given
+        if zstandard is None:
+            raise unittest.SkipTest('zstandard is not installed')
+        body = zstandard.ZstdCompressor().compress(b'{"seq": 1}\n{"seq": 2}\n')
+
+        # When
+        result = NDJSONIngest(self.collection).run(open_body(io.BytesIO(body), 'zstd'))
+
+        # Then
+        self.assertEqual(result['inserted'], 2)
+
+    def test_open_body_Test_max_bytes(self):
+        # Given
+        body = gzip.compress(b'{"seq": 1}\n' + b' ' * 10 ** 7)
+
+        # When
+        stream = open_body(io.BytesIO(body), 'gzip', max_bytes=1000)
+        ndjson_stream = open_body(io.BytesIO(body), 'gzip', max_bytes=1000)
+        result = NDJSONIngest(self.collection).run(ndjson_stream)
+
+        # Then
+        with self.assertRaises(BodyTooLarge, msg='a body should not be decompressed beyond max_bytes'):
+            read_stream(stream)
+        self.assertEqual(result['inserted'], 1, 'logs before the limit are kept')
+        self.assertEqual(result['errors'][-1]['line'], None, 'the limit should be reported')
+        self.assertEqual(read_stream(open_body(io.BytesIO(body), 'gzip', max_bytes=10 ** 8))[:11], b'{"seq": 1}\n')
+
+    def test_open_body_Test_error(self):
+        # Given
+        # When
+        # Then
+        with self.assertRaises(UnsupportedEncoding):
+            open_body(io.BytesIO(b''), 'br')
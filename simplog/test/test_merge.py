@@ -0,0 +1,60 @@
+import datetime
+
+from bson import ObjectId
+from twisted.trial import unittest
+
+from simplog.merge import MergedCursor, order_key
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = iter(docs)
+        self.closed = False
+        self.size = None
+
+    def __iter__(self):
+        return self.docs
+
+    def batch_size(self, size):
+        self.size = size
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+class MergedCursorTestCase(unittest.TestCase):
+    def test_order_key_Test_mongodb_order(self):
+        # Given
+        values = [datetime.datetime(2020, 4, 10), True, ObjectId(), {'a': 1}, 'text', 2.5, 1, None]
+
+        # When
+        ordered = sorted(values, key=order_key)
+
+        # Then
+        self.assertEqual(ordered, list(reversed(values)), 'values should be sorted in the order of mongodb')
+
+    def test_iterate_Test_sorted_merge(self):
+        # Given
+        cursors = [FakeCursor([dict(n=9), dict(n=5), dict(n=1)]), FakeCursor([dict(n=8), dict(n=3)])]
+        merged = MergedCursor(lambda: ['p1', 'p2'], lambda name: cursors.pop(0), sort=[('n', -1)], limit=4)
+
+        # When
+        docs = list(merged.batch_size(10))
+
+        # Then
+        self.assertEqual([doc['n'] for doc in docs], [9, 8, 5, 3])
+
+    def test_iterate_Test_chained_cursors(self):
+        # Given
+        cursors = [FakeCursor([dict(n=2), dict(n=1)]), FakeCursor([dict(n=3)])]
+        opened = list(cursors)
+        merged = MergedCursor(lambda: ['p1', 'p2'], lambda name: cursors.pop(0))
+
+        # When
+        docs = list(merged)
+        merged.close()
+
+        # Then
+        self.assertEqual([doc['n'] for doc in docs], [2, 1, 3], 'cursors without sort should be chained')
+        self.assertTrue(all(cursor.closed for cursor in opened))
@@ -0,0 +1,96 @@
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from simplog.metrics import Histogram, Metrics, PHASE_DB, ReactorLagMonitor
+from simplog.test.dummy import SimplogDummyRequest
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(max_groups=2)
+
+    def finish(self, request, code=200, body=b'{}'):
+        request.setResponseCode(code)
+        request.write(body)
+        request.finish()
+
+    def test_render_Test_histogram(self):
+        # Given
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(('logs',), value)
+        self.metrics.gauges['latency_seconds'] = histogram
+
+        # When
+        lines = self.metrics.render().decode('utf-8').splitlines()
+
+        # Then
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{route="logs",le="0.1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="logs",le="1.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="logs",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_sum{route="logs"} 2.65', lines)
+        self.assertIn('latency_seconds_count{route="logs"} 4', lines)
+
+    def test_track_Test_observed_Cond_finished(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups/movie')
+        timer = self.metrics.track(request, 'logs', 'movie')
+        timer.add(PHASE_DB, 0.002)
+        timer.add(PHASE_DB, 0.003)
+        timer.returned = 3
+
+        # When
+        self.finish(request, body=b'{"logs": []}')
+
+        # Then
+        labels = ('logs', 'GET', 'movie')
+        self.assertEqual(self.metrics.requests.values, {labels + ('200',): 1})
+        self.assertAlmostEqual(self.metrics.phase_seconds.values[labels + (PHASE_DB,)][1], 0.005)
+        self.assertEqual(self.metrics.response_bytes.values, {labels: 12})
+        self.assertEqual(self.metrics.documents_returned.values, {('movie',): 3})
+
+    def test_track_Test_group_label_Cond_max_groups(self):
+        # Given
+        for group_name in ('movie', 'game', 'music', 'movie'):
+            request = SimplogDummyRequest('GET', f'groups/{group_name}')
+            self.metrics.track(request, 'logs', group_name)
+            self.finish(request)
+
+        # When
+        groups = {labels[2]: count for labels, count in self.metrics.requests.values.items()}
+
+        # Then
+        self.assertEqual(groups, {'movie': 2, 'game': 1, '_other': 1}, 'groups beyond max_groups should be _other')
+
+    def test_render_Test_escaped_label(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups/a"b')
+        self.metrics.track(request, 'logs', 'a"b\\')
+        self.finish(request)
+
+        # When
+        body = self.metrics.render().decode('utf-8')
+
+        # Then
+        self.assertIn('group="a\\"b\\\\"', body)
+
+
+class ReactorLagMonitorTestCase(unittest.TestCase):
+    def test_tick_Test_observed_lag(self):
+        # Given
+        clock = Clock()
+        metrics = Metrics()
+        monitor = ReactorLagMonitor(metrics, interval=0.5, reactor=clock)
+        monitor.start()
+
+        # When
+        clock.advance(0.75)     # called 0.25 seconds late
+        clock.advance(0.5)
+        monitor.stop()
+
+        # Then
+        counts, total = metrics.reactor_lag.values[()]
+        self.assertEqual(sum(counts), 2)
+        self.assertAlmostEqual(total, 0.25)
+        self.assertEqual(clock.getDelayedCalls(), [], 'stop should cancel the next call')
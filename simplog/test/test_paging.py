@@ -0,0 +1,64 @@
+from twisted.trial import unittest
+
+from simplog.paging import InvalidPageArgument, PageOptions, decode_page_token
+
+
+class PageOptionsTestCase(unittest.TestCase):
+    def test_pipeline_Test_stages_Cond_search(self):
+        # Given
+        page = PageOptions.from_args({b'$search': [b'timeout'], b'$limit': [b'2'], b'$fields': [b'text']})
+        token = page.next_token(dict(_id='b', _score=1.5, text='read timeout'), 2)
+        next_page = PageOptions.from_args({b'$search': [b'timeout'], b'$limit': [b'2'], b'$after': [token.encode()]})
+
+        # When
+        stages = page.pipeline({'level': 'ERROR'})
+        next_stages = next_page.pipeline({})
+
+        # Then
+        self.assertTrue(page.ranked)
+        self.assertEqual(stages, [
+            {'$match': {'level': 'ERROR', '$text': {'$search': 'timeout'}}},
+            {'$addFields': {'_score': {'$meta': 'textScore'}}},
+            {'$sort': {'_score': -1, '_id': -1}},
+            {'$limit': 2},
+            {'$project': {'text': 1, '_score': 1}},
+        ])
+        self.assertEqual(decode_page_token(token), {'id': 'b', 'value': 1.5})
+        self.assertEqual(
+            next_stages[2], {'$match': {'$or': [{'_score': {'$lt': 1.5}}, {'_score': 1.5, '_id': {'$lt': 'b'}}]}},
+            'the next page should be resumed after the relevance and _id of the last log',
+        )
+
+    def test_query_Test_filter_Cond_search_sorted_by_field(self):
+        # Given
+        page = PageOptions.from_args({b'$search': [b'timeout'], b'$sort': [b'-time']})
+
+        # When
+        query = page.query({'level': 'ERROR'})
+
+        # Then
+        self.assertFalse(page.ranked, 'logs should be sorted by $sort rather than the relevance')
+        self.assertEqual(query, {'level': 'ERROR', '$text': {'$search': 'timeout'}})
+
+    def test_from_args_Test_error_Cond_empty_search(self):
+        # Given
+        # When
+        # Then
+        with self.assertRaises(InvalidPageArgument):
+            PageOptions.from_args({b'$search': [b' ']})
+
+    def test_query_Test_filter_Cond_after_mixed_types(self):
+        # Given
+        page = PageOptions(sort_field='n', descending=True)
+        page.after = {'id': 'b', 'value': 'x'}
+
+        # When
+        query = page.query({})
+
+        # Then
+        self.assertEqual(query, {'$or': [
+            {'n': {'$lt': 'x'}},
+            {'n': 'x', '_id': {'$lt': 'b'}},
+            {'n': None},
+            {'n': {'$type': 'number'}},
+        ]}, 'numbers and null or missing values should be after strings in descending order')
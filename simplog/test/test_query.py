@@ -0,0 +1,89 @@
+import datetime
+
+import mongomock
+from twisted.trial import unittest
+
+from simplog.query import QueryPlanCache, compile_query
+
+
+class CompileQueryTestCase(unittest.TestCase):
+    def test_compile_query_Test_filter(self):
+        # Given
+        args = {
+            b'title': [b'StarWars'],
+            b'year:int': [b'[1980:]'],
+            b'year:int!': [b'1983', b'1990'],
+            b'stars:float': [b'{3.9,4.3}'],
+            b'subtitle:exists': [b'false'],
+            b'created:date': [b'[2020-04-10T00:00:00:2020-04-11T00:00:00]'],
+            b'level!': [b'{DEBUG,INFO}'],
+        }
+
+        # When
+        plan = compile_query(args)
+
+        # Then
+        self.assertEqual(plan.filter, {
+            'title': 'StarWars',
+            'year': {'$gte': 1980, '$ne': 1983},
+            'stars': {'$in': [3.9, 4.3]},
+            'subtitle': {'$exists': False},
+            'created': {'$gte': datetime.datetime(2020, 4, 10), '$lt': datetime.datetime(2020, 4, 11)},
+            'level': {'$nin': ['DEBUG', 'INFO']},
+            '$and': [{'year': {'$ne': 1990}}],
+        })
+        self.assertEqual(plan.fields, ['title', 'year', 'stars', 'subtitle', 'created', 'level'])
+
+    def test_compile_query_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_args in [{b'$unknown': [b'1']}, {b'year:int': [b'[1980:x]']}, {b'tag:exists': [b'yes']}]:
+            with self.assertRaises(ValueError, msg=f'{invalid_args} should be rejected'):
+                compile_query(invalid_args)
+
+    def test_matches_Test_same_as_filter(self):
+        # Given
+        logs = [
+            dict(title='Terminator', year=1984, stars=3.9),
+            dict(title='StarWars', year=1977, stars=3.9, user=dict(name='kim')),
+            dict(title='DarkKnight', year=2008, stars=4.3, actor='Heath Ledger'),
+            dict(title='StarWars', year=1980, stars=4.0, subtitle='The Empire Strikes Back'),
+            dict(title='Frozen', year='2013'),
+        ]
+        collection = mongomock.MongoClient().logs.movie
+        collection.insert_many([dict(log) for log in logs])
+
+        # When
+        # Then
+        for args in [
+            {b'title': [b'StarWars']},
+            {b'year:int': [b'[1980:2008]']},
+            {b'year:int': [b'[0:]', b'[:2000]']},
+            {b'title': [b'{StarWars,Frozen}'], b'year:int!': [b'1977']},
+            {b'subtitle:exists': [b'true']},
+            {b'actor:exists!': [b'true'], b'stars:float!': [b'[4:]']},
+            {b'user.name': [b'kim']},
+        ]:
+            plan = compile_query(args)
+            self.assertEqual(
+                [log for log in logs if plan.matches(log)],
+                [{k: v for k, v in log.items() if k != '_id'} for log in collection.find(plan.filter)],
+                f'{args} should match the logs found by the filter',
+            )
+
+
+class QueryPlanCacheTestCase(unittest.TestCase):
+    def test_compile_Test_cached_plans(self):
+        # Given
+        queries = QueryPlanCache(max_entries=1)
+
+        # When
+        first_plan = queries.compile(('logs', b'title=Up'), {b'title': [b'Up']})
+        cached_plan = queries.compile(('logs', b'title=Up'), {b'title': [b'Up']})
+        queries.compile(('logs', b'title=ET'), {b'title': [b'ET']})
+
+        # Then
+        self.assertIs(cached_plan, first_plan, 'a repeated query string should not be compiled again')
+        self.assertEqual((queries.hits, queries.misses), (1, 2))
+        self.assertEqual(list(queries.plans), [('logs', b'title=ET')], 'the least recently used plan should be evicted')
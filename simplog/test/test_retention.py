@@ -0,0 +1,153 @@
+import datetime
+
+import mongomock
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from simplog.aggregate import Aggregation
+from simplog.executor import BoundedExecutor
+from simplog.indexes import IndexManager, IndexSpec
+from simplog.retention import InvalidRetentionPolicy, RetentionManager, RetentionPolicy
+
+_day = 24 * 60 * 60
+_base = datetime.datetime(2020, 4, 10, 12, 0)
+
+
+def timestamp(dt):
+    return (dt - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+class RetentionPolicyTestCase(unittest.TestCase):
+    def test_from_dict_Test_policy(self):
+        # Given
+        # When
+        ttl = RetentionPolicy.from_dict({'ttl': 3600})
+        capped = RetentionPolicy.from_dict({'capped': {'size': 1024, 'max': 10}})
+        partition = RetentionPolicy.from_dict({'partition': 'hourly', 'retention': 7200})
+
+        # Then
+        self.assertEqual((ttl.kind, ttl.ttl), ('ttl', 3600))
+        self.assertEqual((capped.kind, capped.size, capped.max_logs), ('capped', 1024, 10))
+        self.assertEqual((partition.kind, partition.partition, partition.retention), ('partition', 'hourly', 7200))
+        self.assertEqual(partition.partition_name('server', _base), 'server.2020041012')
+
+    def test_from_dict_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_policy in [
+            {}, {'ttl': 0}, {'ttl': '1'}, {'ttl': 1, 'capped': {'size': 1}}, {'capped': 1024},
+            {'partition': 'weekly', 'retention': 1}, {'partition': 'daily'},
+        ]:
+            with self.assertRaises(InvalidRetentionPolicy, msg=f'{invalid_policy} should be rejected'):
+                RetentionPolicy.from_dict(invalid_policy)
+
+
+class RetentionManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log_db = mongomock.MongoClient().logs
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.executor.start()
+        self.now = timestamp(_base)
+        self.retention = RetentionManager(self.log_db, self.executor, clock=lambda: self.now, reactor=Clock())
+        self.retention.policies['server'] = RetentionPolicy.from_dict({'partition': 'daily', 'retention': 2 * _day})
+        self.retention.policies['audit'] = RetentionPolicy.from_dict({'ttl': _day})
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def insert_days(self, group_name, days):
+        for day in days:
+            self.now = timestamp(_base + datetime.timedelta(days=day))
+            self.retention.insert_collection(group_name).insert_many([{'day': day}])
+
+    def test_insert_collection_Test_partitions(self):
+        # Given
+        # When
+        self.insert_days('server', [0, 0, 1])
+
+        # Then
+        self.assertEqual(self.log_db['server.20200410'].count_documents({}), 2)
+        self.assertEqual(self.log_db['server.20200411'].count_documents({}), 1)
+        self.assertEqual(self.log_db['server.20200411'].find_one()['_ingested'], _base + datetime.timedelta(days=1))
+        self.assertEqual(self.log_db.server.count_documents({}), 0, 'logs should be stored in partitions')
+
+    def test_insert_collection_Test_ingest_time_Cond_ttl(self):
+        # Given
+        # When
+        self.retention.insert_collection('audit').insert_many([{'user': 'admin'}])
+        self.retention.insert_collection('movie').insert_many([{'title': 'Up'}])
+
+        # Then
+        self.assertEqual(self.log_db.audit.find_one()['_ingested'], _base)
+        self.assertNotIn('_ingested', self.log_db.movie.find_one(), 'logs of groups without policies are kept')
+
+    def test_group_collections_Test_pruned_partitions(self):
+        # Given
+        self.insert_days('server', [0, 1, 2, 3])
+
+        # When
+        all_partitions = self.retention.group_collections('server')
+        pruned_partitions = self.retention.group_collections('server', {'_ingested': {
+            '$gte': _base + datetime.timedelta(days=1), '$lt': _base + datetime.timedelta(days=2),
+        }})
+
+        # Then
+        self.assertEqual(
+            [c.name for c in all_partitions],
+            ['server.20200410', 'server.20200411', 'server.20200412', 'server.20200413'],
+        )
+        self.assertEqual(
+            [c.name for c in pruned_partitions], ['server.20200411', 'server.20200412'],
+            'only the partitions of the queried time range should be read',
+        )
+
+    @inlineCallbacks
+    def test_expire_Test_dropped_partitions(self):
+        # Given
+        self.insert_days('server', [0, 1, 2, 3])
+
+        # When
+        yield self.retention.expire()
+
+        # Then
+        self.assertEqual(
+            sorted(name for name in self.log_db.list_collection_names() if name.startswith('server')),
+            ['server.20200411', 'server.20200412', 'server.20200413'],
+            'partitions which ended more than 2 days ago should be dropped',
+        )
+
+    def test_insert_collection_Test_indexes_Cond_new_partition(self):
+        # Given
+        index_manager = IndexManager(self.log_db, self.executor, retention=self.retention)
+        index_manager.builds['server']['host_1'] = {
+            'spec': IndexSpec.from_dict({'keys': ['host']}), 'status': 'ready', 'error': None,
+        }
+
+        # When
+        self.insert_days('server', [0])
+
+        # Then
+        self.assertIn('host_1', self.log_db['server.20200410'].index_information(),
+                      'indexes of the group should be created in a new partition')
+
+    def test_run_many_Test_merged_aggregation(self):
+        # Given
+        self.insert_days('server', [0, 1])
+        self.log_db['server.20200410'].insert_many([dict(level='ERROR', took=1), dict(level='INFO', took=2)])
+        self.log_db['server.20200411'].insert_many([dict(level='ERROR', took=6), dict(level='ERROR')])
+        collections = self.retention.group_collections('server')
+
+        # When
+        count = Aggregation('count').run_many(collections, {})
+        groups = Aggregation('groupby', field='level', limit=1).run_many(collections, {})
+        stats = Aggregation('stats', field='took').run_many(collections, {})
+
+        # Then
+        self.assertEqual(count, {'count': 6})
+        self.assertEqual(groups['groups'], [{'value': 'ERROR', 'count': 3}])
+        self.assertEqual(
+            stats, dict(field='took', count=3, min=1, max=6, avg=3.0, sum=9),
+            'stats of partitions should be merged like the stats of one collection',
+        )
@@ -0,0 +1,89 @@
+import datetime
+
+from twisted.trial import unittest
+
+from simplog.query import compile_query
+from simplog.schema import GroupSchema, InvalidLog, InvalidSchema, parse_date
+
+
+class GroupSchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.schema = GroupSchema.from_dict({
+            'fields': {'created': 'date', 'year': 'int', 'stars': 'float', 'code': 'string', 'req.size': 'int'},
+            'ingested': True,
+        })
+
+    def test_normalize_Test_log(self):
+        # Given
+        ingested = datetime.datetime(2020, 4, 10, 12, 0)
+        log = {
+            'created': '2020-04-10T21:00:00.123456+09:00', 'year': '1984', 'stars': 4, 'code': 404,
+            'req': {'size': 1024.0}, 'title': '1984',
+        }
+
+        # When
+        self.schema.normalize(log, ingested)
+
+        # Then
+        self.assertEqual(log, {
+            'created': datetime.datetime(2020, 4, 10, 12, 0, 0, 123000), 'year': 1984, 'stars': 4.0, 'code': '404',
+            'req': {'size': 1024}, 'title': '1984', '_ingested': ingested,
+        })
+        self.assertIsInstance(log['stars'], float)
+
+    def test_normalize_Test_log_Cond_missing_and_null(self):
+        # Given
+        log = {'created': None, 'req': 'GET /'}
+
+        # When
+        self.schema.normalize(log)
+
+        # Then
+        self.assertEqual(log, {'created': None, 'req': 'GET /'}, 'missing and null fields should be kept')
+
+    def test_normalize_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_log in [
+            {'year': '1984.5'}, {'year': True}, {'stars': 'NaN'}, {'created': 'yesterday'}, {'created': [1]},
+            {'code': {'status': 404}},
+        ]:
+            with self.assertRaises(InvalidLog, msg=f'{invalid_log} should be rejected'):
+                self.schema.normalize(invalid_log)
+        with self.assertRaisesRegex(InvalidLog, r'log\[1\]'):
+            self.schema.normalize_all([{'year': 1984}, {'year': 'unknown'}])
+
+    def test_from_dict_Test_error(self):
+        # Given
+        # When
+        # Then
+        for invalid_schema in [
+            [], {'fields': []}, {'fields': {'year': 'integer'}}, {'fields': {'_id': 'int'}},
+            {'fields': {}, 'ingested': 'yes'}, {'types': {}},
+        ]:
+            with self.assertRaises(InvalidSchema, msg=f'{invalid_schema} should be rejected'):
+                GroupSchema.from_dict(invalid_schema)
+
+    def test_compile_query_Test_filter_Cond_query_types(self):
+        # Given
+        args = {
+            b'year': [b'[1980:]'],
+            b'stars!': [b'4.0'],
+            b'created': [b'[2020-04-10T00:00:00Z:2020-04-11T09:00:00+09:00]'],
+            b'code': [b'404'],
+            b'title:int': [b'1984'],
+        }
+
+        # When
+        plan = compile_query(args, self.schema.query_types)
+
+        # Then
+        self.assertEqual(plan.filter, {
+            'year': {'$gte': 1980},
+            'stars': {'$ne': 4.0},
+            'created': {'$gte': datetime.datetime(2020, 4, 10), '$lt': datetime.datetime(2020, 4, 11)},
+            'code': '404',
+            'title': 1984,
+        })
+        self.assertEqual(parse_date('2020-04-10'), datetime.datetime(2020, 4, 10))
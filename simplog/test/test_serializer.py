@@ -0,0 +1,81 @@
+import datetime
+import json
+import uuid
+
+from bson import ObjectId, Regex, Timestamp
+from twisted.trial import unittest
+
+from simplog.serializer import JSONSerializer, OrjsonSerializer, get_serializer, orjson
+
+
+class SerializerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.object_id = ObjectId()
+        self.log = dict(
+            _id=self.object_id,
+            created=datetime.datetime(2020, 4, 10, 12, 30, 15, 250000),
+            day=datetime.date(2020, 4, 10),
+            request_id=uuid.UUID('12345678123456781234567812345678'),
+            data='May the Force be with You',
+            year=1977,
+            stars=3.9,
+            tags=['sf', None, True],
+        )
+        self.expected = dict(
+            _id=str(self.object_id),
+            created='2020-04-10T12:30:15.250000',
+            day='2020-04-10',
+            request_id='12345678-1234-5678-1234-567812345678',
+            data='May the Force be with You',
+            year=1977,
+            stars=3.9,
+            tags=['sf', None, True],
+        )
+
+    def serializers(self):
+        serializers = [JSONSerializer()]
+        if orjson is not None:
+            serializers.append(OrjsonSerializer())
+        return serializers
+
+    def test_dumps_Test_bson_values(self):
+        # Given
+        # When
+        # Then
+        for serializer in self.serializers():
+            self.assertEqual(
+                json.loads(serializer.dumps(self.log)), self.expected,
+                f'{serializer.name} should encode ObjectId as str and datetime as ISO-8601'
+            )
+
+    def test_dumps_Test_fallback_Cond_other_bson_types(self):
+        # Given
+        log = dict(pattern=Regex('^GET ', 'i'), oplog=Timestamp(1586521815, 1))
+
+        # When
+        # Then
+        for serializer in self.serializers():
+            self.assertEqual(
+                json.loads(serializer.dumps(log)), dict(pattern=str(log['pattern']), oplog=str(log['oplog'])),
+                f'{serializer.name} should encode the other types as str',
+            )
+
+    def test_dumps_Test_fallback_Cond_non_str_keys(self):
+        # Given
+        if orjson is None:
+            raise unittest.SkipTest('orjson is not installed')
+
+        # When
+        result = OrjsonSerializer().dumps({1: 'one'})
+
+        # Then
+        self.assertEqual(json.loads(result), {'1': 'one'}, 'orjson serializer should fall back to json')
+
+    def test_get_serializer_Test_name(self):
+        # Given
+        # When
+        # Then
+        self.assertEqual(get_serializer('json').name, 'json')
+        self.assertEqual(get_serializer().name, 'orjson' if orjson is not None else 'json')
+        with self.assertRaises(ValueError):
+            get_serializer('pickle')
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+import mongomock
+from pymongo.errors import AutoReconnect
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from simplog.executor import BoundedExecutor
+from simplog.spool import FSYNC_ALWAYS, Spool, SpoolCollection, SpoolDrainer, SpoolFull
+
+
+class SpoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = 100.0
+
+    def open_spool(self, **kwargs):
+        spool = Spool(self.directory, segment_bytes=200, fsync=FSYNC_ALWAYS, clock=lambda: self.now, **kwargs)
+        spool.open()
+        self.addCleanup(spool.close)
+        return spool
+
+    def segment_files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.spool'))
+
+    def test_read_Test_records_Cond_reopened(self):
+        # Given
+        spool = self.open_spool()
+        for i in range(6):
+            SpoolCollection(spool, 'movie').insert_many([dict(title=f'movie{i}', text='x' * 50)])
+        records, position = spool.read(4)
+        spool.commit(position)
+        spool.close()
+        with open(os.path.join(self.directory, self.segment_files()[-1]), 'ab') as f:
+            f.write(b'{"t": 100, "g": "movie", "lo')   # torn by a crash
+
+        # When
+        reopened = self.open_spool()
+        rest, _ = reopened.read(100)
+
+        # Then
+        self.assertEqual([logs[0]['title'] for _, logs, _ in records], ['movie0', 'movie1', 'movie2', 'movie3'])
+        self.assertEqual(
+            [logs[0]['title'] for _, logs, _ in rest], ['movie4', 'movie5'],
+            'records after the checkpoint should be read again, without the torn one',
+        )
+        self.assertEqual(reopened.size, spool.size)
+        self.assertLess(len(self.segment_files()), 6, 'inserted segments should be deleted')
+
+    def test_append_Test_error_Cond_full(self):
+        # Given
+        spool = self.open_spool(max_bytes=150)
+        SpoolCollection(spool, 'movie').insert_many([dict(title='x' * 50)])
+
+        # When
+        # Then
+        with self.assertRaises(SpoolFull):
+            SpoolCollection(spool, 'movie').insert_many([dict(title='x' * 50)])
+
+    def test_lag_Test_seconds(self):
+        # Given
+        spool = self.open_spool()
+        SpoolCollection(spool, 'movie').insert_many([dict(title='Up')])
+        self.now += 5
+        SpoolCollection(spool, 'movie').insert_many([dict(title='ET')])
+
+        # When
+        self.now += 1
+        lag = spool.lag()
+        _, position = spool.read(1)
+        spool.commit(position, next_time=105.0)
+
+        # Then
+        self.assertEqual(lag, 6.0)
+        self.assertEqual(spool.lag(), 1.0, 'lag should be the age of the oldest log not inserted yet')
+
+
+class SpoolDrainerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log_db = mongomock.MongoClient().logs
+        self.executor = BoundedExecutor(max_workers=1, max_queue=1)
+        self.executor.start()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.spool = Spool(directory)
+        self.spool.open()
+        self.clock = Clock()
+        self.drained = []
+        self.drainer = SpoolDrainer(
+            self.spool, self.executor, self.insert_collection, batch_size=2, on_drained=self.drained.append,
+            reactor=self.clock,
+        )
+        self.fail_inserts = 0
+
+    def tearDown(self):
+        self.spool.close()
+        self.executor.stop()
+
+    def insert_collection(self, group_name):
+        if self.fail_inserts:
+            self.fail_inserts -= 1
+            raise AutoReconnect('connection refused')
+        return self.log_db[group_name]
+
+    @inlineCallbacks
+    def drain(self):
+        self.drainer.drain()
+        while self.drainer.draining:
+            yield self.executor.submit_admitted(lambda: None)
+
+    @inlineCallbacks
+    def test_drain_Test_db_data_Cond_retried(self):
+        # Given
+        movie_ids = SpoolCollection(self.spool, 'movie').insert_many([dict(title='Up'), dict(title='ET')]).inserted_ids
+        SpoolCollection(self.spool, 'server').insert_many([dict(level='ERROR')])
+        self.log_db.movie.insert_one(dict(_id=movie_ids[0], title='Up'))     # inserted before a crash
+        self.fail_inserts = 1
+
+        # When
+        yield self.drain()
+        failed_size = self.spool.size
+        yield self.drain()
+        self.clock.advance(1)
+        yield self.drain()
+        yield self.drain()
+
+        # Then
+        self.assertGreater(failed_size, 0, 'failed logs should be kept in the spool')
+        self.assertEqual(sorted(log['title'] for log in self.log_db.movie.find()), ['ET', 'Up'])
+        self.assertEqual(self.log_db.server.count_documents({}), 1)
+        self.assertEqual(self.spool.size, 0)
+        self.assertEqual(self.drained, ['movie', 'server'])
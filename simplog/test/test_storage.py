@@ -0,0 +1,202 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+import mongomock
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from twisted.trial import unittest
+
+from simplog.indexes import IndexSpec
+from simplog.paging import PageOptions
+from simplog.sqlite_storage import SQLiteEngine
+from simplog.storage import FEATURE_AGGREGATE, MongoEngine, UnsupportedFeature
+
+
+class StorageConformance:
+    """Tests which every storage engine should pass, mixed into a TestCase of each engine with `open_engine()`."""
+    def setUp(self):
+        self.engine = self.open_engine()
+        self.addCleanup(self.engine.close)
+        self.movies = self.engine.log_db['movie']
+        self.movie_logs = [
+            dict(title='Terminator', year=1984, stars=3.9, released=datetime.datetime(1984, 10, 26)),
+            dict(title='StarWars', year=1977, stars=3.9, released=datetime.datetime(1977, 5, 25)),
+            dict(title='DarkKnight', year=2008, stars=4.3, actor='Heath Ledger', cast=dict(joker='Heath Ledger')),
+            dict(title='StarWars', year='1980', stars=4.0, subtitle='The Empire Strikes Back'),
+        ]
+        self.ids = self.movies.insert_many(self.movie_logs).inserted_ids
+
+    def titles(self, query, **find_kwargs):
+        return sorted(log['title'] for log in self.movies.find(query, **find_kwargs))
+
+    def test_insert_many_Test_ids(self):
+        # Given
+        # When
+        # Then
+        self.assertEqual(len(set(self.ids)), 4)
+        self.assertTrue(all(isinstance(log_id, ObjectId) for log_id in self.ids))
+        self.assertEqual([log['_id'] for log in self.movies.find({})], self.ids, 'logs are found in inserted order')
+        self.assertEqual(self.movies.find({'title': 'Terminator'}).next()['released'], datetime.datetime(1984, 10, 26))
+
+    def test_insert_many_Test_error_Cond_duplicate_id(self):
+        # Given
+        logs = [dict(_id=self.ids[0], title='Up'), dict(title='Frozen')]
+
+        # When
+        with self.assertRaises(BulkWriteError) as raised:
+            self.movies.insert_many(logs, ordered=False)
+
+        # Then
+        self.assertEqual([error['code'] for error in raised.exception.details['writeErrors']], [11000])
+        self.assertEqual(self.titles({'title': {'$in': ['Up', 'Frozen']}}), ['Frozen'])
+
+    def test_find_Test_logs_Cond_operators(self):
+        # Given
+        # When
+        # Then
+        self.assertEqual(self.titles({'year': 1977}), ['StarWars'])
+        self.assertEqual(self.titles({'year': {'$gte': 1980}}), ['DarkKnight', 'Terminator'],
+                         'values of other types should not match')
+        self.assertEqual(self.titles({'year': {'$gte': 1980, '$lt': 2000}}), ['Terminator'])
+        self.assertEqual(self.titles({'title': {'$ne': 'StarWars'}}), ['DarkKnight', 'Terminator'])
+        self.assertEqual(self.titles({'title': {'$in': ['Up', 'StarWars']}}), ['StarWars', 'StarWars'])
+        self.assertEqual(self.titles({'title': {'$nin': ['StarWars']}, 'stars': 3.9}), ['Terminator'])
+        self.assertEqual(self.titles({'actor': {'$exists': True}}), ['DarkKnight'])
+        self.assertEqual(self.titles({'actor': None}), ['StarWars', 'StarWars', 'Terminator'])
+        self.assertEqual(self.titles({'stars': {'$not': {'$gte': 4.0}}}), ['StarWars', 'Terminator'])
+        self.assertEqual(self.titles({'$or': [{'year': 2008}, {'year': '1980'}]}), ['DarkKnight', 'StarWars'])
+        self.assertEqual(self.titles({'$and': [{}, {'stars': 3.9}]}), ['StarWars', 'Terminator'])
+        self.assertEqual(self.titles({'cast.joker': 'Heath Ledger'}), ['DarkKnight'])
+        self.assertEqual(self.titles({'released': {'$lt': datetime.datetime(1980, 1, 1)}}), ['StarWars'])
+        self.assertEqual(self.titles({'_id': {'$gt': self.ids[1]}}), ['DarkKnight', 'StarWars'])
+
+    def test_find_Test_logs_Cond_sort_limit_projection(self):
+        # Given
+        # When
+        logs = list(self.movies.find({'stars': {'$gte': 3.9}}, {'title': 1, 'cast.joker': 1})
+                    .sort([('stars', -1), ('_id', -1)]).limit(3).batch_size(2))
+
+        # Then
+        self.assertEqual(logs, [
+            dict(_id=self.ids[2], title='DarkKnight', cast=dict(joker='Heath Ledger')),
+            dict(_id=self.ids[3], title='StarWars'),
+            dict(_id=self.ids[1], title='StarWars'),
+        ])
+
+    def test_find_Test_logs_Cond_pages(self):
+        # Given
+        page = PageOptions(limit=3, sort_field='stars', descending=True)
+
+        # When
+        first = list(page.find(self.movies, {}))
+        page.after = {'id': first[-1]['_id'], 'value': first[-1]['stars']}
+        second = list(page.find(self.movies, {}))
+
+        # Then
+        self.assertEqual([log['_id'] for log in first + second], [self.ids[i] for i in (2, 3, 1, 0)])
+
+    def test_find_Test_logs_Cond_pages_mixed_types(self):
+        # Given
+        def page_ids(sort_field, descending):
+            page = PageOptions(limit=1, sort_field=sort_field, descending=descending)
+            ids = []
+            while True:
+                logs = list(page.find(self.movies, {}))
+                if not logs:
+                    return ids
+                ids.append(logs[0]['_id'])
+                page.after = {'id': logs[0]['_id'], 'value': logs[0].get(sort_field)}
+
+        # When
+        # Then
+        self.assertEqual(page_ids('actor', False), [self.ids[i] for i in (0, 1, 3, 2)],
+                         'logs without the sort field should be paged before the others')
+        self.assertEqual(page_ids('actor', True), [self.ids[i] for i in (2, 3, 1, 0)],
+                         'logs without the sort field should be paged after the others in descending order')
+        self.assertEqual(page_ids('year', False), [self.ids[i] for i in (1, 0, 2, 3)],
+                         'strings should be paged after numbers')
+        self.assertEqual(page_ids('year', True), [self.ids[i] for i in (3, 2, 0, 1)])
+
+    def test_count_documents_Test_count(self):
+        # Given
+        # When
+        # Then
+        self.assertEqual(self.movies.count_documents({}), 4)
+        self.assertEqual(self.movies.count_documents({'title': 'StarWars'}), 2)
+        self.assertEqual(self.engine.log_db['unknown'].count_documents({}), 0)
+
+    def test_create_index_Test_index_information(self):
+        # Given
+        spec = IndexSpec.from_dict({'keys': ['title', '-year'], 'unique': False})
+
+        # When
+        self.movies.create_index(spec.keys, name=spec.name, unique=spec.unique)
+        self.movies.create_index([('actor', 1)], name='actor')
+        self.movies.drop_index('actor')
+
+        # Then
+        specs = [IndexSpec.from_index_information(name, info).to_dict()
+                 for name, info in self.movies.index_information().items()]
+        self.assertEqual(specs, [
+            dict(name='_id_', keys=['_id'], unique=False),
+            dict(name='title_1_year_-1', keys=['title', '-year'], unique=False),
+        ])
+        self.assertEqual(self.titles({'title': 'StarWars'}), ['StarWars', 'StarWars'])
+
+    def test_create_index_Test_error_Cond_unique(self):
+        # Given
+        servers = self.engine.log_db['server']
+        servers.create_index([('host', 1)], name='host', unique=True)
+        servers.insert_many([dict(host='web1')])
+
+        # When
+        # Then
+        with self.assertRaises(BulkWriteError):
+            servers.insert_many([dict(host='web2'), dict(host='web1')])
+        self.assertEqual(servers.count_documents({}), 2)
+
+    def test_drop_collection_Test_collection_names(self):
+        # Given
+        self.engine.log_db['server'].insert_many([dict(level='ERROR')])
+
+        # When
+        self.engine.log_db.drop_collection('movie')
+
+        # Then
+        self.assertEqual(self.engine.log_db.list_collection_names(), ['server'])
+        self.assertEqual(list(self.engine.log_db['movie'].find({})), [])
+
+
+class MongoStorageTestCase(StorageConformance, unittest.TestCase):
+    def open_engine(self):
+        return MongoEngine(mongomock.MongoClient())
+
+
+class SQLiteStorageTestCase(StorageConformance, unittest.TestCase):
+    def open_engine(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return SQLiteEngine(os.path.join(directory, 'logs.db'))
+
+    def test_find_Test_query_plan_Cond_index(self):
+        # Given
+        self.movies.create_index([('year', 1)], name='year')
+        cursor = self.movies.find({'year': {'$gte': 1980}})
+
+        # When
+        sql, params = cursor.sql()
+        with self.engine.connection() as connection:
+            plan = ' '.join(str(row) for row in connection.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+        # Then
+        self.assertIn('USING INDEX', plan, 'a range of an indexed field should be read by the index')
+
+    def test_find_Test_error_Cond_unsupported(self):
+        # Given
+        # When
+        # Then
+        self.assertFalse(self.engine.supports(FEATURE_AGGREGATE))
+        with self.assertRaises(UnsupportedFeature):
+            list(self.movies.find({'$text': {'$search': 'StarWars'}}))
@@ -0,0 +1,138 @@
+import json
+
+from twisted.internet.defer import fail, succeed
+from twisted.trial import unittest
+
+from simplog.serializer import JSONSerializer
+from simplog.streaming import CursorProducer
+from simplog.test.dummy import SimplogDummyRequest
+
+
+class ImmediateExecutor:
+    def submit(self, func, *args, **kwargs):
+        try:
+            return succeed(func(*args, **kwargs))
+        except Exception as e:
+            return fail(e)
+
+    submit_admitted = submit
+
+
+class DummyCursor:
+    def __init__(self, docs):
+        self.docs = iter(docs)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.docs)
+
+    def close(self):
+        self.closed = True
+
+
+class PausingRequest(SimplogDummyRequest):
+    def write(self, data):
+        super().write(data)
+        if self.producer is not None:
+            self.producer.pauseProducing()
+
+
+class CursorProducerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.docs = [dict(seq=i, text=f'log {i}') for i in range(5)]
+
+    def start_producer(self, request, cursor, batch_size=2):
+        producer = CursorProducer(request, ImmediateExecutor(), cursor, JSONSerializer(), batch_size=batch_size)
+        producer.start()
+        return producer
+
+    def test_start_Test_written_chunks(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups/movie')
+        cursor = DummyCursor(self.docs)
+
+        # When
+        self.start_producer(request, cursor)
+
+        # Then
+        self.assertEqual(json.loads(request.value()), {'logs': self.docs}, 'all documents should be written')
+        self.assertGreater(len(request.written), 3, 'documents should be written in several chunks')
+        self.assertTrue(request.finished, 'request should be finished')
+        self.assertTrue(cursor.closed, 'cursor should be closed')
+
+    def test_start_Test_written_chunks_Cond_empty_cursor(self):
+        # Given
+        request = SimplogDummyRequest('GET', 'groups/movie')
+
+        # When
+        self.start_producer(request, DummyCursor([]))
+
+        # Then
+        self.assertEqual(json.loads(request.value()), {'logs': []})
+        self.assertTrue(request.finished)
+
+    def test_pauseProducing_Test_written_chunks(self):
+        # Given
+        request = PausingRequest('GET', 'groups/movie')
+
+        # When
+        producer = self.start_producer(request, DummyCursor(self.docs))
+
+        # Then
+        self.assertFalse(request.finished, 'paused producer should not read the next batch')
+        written_on_pause = len(request.written)
+        while not request.finished:
+            producer.resumeProducing()
+            self.assertGreater(len(request.written), written_on_pause, 'resumed producer should write a batch')
+            written_on_pause = len(request.written)
+        self.assertEqual(json.loads(request.value()), {'logs': self.docs})
+
+    def test_stopProducing_Test_cursor_closed(self):
+        # Given
+        request = PausingRequest('GET', 'groups/movie')
+        cursor = DummyCursor(self.docs)
+        producer = self.start_producer(request, cursor)
+
+        # When
+        producer.stopProducing()
+        producer.resumeProducing()
+
+        # Then
+        self.assertTrue(cursor.closed, 'cursor should be closed when the producer is stopped')
+        self.assertFalse(request.finished, 'stopped producer should not write anymore')
+
+    def test_start_Test_response_code_Cond_cursor_error(self):
+        # Given
+        class BrokenCursor(DummyCursor):
+            def __next__(self):
+                raise RuntimeError('connection reset')
+        request = SimplogDummyRequest('GET', 'groups/movie')
+
+        # When
+        self.start_producer(request, BrokenCursor([]))
+
+        # Then
+        self.assertEqual(request.responseCode, 500)
+        self.assertFalse(json.loads(request.value())['success'])
+        self.flushLoggedErrors(RuntimeError)
+
+    def test_start_Test_connection_lost_Cond_cursor_error_after_first_batch(self):
+        # Given
+        class BrokenCursor(DummyCursor):
+            def __next__(self):
+                doc = super().__next__()
+                if doc['seq'] == 3:
+                    raise RuntimeError('connection reset')
+                return doc
+        request = SimplogDummyRequest('GET', 'groups/movie')
+        request.notifyFinish().addErrback(lambda _: None)
+
+        # When
+        self.start_producer(request, BrokenCursor(self.docs))
+
+        # Then
+        self.assertTrue(request.connection_lost, 'truncated response should be closed without a valid end')
+        self.flushLoggedErrors(RuntimeError)
@@ -0,0 +1,80 @@
+import json
+
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from simplog.serializer import get_serializer
+from simplog.query import compile_query
+from simplog.tail import CONTENT_TYPE, TailHub, TooManySubscribers
+from simplog.test.dummy import SimplogDummyRequest
+
+
+def events(request):
+    return [event for event in request.value().split('\n\n') if event]
+
+
+class TailHubTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.hub = TailHub(
+            get_serializer(), max_subscribers=2, max_pending=2, heartbeat_interval=15, reactor=self.clock,
+        )
+        self.hub.start()
+
+    def tearDown(self):
+        self.hub.stop()
+
+    def subscribe(self, group_name, args):
+        request = SimplogDummyRequest('GET', f'groups/{group_name}/tail', args=args)
+        self.hub.subscribe(request, group_name, compile_query(request.args).matches)
+        return request
+
+    def test_inserted_Test_events(self):
+        # Given
+        star_wars = self.subscribe('movie', {'title': 'StarWars'})
+        movies = self.subscribe('movie', {})
+
+        # When
+        self.hub.inserted('movie', [dict(_id='1', title='StarWars'), dict(_id='2', title='Up')])
+        self.hub.inserted('server', [dict(_id='3', level='ERROR')])
+
+        # Then
+        retry, event = events(star_wars)
+        self.assertEqual(star_wars.responseHeaders.getRawHeaders('Content-Type'), [CONTENT_TYPE])
+        self.assertEqual(retry, 'retry: 3000')
+        self.assertTrue(event.startswith('event: log\nid: 1\ndata: '))
+        self.assertEqual(json.loads(event.split('data: ')[1]), dict(_id='1', title='StarWars'))
+        self.assertEqual([json.loads(event.split('data: ')[1])['_id'] for event in events(movies)[1:]], ['1', '2'])
+
+    def test_start_Test_heartbeat(self):
+        # Given
+        request = self.subscribe('movie', {})
+
+        # When
+        self.clock.advance(15)
+
+        # Then
+        self.assertEqual(events(request), ['retry: 3000', ': heartbeat'])
+
+    def test_inserted_Test_lagged_Cond_paused(self):
+        # Given
+        request = self.subscribe('movie', {})
+        request.producer.pauseProducing()
+
+        # When
+        self.hub.inserted('movie', [dict(_id=str(i)) for i in range(3)])
+
+        # Then
+        self.assertEqual(events(request), ['retry: 3000', 'event: lagged\ndata: {}'])
+        self.assertEqual(request.finished, 1, 'a subscriber which cannot catch up should be closed')
+        self.assertEqual(self.hub.count, 0)
+
+    def test_subscribe_Test_error_Cond_too_many_subscribers(self):
+        # Given
+        self.subscribe('movie', {})
+        self.subscribe('server', {})
+
+        # When
+        # Then
+        with self.assertRaises(TooManySubscribers):
+            self.subscribe('movie', {})
@@ -0,0 +1,120 @@
+import signal
+
+from twisted.internet.error import ProcessDone, ProcessTerminated
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+
+from simplog.workers import HEARTBEAT_FD, LISTEN_FD, WorkerSupervisor
+
+
+class DummyProcessTransport:
+    def __init__(self, pid):
+        self.pid = pid
+        self.signals = []
+
+    def signalProcess(self, signal_name):
+        self.signals.append(signal_name)
+
+
+class DummyProcessReactor(Clock):
+    def __init__(self):
+        super().__init__()
+        self.processes = []
+
+    def spawnProcess(self, protocol, executable, args, env=None, childFDs=None):
+        transport = DummyProcessTransport(pid=len(self.processes) + 1)
+        protocol.makeConnection(transport)
+        self.processes.append((protocol, args, childFDs))
+        return transport
+
+
+class WorkerSupervisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reactor = DummyProcessReactor()
+        self.supervisor = WorkerSupervisor(0, 2, ['-p', '8080'], interface='127.0.0.1', heartbeat_timeout=10.0,
+                                           reactor=self.reactor)
+        self.supervisor.start()
+
+    def tearDown(self):
+        self.supervisor.stopping = True
+        self.supervisor.listening_socket.close()
+        if self.supervisor.health_check.running:
+            self.supervisor.health_check.stop()
+
+    def heartbeat(self, worker):
+        worker.childDataReceived(HEARTBEAT_FD, b'.')
+
+    def end(self, worker, reason=ProcessTerminated(signal=signal.SIGTERM)):
+        worker.processEnded(Failure(reason))
+
+    def test_start_Test_workers(self):
+        # Given
+        # When
+        # Then
+        self.assertEqual(len(self.supervisor.workers), 2)
+        for _, args, child_fds in self.reactor.processes:
+            self.assertEqual(args[-4:], ['--worker-fd', str(LISTEN_FD), '--heartbeat-fd', str(HEARTBEAT_FD)])
+            self.assertEqual(child_fds[LISTEN_FD], self.supervisor.listening_socket.fileno(),
+                             'workers should inherit the listening socket')
+
+    def test_worker_ended_Test_respawn(self):
+        # Given
+        worker = next(iter(self.supervisor.workers))
+
+        # When
+        self.end(worker, ProcessDone(1))
+        self.reactor.advance(self.supervisor.max_restart_delay)
+
+        # Then
+        self.assertEqual(len(self.supervisor.workers), 2, 'exited worker should be started again')
+        self.assertEqual(len(self.reactor.processes), 3)
+
+    def test_check_health_Test_kill(self):
+        # Given
+        workers = list(self.supervisor.workers)
+
+        # When
+        for _ in range(11):
+            self.reactor.advance(1.0)
+            self.heartbeat(workers[0])
+
+        # Then
+        self.assertEqual(workers[0].transport.signals, [], 'worker with heartbeats should not be killed')
+        self.assertEqual(workers[1].transport.signals, ['KILL'], 'worker without heartbeats should be killed')
+
+    def test_restart_Test_old_workers_stopped(self):
+        # Given
+        old_workers = list(self.supervisor.workers)
+
+        # When
+        self.supervisor.restart()
+        new_workers = [w for w in self.supervisor.workers if w not in old_workers]
+        self.heartbeat(new_workers[0])
+
+        # Then
+        self.assertEqual(len(new_workers), 2)
+        self.assertEqual(
+            sorted(len(w.transport.signals) for w in old_workers), [0, 1],
+            'an old worker should be stopped when a new worker is ready'
+        )
+        self.heartbeat(new_workers[1])
+        self.assertEqual([w.transport.signals for w in old_workers], [['TERM'], ['TERM']])
+        for worker in old_workers:
+            self.end(worker)
+        self.reactor.advance(self.supervisor.max_restart_delay)
+        self.assertEqual(set(self.supervisor.workers), set(new_workers), 'old workers should not be started again')
+
+    def test_stop_Test_workers_stopped(self):
+        # Given
+        workers = list(self.supervisor.workers)
+
+        # When
+        d = self.supervisor.stop()
+        for worker in workers:
+            self.end(worker)
+
+        # Then
+        self.assertEqual([w.transport.signals for w in workers], [['TERM'], ['TERM']])
+        self.assertTrue(d.called, 'stop should be done when all workers exited')
+        self.assertFalse(self.reactor.getDelayedCalls(), 'no worker should be started or killed after stop')
@@ -0,0 +1,175 @@
+import os
+import signal
+import socket
+import sys
+
+from twisted.internet import reactor as default_reactor
+from twisted.internet.defer import Deferred, DeferredList, succeed
+from twisted.internet.protocol import ProcessProtocol
+from twisted.internet.task import LoopingCall
+from twisted.python import log
+
+# file descriptors of worker processes
+LISTEN_FD = 3
+HEARTBEAT_FD = 4
+
+_heartbeat = b'.'
+
+
+class WorkerProtocol(ProcessProtocol):
+    def __init__(self, supervisor, generation):
+        self.supervisor = supervisor
+        self.generation = generation
+        self.ready = False
+        self.terminating = False
+        self.last_heartbeat = supervisor.reactor.seconds()
+        self.started = self.last_heartbeat
+        self.ended = Deferred()
+
+    @property
+    def pid(self):
+        return self.transport.pid if self.transport is not None else None
+
+    def childDataReceived(self, child_fd, data):
+        if child_fd == HEARTBEAT_FD:
+            self.last_heartbeat = self.supervisor.reactor.seconds()
+            if not self.ready:
+                self.ready = True
+                self.supervisor.worker_ready(self)
+
+    def processEnded(self, reason):
+        self.supervisor.worker_ended(self, reason)
+        self.ended.callback(None)
+
+    def signal(self, signal_name):
+        if signal_name in ('TERM', 'KILL'):
+            self.terminating = True
+        try:
+            self.transport.signalProcess(signal_name)
+        except Exception:   # ProcessExitedAlready
+            pass
+
+
+class WorkerSupervisor:
+    """Runs `num_workers` server processes which accept connections of one listening socket.
+
+    The socket is created by the supervisor and inherited by the workers(pre-fork), so the workers share the port
+    and the kernel distributes connections among them. Each worker writes a heartbeat every second:
+    a worker without heartbeats for `heartbeat_timeout` seconds(e.g. a blocked reactor) is killed,
+    and workers which exited are started again.
+    `restart()`(SIGHUP) starts new workers and stops each old worker when a new one is ready, without downtime.
+    """
+    min_restart_delay = 1.0
+    max_restart_delay = 30.0
+
+    def __init__(self, port, num_workers, worker_args, interface='', heartbeat_timeout=30.0, backlog=128,
+                 reactor=None):
+        self.port = port
+        self.num_workers = num_workers
+        self.worker_args = worker_args
+        self.interface = interface
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backlog = backlog
+        self.reactor = reactor or default_reactor
+        self.listening_socket = None
+        self.workers = set()
+        self.generation = 0
+        self.restart_delay = self.min_restart_delay
+        self.stopping = False
+        self.health_check = LoopingCall(self.check_health)
+        self.health_check.clock = self.reactor
+
+    def start(self):
+        self.listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listening_socket.bind((self.interface, self.port))
+        self.listening_socket.listen(self.backlog)
+        self.listening_socket.setblocking(False)
+        for _ in range(self.num_workers):
+            self.spawn()
+        self.health_check.start(1.0, now=False)
+
+    def spawn(self):
+        worker = WorkerProtocol(self, self.generation)
+        args = [sys.executable, '-u', '-m', 'simplog.apiserver'] + self.worker_args + [
+            '--worker-fd', str(LISTEN_FD), '--heartbeat-fd', str(HEARTBEAT_FD),
+        ]
+        self.reactor.spawnProcess(worker, sys.executable, args, env=os.environ.copy(), childFDs={
+            0: 0, 1: 1, 2: 2,
+            LISTEN_FD: self.listening_socket.fileno(),
+            HEARTBEAT_FD: 'r',
+        })
+        self.workers.add(worker)
+        return worker
+
+    def restart(self):
+        """Replaces all workers with new ones, e.g. to apply the updated code."""
+        log.msg('simplog > restarting workers...')
+        self.generation += 1
+        for _ in range(self.num_workers):
+            self.spawn()
+
+    def stop(self):
+        self.stopping = True
+        if self.health_check.running:
+            self.health_check.stop()
+        for worker in self.workers:
+            worker.signal('TERM')
+        d = DeferredList([worker.ended for worker in self.workers]) if self.workers else succeed(None)
+        if self.workers:
+            # workers which do not exit in time are killed
+            kill = self.reactor.callLater(self.heartbeat_timeout, self._kill_all)
+            d.addBoth(lambda result: kill.active() and kill.cancel())
+        if self.listening_socket is not None:
+            d.addBoth(lambda _: self.listening_socket.close())
+        return d
+
+    def _kill_all(self):
+        for worker in self.workers:
+            worker.signal('KILL')
+
+    def check_health(self):
+        now = self.reactor.seconds()
+        for worker in list(self.workers):
+            if now - worker.last_heartbeat > self.heartbeat_timeout:
+                log.msg(f'simplog > worker {worker.pid} has no heartbeat for {now - worker.last_heartbeat:.1f}s, kill')
+                worker.signal('KILL')
+
+    def worker_ready(self, worker):
+        log.msg(f'simplog > worker {worker.pid} is ready')
+        if worker.generation == self.generation:
+            # a new worker is ready, stop an old one
+            old_workers = [w for w in self.workers if w.generation < self.generation and not w.terminating]
+            if old_workers:
+                old_workers[0].signal('TERM')
+
+    def worker_ended(self, worker, reason):
+        self.workers.discard(worker)
+        if self.stopping or worker.generation != self.generation:
+            return
+        log.msg(f'simplog > worker {worker.pid} exited: {reason.value}')
+        # a worker which exits soon after it started is likely to exit again, start it later
+        if self.reactor.seconds() - worker.started < self.max_restart_delay:
+            self.restart_delay = min(self.restart_delay * 2, self.max_restart_delay)
+        else:
+            self.restart_delay = self.min_restart_delay
+        self.reactor.callLater(self.restart_delay, self._respawn)
+
+    def _respawn(self):
+        current_workers = [w for w in self.workers if w.generation == self.generation]
+        if not self.stopping and len(current_workers) < self.num_workers:
+            self.spawn()
+
+
+def install_signal_handlers(supervisor, reactor=None):
+    reactor = reactor or default_reactor
+    signal.signal(signal.SIGHUP, lambda *_: reactor.callFromThread(supervisor.restart))
+
+
+def start_heartbeat(fd, interval=1.0, reactor=None):
+    """Writes heartbeats to the supervisor from a worker process, and stops the worker if the supervisor is gone."""
+    reactor = reactor or default_reactor
+    heartbeat = LoopingCall(os.write, fd, _heartbeat)
+    heartbeat.clock = reactor
+    heartbeat.start(interval).addErrback(lambda failure: reactor.stop())
+    return heartbeat